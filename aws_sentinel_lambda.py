@@ -1,25 +1,52 @@
 import json
-import boto3
 import os
-import urllib.request
-import urllib.error
+import time
 from datetime import datetime
 from botocore.exceptions import ClientError
+import sentinel_aws as aws
+import sentinel_telemetry as telemetry
+from sentinel_cache import verdict_cache
+from sentinel_governor import governor
+from sentinel_llm import get_client as get_llm_client, LLMThrottled
+from sentinel_payload import minimize, to_prompt_json
+from sentinel_rules import rule_engine
+from sentinel_store import index_fields
+from sentinel_findings import finding_key, put_finding
+from sentinel_lease import lease_manager
+from sentinel_s3_purge import purge_bucket
+from sentinel_sg_index import index_for
+from sentinel_sg_rules import parse_cloudtrail_ip_permissions, plan_revocation, revoke_rules, rules_from_cloudtrail
 
 # --- CONFIGURAÇÕES ---
 DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'SentinelMonitor')
-GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', '')
+# Modo batch (SQS): recursos que a IA precisa julgar vão juntos em poucas requisições
+LLM_BATCH = os.environ.get('SENTINEL_LLM_BATCH', '0') == '1'
+# Folga (s) antes do timeout da Lambda para gravar checkpoint, achado e contadores depois da remediação
+LAMBDA_SAFETY_MARGIN = float(os.environ.get('SENTINEL_LAMBDA_SAFETY_MARGIN', '30'))
 
-# Clientes AWS
-ec2_client = boto3.client('ec2')
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(DYNAMODB_TABLE)
+# Clientes AWS: criados no primeiro uso (eventos IAM/RDS não pagam EC2/S3 no cold start)
+# e reaproveitados entre invocações quentes
+# `region` é usado pela varredura multi-região; None = região padrão do runtime
+def ec2_client(region=None):
+    return aws.client('ec2', region)
 
-def get_sg_config(group_id):
+def s3_client(region=None):
+    return aws.client('s3', region)
+
+def get_table():
+    return aws.table(DYNAMODB_TABLE)
+
+def invocation_deadline(context, margin=LAMBDA_SAFETY_MARGIN):
+    """Instante (epoch) em que esta invocação precisa parar de trabalhar. None fora da Lambda."""
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    return time.time() + context.get_remaining_time_in_millis() / 1000 - margin
+
+def get_sg_config(group_id, region=None, fresh=True):
+    # Describe do grupo auditado (estado real, não o snapshot do container); o índice de exposição é atualizado junto.
+    # `fresh=False` só para a varredura, que enumera a partir de um snapshot recém-carregado da região
     try:
-        response = ec2_client.describe_security_groups(GroupIds=[group_id])
-        return response['SecurityGroups'][0]
+        return index_for(region).lookup(ec2_client(region), group_id, fresh)
     except ClientError as e:
         if e.response['Error']['Code'] == 'InvalidGroup.NotFound':
             return None
@@ -27,12 +54,12 @@ def get_sg_config(group_id):
     except Exception as e:
         return {"id": group_id, "info": f"Erro desconhecido: {e}"}
 
-def get_s3_config(bucket_name):
+def get_s3_config(bucket_name, region=None):
     config = {"bucketName": bucket_name}
     try:
         # Verifica se o bucket existe primeiro
-        s3_client.head_bucket(Bucket=bucket_name)
-        policy = s3_client.get_bucket_policy(Bucket=bucket_name)
+        s3_client(region).head_bucket(Bucket=bucket_name)
+        policy = s3_client(region).get_bucket_policy(Bucket=bucket_name)
         config['policy'] = json.loads(policy['Policy'])
     except ClientError as e:
         error_code = e.response['Error']['Code']
@@ -45,7 +72,8 @@ def get_s3_config(bucket_name):
 
 def ask_gemini(resource_data):
     """Envia qualquer JSON para o Gemini analisar"""
-    if not GOOGLE_API_KEY:
+    llm = get_llm_client()
+    if not llm.configured:
         return {"status": "ERRO", "risco": "Sem API Key"}
 
     prompt = f"""
@@ -53,7 +81,7 @@ def ask_gemini(resource_data):
     Identifique riscos baseados em princípios de Menor Privilégio e Melhores Práticas (CIS/AWS).
     
     JSON PARA ANÁLISE:
-    {json.dumps(resource_data)}
+    {to_prompt_json(minimize(resource_data))}
 
     Responda ESTRITAMENTE em formato JSON (sem markdown):
     {{
@@ -65,45 +93,64 @@ def ask_gemini(resource_data):
     }}
     """
     
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}"
-    body = {"contents": [{"parts": [{"text": prompt}]}]}
-    
     try:
-        req = urllib.request.Request(url, data=json.dumps(body).encode('utf-8'), headers={"Content-Type": "application/json"}, method='POST')
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode())
-            text = result['candidates'][0]['content']['parts'][0]['text']
-            text = text.replace("```json", "").replace("```", "").strip()
-            return json.loads(text)
+        return llm.generate_json(prompt)
+    except LLMThrottled as e:
+        # Sem cota agora: a invocação falha e o evento volta (retry do EventBridge / fila SQS),
+        # em vez de virar um ERRO_IA de gravidade BAIXA para um recurso possivelmente vulnerável
+        print(f"⏸️ Análise adiada: {e}")
+        raise
     except Exception as e:
         print(f"Erro Gemini: {e}")
         return {"status": "ERRO_IA", "risco": "Falha na análise", "gravidade": "BAIXA"}
 
+def ask_gemini_batch(resources):
+    """Versão em lote do ask_gemini: {chave: JSON} -> {chave: veredito}, vários recursos por requisição"""
+    llm = get_llm_client()
+    if not llm.configured:
+        return {key: {"status": "ERRO", "risco": "Sem API Key"} for key in resources}
+
+    def build_prompt(batch):
+        return f"""
+    Atue como Auditor DevSecOps Sênior. Analise CADA um dos {len(batch)} JSONs de infraestrutura AWS abaixo, de forma independente.
+    Identifique riscos baseados em princípios de Menor Privilégio e Melhores Práticas (CIS/AWS).
+
+    LOTE (objeto "id" -> JSON PARA ANÁLISE):
+    {to_prompt_json(batch)}
+
+    Responda ESTRITAMENTE com um array JSON (sem markdown), com exatamente um objeto por id:
+    [
+        {{
+            "id": "id do recurso, exatamente como recebido",
+            "status": "SEGURO" ou "VULNERAVEL",
+            "risco": "Explicação curta do risco",
+            "gravidade": "ALTA, MEDIA ou BAIXA",
+            "detalhe": "Detalhe técnico",
+            "auto_correcao": "Sugestão de correção"
+        }}
+    ]
+    """
+
+    # Payloads já reduzidos antes do empacotamento: o orçamento de tokens do lote conta o que vai no prompt
+    results, errors = llm.generate_batch({key: minimize(data) for key, data in resources.items()}, build_prompt)
+    for key, e in errors.items():
+        if isinstance(e, LLMThrottled):
+            # Fica sem veredito: quem chamou adia esse recurso (auditoria individual ou próxima varredura)
+            print(f"⏸️ Análise de {key} adiada: {e}")
+            continue
+        print(f"Erro Gemini ({key}): {e}")
+        results[key] = {"status": "ERRO_IA", "risco": "Falha na análise", "gravidade": "BAIXA"}
+    return results
+
 # --- FUNÇÕES DE AUTO-REMEDIAÇÃO ---
 
-def auto_remediate_s3(bucket_name):
-    """Limpa e deleta um bucket S3 vulnerável."""
+def auto_remediate_s3(bucket_name, region=None, deadline=None):
+    """Bloqueia o acesso público, limpa e deleta um bucket S3 vulnerável.
+    `deadline`: limite da invocação (ver invocation_deadline); o que não couber fica para a retomada."""
     print(f"🛠️ [AUTO-REMEDIAÇÃO] Iniciando exclusão do bucket comprometido: {bucket_name}")
     try:
-        # Para deletar um bucket, ele precisa estar vazio.
-        # Paginação para deletar todos os objetos
-        paginator = s3_client.get_paginator('list_object_versions')
-        for page in paginator.paginate(Bucket=bucket_name):
-            delete_keys = []
-            for version in page.get('Versions', []):
-                delete_keys.append({'Key': version['Key'], 'VersionId': version['VersionId']})
-            for marker in page.get('DeleteMarkers', []):
-                delete_keys.append({'Key': marker['Key'], 'VersionId': marker['VersionId']})
-                
-            if delete_keys:
-                s3_client.delete_objects(Bucket=bucket_name, Delete={'Objects': delete_keys})
-                print(f"   Limpados {len(delete_keys)} objetos/versões.")
-
-        # Deletar o bucket em si
-        s3_client.delete_bucket(Bucket=bucket_name)
-        msg = f"Bucket {bucket_name} e todo seu conteúdo foram excluídos com sucesso."
-        print(f"✅ {msg}")
-        return {"status": "SUCESSO", "acao": "Exclusão de Bucket S3", "detalhe": msg}
+        # Bloqueio imediato + exclusão paralela com checkpoint (retomável) e fallback de lifecycle
+        return purge_bucket(s3_client(region), bucket_name, deadline=deadline)
         
     except ClientError as e:
         if e.response['Error']['Code'] in ('NoSuchBucket', '404'):
@@ -114,82 +161,74 @@ def auto_remediate_s3(bucket_name):
         print(f"❌ {msg}")
         return {"status": "FALHO", "acao": "Tentativa de exclusão de Bucket S3", "detalhe": msg}
 
-def parse_cloudtrail_ip_permissions(cloudtrail_items):
-    """Converte do formato camelCase do CloudTrail para o PascalCase exigido pelo Boto3."""
-    boto3_perms = []
-    for item in cloudtrail_items:
-        perm = {}
-        if 'ipProtocol' in item: perm['IpProtocol'] = item['ipProtocol']
-        if 'fromPort' in item: perm['FromPort'] = item['fromPort']
-        if 'toPort' in item: perm['ToPort'] = item['toPort']
-        
-        # Ranges IPv4
-        if 'ipRanges' in item and 'items' in item['ipRanges']:
-            perm['IpRanges'] = [{'CidrIp': r['cidrIp']} for r in item['ipRanges']['items'] if 'cidrIp' in r]
-            
-        # Ranges IPv6
-        if 'ipv6Ranges' in item and 'items' in item['ipv6Ranges']:
-            perm['Ipv6Ranges'] = [{'CidrIpv6': r['cidrIpv6']} for r in item['ipv6Ranges']['items'] if 'cidrIpv6' in r]
-            
-        # Grupos de Segurança
-        if 'groups' in item and 'items' in item['groups']:
-            perm['UserIdGroupPairs'] = [{'GroupId': g['groupId']} for g in item['groups']['items'] if 'groupId' in g]
-            
-        boto3_perms.append(perm)
-    return boto3_perms
-
-def auto_remediate_ec2(group_id, event_detail):
-    """Reverte a regra adicionada causou a vulnerabilidade, ou limpa acessos irrestritos globais em caso de falha de identificação."""
+def auto_remediate_ec2(group_id, event_detail, region=None, collected=False):
+    """Reverte a regra adicionada causou a vulnerabilidade, ou limpa acessos irrestritos globais em caso de falha de identificação.
+    `collected=True` quando a coleta desta auditoria já fez o describe do grupo (get_sg_config): o índice está em dia."""
     print(f"🛠️ [AUTO-REMEDIAÇÃO] Investigando Security Group: {group_id}")
+    index = index_for(region)
+    ec2 = ec2_client(region)
     try:
-        # Pega a regra exata que foi adicionada a partir do evento do CloudTrail
+        # Pega as regras exatas que foram adicionadas a partir do evento do CloudTrail
         request_params = event_detail.get('requestParameters', {})
-        ip_permissions_camel = request_params.get('ipPermissions', {}).get('items', [])
-        
-        regras_para_remover = []
-        if ip_permissions_camel:
-            # Converte as regras do evento para o formato que o Boto3 aceita
-            regras_para_remover = parse_cloudtrail_ip_permissions(ip_permissions_camel)
+        regras_evento = rules_from_cloudtrail(request_params.get('ipPermissions', {}).get('items', []))
+
+        # Estado real do grupo: sem a coleta desta auditoria (ex: varredura, que parte de um snapshot),
+        # um describe, pois o índice deste container pode não ter visto regras de outros containers
+        present = index.get(group_id) is not None if collected else index.refresh_group(ec2, group_id)
+        if not present:
+            msg = "Grupo de Segurança já havia sido excluído em evento paralelo."
+            return {"status": "IGNORAR", "acao": "Revogação Inbound", "detalhe": msg}
+
+        if regras_evento:
+            # Diff com o estado atual do grupo: só revoga o que o evento adicionou e ainda existe
+            plano = plan_revocation(regras_evento, index.rules_for(group_id))
+            regras_para_remover = plano.revoke
+            if not regras_para_remover:
+                msg = f"As {len(regras_evento)} regra(s) do evento já haviam sido revogadas."
+                print(f"ℹ️ {msg}")
+                return {"status": "IGNORAR", "acao": "Revogação Inbound", "detalhe": msg}
         else:
             # FALLBACK: Se o evento for apenas CreateSecurityGroup (sem payload de regra),
-            # mas a IA viu a regra no estado Boto3, nós varremos e usamos as regras de 0.0.0.0/0
-            sg_info = get_sg_config(group_id)
-            if sg_info and "IpPermissions" in sg_info:
-                for perm in sg_info['IpPermissions']:
-                    if not isinstance(perm, dict): continue
-                    for ip_range in perm.get('IpRanges', []):
-                        if isinstance(ip_range, dict) and ip_range.get('CidrIp') == '0.0.0.0/0':
-                            if perm not in regras_para_remover: regras_para_remover.append(perm)
-                    for ipv6_range in perm.get('Ipv6Ranges', []):
-                        if isinstance(ipv6_range, dict) and ipv6_range.get('CidrIpv6') == '::/0':
-                            if perm not in regras_para_remover: regras_para_remover.append(perm)
-                            
+            # mas a IA viu a regra no estado Boto3, usamos as regras 0.0.0.0/0 e ::/0 do índice
+            plano = None
+            regras_para_remover = index.public_rules(group_id)
+
         if not regras_para_remover:
             msg = "Não foi possível identificar a regra exata no evento e não há regras 0.0.0.0/0 para limpar."
             print(f"⚠️ {msg}")
             return {"status": "PARCIAL", "acao": "Revogação de SG ignorada", "detalhe": msg}
-            
-        # Revoga as regras perigosas
-        ec2_client.revoke_security_group_ingress(
-            GroupId=group_id,
-            IpPermissions=regras_para_remover
-        )
-        msg_extra = ""
-        # Verifica se o grupo ficou vazio e o deleta
+
+        # Revoga as regras perigosas em lotes (um lote com erro não derruba os outros)
+        resultado = revoke_rules(ec2, group_id, regras_para_remover)
+        index.revoke(group_id, resultado.removed)
+        ja_revogadas = len(resultado.missing) + (len(plano.already_gone) if plano else 0)
+
+        if resultado.failed:
+            exemplo = next(iter(resultado.failed.values()))
+            msg = (f"Revogadas {len(resultado.revoked)} de {len(regras_para_remover)} regra(s); "
+                   f"{len(resultado.failed)} falharam (ex: {exemplo}).")
+            print(f"❌ {msg}")
+            status = "PARCIAL" if resultado.revoked else "FALHO"
+            return {"status": status, "acao": "Revogação de Regra Inbound", "detalhe": msg}
+
+        msg_extra = f" {ja_revogadas} já haviam sido revogadas." if ja_revogadas else ""
+        # Exclusão é irreversível: confirma com um describe que o grupo ficou vazio de regras inbound
         try:
-            sg_info = get_sg_config(group_id)
-            if sg_info and not sg_info.get('IpPermissions') and group_id != 'default':
-                ec2_client.delete_security_group(GroupId=group_id)
-                msg_extra = " O Security Group ficou vazio de regras inbound e foi excluído."
+            if (index.refresh_group(ec2, group_id) and index.ingress_count(group_id) == 0
+                    and not index.is_default(group_id)):
+                ec2.delete_security_group(GroupId=group_id)
+                index.remove(group_id)
+                msg_extra += " O Security Group ficou vazio de regras inbound e foi excluído."
         except Exception as e:
             print(f"Aviso: Não foi possível excluir grupo potencialmente vazio: {e}")
-            
-        msg = f"Foram revogadas {len(regras_para_remover)} regra(s).{msg_extra}"
+
+        msg = f"Foram revogadas {len(resultado.revoked)} regra(s).{msg_extra}"
         print(f"✅ {msg}")
         return {"status": "SUCESSO", "acao": "Revogação de Regra Inbound", "detalhe": msg}
 
     except ClientError as e:
         if e.response['Error']['Code'] == 'InvalidGroup.NotFound':
+            index.remove(group_id)
             msg = "Grupo de Segurança já havia sido excluído em evento paralelo."
             return {"status": "IGNORAR", "acao": "Revogação Inbound", "detalhe": msg}
             
@@ -201,9 +240,27 @@ def auto_remediate_ec2(group_id, event_detail):
         print(f"❌ {msg}")
         return {"status": "FALHO", "acao": "Processamento de regras", "detalhe": msg}
 
-def lambda_handler(event, context):
-    print("🛡️ SENTINEL AI: Iniciando Auditoria Universal...")
-    
+def build_finding_item(tipo, resource_id, analysis, remediation_result, source_id=None, content=None):
+    """Monta o item com TUDO o que o Dashboard espera ver para um recurso vulnerável.
+    `source_id` (eventID do CloudTrail) torna a chave determinística: reentregas caem na mesma chave.
+    Sem eventID, o hash de `content` (o detalhe do evento) faz o mesmo papel."""
+    now = datetime.now()
+    return {
+        'id_recurso': finding_key(resource_id, source_id, content),
+        'data_evento': str(now),
+        'tipo': tipo,
+        'status_ia': 'VULNERAVEL',
+        'risco': analysis.get('risco', 'Risco não especificado'),
+        'gravidade': analysis.get('gravidade', 'MEDIA'),
+        'detalhe': analysis.get('detalhe', 'Sem detalhes técnicos'),
+        'auto_correcao': remediation_result,
+        'json_analise': json.dumps({"analise_ia": analysis, "resultado_remediacao": remediation_result}),
+        # Atributos dos GSIs consultados pelo Dashboard
+        **index_fields(tipo, str(now))
+    }
+
+def extract_event_info(event):
+    """Extrai serviço, nome do evento, ID do recurso e detalhe CloudTrail de um evento EventBridge."""
     detail = event.get('detail', {})
     event_source = detail.get('eventSource', '').split('.')[0].upper() # Ex: RDS, IAM, S3
     event_name = detail.get('eventName', '')
@@ -228,18 +285,83 @@ def lambda_handler(event, context):
                 resource_id = combined[key]
                 break
 
-    print(f"🔍 Evento: {event_source}:{event_name} | Recurso: {resource_id}")
+    return event_source, event_name, resource_id, detail
 
-    # --- 2. COLETA DE DADOS (HÍBRIDA) ---
+def lambda_handler(event, context):
+    print("🛡️ SENTINEL AI: Iniciando Auditoria Universal...")
+    event_source, event_name, resource_id, detail = extract_event_info(event)
+    try:
+        return audit_resource(event_source, event_name, resource_id, detail, deadline=invocation_deadline(context))
+    finally:
+        log_reports()
+
+def log_reports():
+    """Uma linha por invocação com os acumulados do container (cache, motor de regras, governador).
+    O detalhe por recurso já sai na linha EMF de cada auditoria."""
+    print(f"📊 Relatórios: {json.dumps({'cache': verdict_cache.report(), 'regras': rule_engine.report(), 'governador': governor.report()})}")
+
+def audit_resource(event_source, event_name, resource_id, detail, prefetched=None, deadline=None):
+    """Coleta o estado atual, analisa, remedia e persiste um único recurso.
+
+    `prefetched=(dados, veredito)` pula coleta e análise (usado pelo modo batch com LLM em lote).
+    `deadline` (epoch) limita a remediação longa (purga de bucket) ao tempo restante da invocação.
+    S3 e SG são auditados sob um lease por recurso: eventos que chegam durante a auditoria de outra
+    invocação são anexados a ela e viram uma única re-auditoria no fim.
+    """
+    # Uma linha de métricas (CloudWatch EMF) por recurso auditado, com o tempo de cada estágio
+    with telemetry.invocation('audit_resource', Servico=event_source):
+        telemetry.set_property('evento', event_name)
+        telemetry.set_property('recurso', resource_id)
+        rule_type = rule_type_for(event_source, event_name)
+        if rule_type is None or resource_id == "Desconhecido":
+            return _audit_resource(event_source, event_name, resource_id, detail, prefetched, deadline)
+
+        def audit(extra_events):
+            if not extra_events:
+                return _audit_resource(event_source, event_name, resource_id, detail, prefetched, deadline)
+            # Re-auditoria: estado atual do recurso + só as regras dos eventos que chegaram depois
+            details = [json.loads(e) for e in extra_events]
+            merged = _merge_sg_details(details) if rule_type == 'SG' else details[-1]
+            return _audit_resource(event_source, merged.get('eventName', event_name), resource_id, merged,
+                                   deadline=deadline)
+
+        result = lease_manager.run(f"{rule_type}:{resource_id}", lease_event(detail), audit)
+        if result is None:
+            telemetry.set_property('veredito', 'ADIADO')
+            return {"statusCode": 200, "body": f"Auditoria de {resource_id} já em andamento; evento anexado a ela."}
+        return result
+
+def lease_event(detail):
+    """Resumo do evento guardado no lease para a re-auditoria (o que a remediação usa)."""
+    return json.dumps({k: detail.get(k) for k in ('eventID', 'eventName', 'requestParameters')}, default=str)
+
+def collect_resource(event_source, event_name, resource_id, detail):
+    """Estado atual do recurso para análise. None se o recurso não existe mais."""
     # Se conhecemos o serviço, buscamos dados extras. Se não, mandamos o log do evento.
     if event_source == 'S3' and resource_id != "Desconhecido":
-        data_to_analyze = get_s3_config(resource_id)
-    elif event_source == 'EC2' and 'SecurityGroup' in event_name:
-        data_to_analyze = get_sg_config(resource_id)
+        return get_s3_config(resource_id)
+    if event_source == 'EC2' and 'SecurityGroup' in event_name:
+        # O próprio evento mantém o índice atualizado entre recargas
+        index_for().apply_event(detail)
+        return get_sg_config(resource_id)
+    # LOG GENÉRICO: Manda o detalhe do evento para a IA extrair o erro
+    print(f"⚠️ Serviço {event_source} não possui coletor específico. Enviando log bruto.")
+    return detail
+
+def rule_type_for(event_source, event_name):
+    return 'S3' if event_source == 'S3' else 'SG' if event_source == 'EC2' and 'SecurityGroup' in event_name else None
+
+def _audit_resource(event_source, event_name, resource_id, detail, prefetched=None, deadline=None):
+    print(f"🔍 Evento: {event_source}:{event_name} | Recurso: {resource_id}")
+
+    # --- 2. COLETA DE DADOS (HÍBRIDA) ---
+    # No modo batch com LLM em lote, coleta e veredito já vêm prontos em `prefetched`
+    if prefetched:
+        data_to_analyze, analysis = prefetched
     else:
-        # LOG GENÉRICO: Manda o detalhe do evento para a IA extrair o erro
-        print(f"⚠️ Serviço {event_source} não possui coletor específico. Enviando log bruto.")
-        data_to_analyze = detail
+        with telemetry.stage('coleta'):
+            data_to_analyze = collect_resource(event_source, event_name, resource_id, detail)
+        analysis = None
 
     if data_to_analyze is None:
         msg = f"🛑 Recurso {resource_id} não encontrado (já deletado). Abortando auditoria."
@@ -247,25 +369,39 @@ def lambda_handler(event, context):
         return {"statusCode": 200, "body": msg}
 
 # --- 3. ANÁLISE E PERSISTÊNCIA ---
-    analysis = ask_gemini(data_to_analyze)
+    if analysis is None:
+        # Fast path: casos óbvios (0.0.0.0/0 em porta admin, Principal "*") são decididos localmente
+        rule_type = rule_type_for(event_source, event_name)
+        with telemetry.stage('regras'):
+            analysis = rule_engine.evaluate(rule_type, data_to_analyze) if rule_type else None
+    if analysis is None:
+        # Configs já julgadas (re-apply, re-deploy) voltam do cache sem chamar o Gemini
+        with telemetry.stage('analise'):
+            analysis = verdict_cache.get_or_compute('lambda', data_to_analyze, ask_gemini)
+    telemetry.set_property('veredito', analysis.get('status'))
+    telemetry.set_property('origem', analysis.get('origem', 'ia'))  # 'ia' = cache ou LLM (ver métricas cache_*)
     
     # Adicionamos logs para você ver no console da AWS o que a IA pensou
     print(f"🧠 ANÁLISE COMPLETA DA IA: {json.dumps(analysis, indent=2)}")
     
     remediation_result = "Monitoramento ativo."
+    remediation_status = None
     
     if analysis.get('status') == 'VULNERAVEL':
         print("🚨 VULNERABILIDADE DETECTADA! Iniciando Auto-Remediação...")
         
         # --- A AÇÃO DE AUTO-REMEDIAÇÃO ACONTECE AQUI ---
         if event_source == 'S3':
-            rem_resp = auto_remediate_s3(resource_id)
+            with telemetry.stage('remediacao'):
+                rem_resp = auto_remediate_s3(resource_id, deadline=deadline)
             if rem_resp.get("status") == "IGNORAR":
                 print(f"🛑 Cancelando gravação no DynamoDB: {rem_resp.get('detalhe')}")
                 return {"statusCode": 200, "body": rem_resp.get('detalhe')}
+            remediation_status = rem_resp.get("status")
             remediation_result = f"Remediado: {rem_resp['detalhe']}"
         elif event_source == 'EC2' and 'SecurityGroup' in event_name:
-            rem_resp = auto_remediate_ec2(resource_id, detail)
+            with telemetry.stage('remediacao'):
+                rem_resp = auto_remediate_ec2(resource_id, detail, collected=True)
             if rem_resp.get("status") == "IGNORAR":
                 print(f"🛑 Cancelando gravação no DynamoDB: {rem_resp.get('detalhe')}")
                 return {"statusCode": 200, "body": rem_resp.get('detalhe')}
@@ -274,21 +410,13 @@ def lambda_handler(event, context):
             remediation_result = "Nenhum script de remediação para esse serviço. Ação manual necessária."
         
         try:
-            # Montamos o item com TUDO o que o Dashboard espera ver
-            item = {
-                'id_recurso': f"{resource_id}-{datetime.now().strftime('%H%M%S')}",
-                'data_evento': str(datetime.now()),
-                'tipo': event_source if event_source != 'EC2' else 'SG',
-                'status_ia': 'VULNERAVEL',
-                'risco': analysis.get('risco', 'Risco não especificado'),
-                'gravidade': analysis.get('gravidade', 'MEDIA'),
-                'detalhe': analysis.get('detalhe', 'Sem detalhes técnicos'),
-                'auto_correcao': remediation_result,
-                'json_analise': json.dumps({"analise_ia": analysis, "resultado_remediacao": remediation_result})
-            }
-            
-            table.put_item(Item=item)
-            print("✅ Gravado com sucesso no DynamoDB.")
+            item = build_finding_item(event_source if event_source != 'EC2' else 'SG', resource_id, analysis,
+                                      remediation_result, detail.get('eventID'), detail)
+
+            with telemetry.stage('persistencia'):
+                # Gravação condicional: evento reentregue não duplica a linha nem os KPIs do Dashboard
+                if put_finding(get_table(), item):
+                    print("✅ Gravado com sucesso no DynamoDB.")
             
         except Exception as e:
             print(f"❌ Erro ao gravar no DynamoDB: {e}")
@@ -299,6 +427,123 @@ def lambda_handler(event, context):
         "body": {
             "recurso_auditado": resource_id,
             "veredito_ia": analysis.get('status'),
-            "resumo_critico": analysis # Retorna o JSON completo da análise aqui
+            "resumo_critico": analysis, # Retorna o JSON completo da análise aqui
+            "cache": verdict_cache.report(),
+            "regras": rule_engine.report(),
+            # Purga de bucket interrompida: o modo batch devolve o record à fila para retomar do checkpoint
+            "remediacao_pendente": remediation_status == "PARCIAL"
         }
-    }
\ No newline at end of file
+    }
+
+# --- MODO BATCH (SQS) ---
+
+def _record_event(record):
+    """O body de um record SQS é o evento EventBridge serializado. Aceita também o evento já em dict."""
+    if 'detail' in record:
+        return record
+    return json.loads(record['body'])
+
+def _merge_sg_details(details):
+    """Une as regras de todos os eventos de um mesmo SG para que a remediação revogue tudo de uma vez."""
+    merged = dict(details[-1])
+    items = []
+    for d in details:
+        items.extend((d.get('requestParameters') or {}).get('ipPermissions', {}).get('items', []))
+    merged['requestParameters'] = {**(merged.get('requestParameters') or {}), 'ipPermissions': {'items': items}}
+    return merged
+
+def _prefetch_verdicts(audits):
+    """Coleta + regras de cada recurso, e uma análise em lote para os que sobrarem para a IA.
+    Retorna {grupo: (dados, veredito)}. Recursos com falha de coleta ficam de fora (seguem o fluxo normal)."""
+    prefetched, pending = {}, {}
+    with telemetry.invocation('batch_prefetch'):
+        for key, (event_source, event_name, resource_id, detail) in audits.items():
+            try:
+                with telemetry.stage('coleta'):
+                    data = collect_resource(event_source, event_name, resource_id, detail)
+            except Exception as e:
+                print(f"⚠️ Coleta de {key} falhou ({e}); será auditado individualmente.")
+                continue
+            if data is None:
+                prefetched[key] = (None, None)
+                continue
+            rule_type = rule_type_for(event_source, event_name)
+            with telemetry.stage('regras'):
+                analysis = rule_engine.evaluate(rule_type, data) if rule_type else None
+            if analysis is not None:
+                prefetched[key] = (data, analysis)
+            else:
+                pending[':'.join(key)] = (key, data)
+
+        if pending:
+            print(f"🧠 {len(pending)} recurso(s) enviados à IA em lote.")
+            with telemetry.stage('analise'):
+                verdicts = verdict_cache.get_or_compute_many(
+                    'lambda', {name: data for name, (_, data) in pending.items()}, ask_gemini_batch,
+                )
+            for name, (key, data) in pending.items():
+                # Veredito None (análise adiada por cota): a auditoria do grupo tenta a IA de novo e,
+                # se continuar sem cota, falha e devolve os records à fila
+                prefetched[key] = (data, verdicts[name])
+    return prefetched
+
+def batch_handler(event, context):
+    """Entrada para lotes SQS de eventos CloudTrail. Agrupa por recurso e audita cada recurso uma única vez.
+
+    Retorna `batchItemFailures` (ReportBatchItemFailures) para que só os records com falha voltem para a fila.
+    """
+    records = event.get('Records', [])
+    print(f"🛡️ SENTINEL AI: Iniciando Auditoria em Lote ({len(records)} eventos)...")
+
+    failures = []
+    groups = {}
+    for record in records:
+        message_id = record.get('messageId')
+        try:
+            event_source, event_name, resource_id, detail = extract_event_info(_record_event(record))
+        except Exception as e:
+            print(f"❌ Record {message_id} inválido: {e}")
+            failures.append({"itemIdentifier": message_id})
+            continue
+
+        # Só coalescemos recursos com coletor de estado (S3/SG). Logs genéricos são auditados um a um.
+        if resource_id != "Desconhecido" and event_source == 'S3':
+            key = ('S3', resource_id)
+        elif resource_id != "Desconhecido" and event_source == 'EC2' and 'SecurityGroup' in event_name:
+            key = ('SG', resource_id)
+        else:
+            key = ('EVENTO', message_id)
+        group = groups.setdefault(key, {"message_ids": [], "events": []})
+        group["message_ids"].append(message_id)
+        group["events"].append((event_source, event_name, resource_id, detail))
+
+    audits = {}
+    for (kind, resource_key), group in groups.items():
+        event_source, event_name, resource_id, detail = group["events"][-1]
+        if kind == 'SG':
+            # Um único describe + uma única revogação cobrindo as regras de todos os eventos do grupo
+            detail = _merge_sg_details([e[3] for e in group["events"]])
+        if len(group["events"]) > 1:
+            print(f"🧩 {len(group['events'])} eventos coalescidos para {kind}:{resource_id}")
+        audits[(kind, resource_key)] = (event_source, event_name, resource_id, detail)
+
+    prefetched = _prefetch_verdicts(audits) if LLM_BATCH else {}
+    # Um único limite para o lote inteiro: a purga de um bucket não consome o tempo dos recursos seguintes além dele
+    deadline = invocation_deadline(context)
+
+    for (kind, resource_key), group in groups.items():
+        event_source, event_name, resource_id, detail = audits[(kind, resource_key)]
+        try:
+            result = audit_resource(event_source, event_name, resource_id, detail,
+                                    prefetched.get((kind, resource_key)), deadline)
+            body = result.get('body')
+            if isinstance(body, dict) and body.get('remediacao_pendente'):
+                print(f"⏸️ Remediação de {kind}:{resource_id} incompleta; records devolvidos à fila para retomada.")
+                failures.extend({"itemIdentifier": mid} for mid in group["message_ids"])
+        except Exception as e:
+            print(f"❌ Falha ao auditar {kind}:{resource_id}: {e}")
+            failures.extend({"itemIdentifier": mid} for mid in group["message_ids"])
+
+    print(f"📦 Lote concluído: {len(records)} eventos, {len(groups)} auditorias, {len(failures)} falhas.")
+    log_reports()
+    return {"batchItemFailures": failures}
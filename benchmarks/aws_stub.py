@@ -0,0 +1,218 @@
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+# Stub HTTP local para EC2, S3 e DynamoDB (apenas as operações que o Sentinel usa).
+# Os clientes boto3 apontam para ele via AWS_ENDPOINT_URL, então o custo de construção dos clientes,
+# assinatura e parsing das respostas é medido de verdade, sem tocar na AWS.
+
+
+class AwsStubState:
+    """Estado em memória dos recursos simulados + contagem de chamadas por serviço/operação."""
+
+    def __init__(self, security_groups=None, buckets=None):
+        self.security_groups = security_groups or {}  # group_id -> [IpPermissions no formato Boto3]
+        self.buckets = buckets or {}                  # bucket -> policy (dict) ou None
+        self.items = {}                               # (tabela, chave) -> item DynamoDB (formato wire)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, service, operation):
+        with self._lock:
+            self.calls[f"{service}:{operation}"] += 1
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+
+# --- EC2 (protocolo query/XML) ---
+
+def _perm_xml(perm):
+    ranges = ''.join(f"<item><cidrIp>{escape(r['CidrIp'])}</cidrIp></item>" for r in perm.get('IpRanges', []))
+    ranges6 = ''.join(f"<item><cidrIpv6>{escape(r['CidrIpv6'])}</cidrIpv6></item>" for r in perm.get('Ipv6Ranges', []))
+    groups = ''.join(f"<item><groupId>{escape(g['GroupId'])}</groupId></item>" for g in perm.get('UserIdGroupPairs', []))
+    ports = ''
+    if 'FromPort' in perm:
+        ports = f"<fromPort>{perm['FromPort']}</fromPort><toPort>{perm['ToPort']}</toPort>"
+    return (f"<item><ipProtocol>{perm['IpProtocol']}</ipProtocol>{ports}<groups>{groups}</groups>"
+            f"<ipRanges>{ranges}</ipRanges><ipv6Ranges>{ranges6}</ipv6Ranges></item>")
+
+
+def _sg_xml(group_id, perms):
+    return (f"<item><ownerId>123456789012</ownerId><groupId>{group_id}</groupId><groupName>{group_id}</groupName>"
+            f"<groupDescription>stub</groupDescription><vpcId>vpc-stub</vpcId>"
+            f"<ipPermissions>{''.join(_perm_xml(p) for p in perms)}</ipPermissions><ipPermissionsEgress/></item>")
+
+
+def _ec2_error(code):
+    return 400, f"<Response><Errors><Error><Code>{code}</Code><Message>{code}</Message></Error></Errors><RequestID>stub</RequestID></Response>"
+
+
+def handle_ec2(state, params):
+    action = params.get('Action', [''])[0]
+    state.count('ec2', action)
+    if action == 'DescribeSecurityGroups':
+        ids = [v[0] for k, v in params.items() if k.startswith('GroupId.')]
+        if ids and any(i not in state.security_groups for i in ids):
+            return _ec2_error('InvalidGroup.NotFound')
+        groups = ids or sorted(state.security_groups)
+        body = ''.join(_sg_xml(g, state.security_groups[g]) for g in groups)
+        return 200, f"<DescribeSecurityGroupsResponse><requestId>stub</requestId><securityGroupInfo>{body}</securityGroupInfo></DescribeSecurityGroupsResponse>"
+    if action == 'RevokeSecurityGroupIngress':
+        group_id = params.get('GroupId', [''])[0]
+        if group_id not in state.security_groups:
+            return _ec2_error('InvalidGroup.NotFound')
+        revoked_ports = {v[0] for k, v in params.items() if k.startswith('IpPermissions.') and k.endswith('.FromPort')}
+        revoked_all = any(v[0] == '-1' for k, v in params.items() if k.endswith('.IpProtocol'))
+        state.security_groups[group_id] = [
+            p for p in state.security_groups[group_id]
+            if not revoked_all and str(p.get('FromPort')) not in revoked_ports
+        ]
+        return 200, "<RevokeSecurityGroupIngressResponse><requestId>stub</requestId><return>true</return></RevokeSecurityGroupIngressResponse>"
+    if action == 'DeleteSecurityGroup':
+        state.security_groups.pop(params.get('GroupId', [''])[0], None)
+        return 200, "<DeleteSecurityGroupResponse><requestId>stub</requestId><return>true</return></DeleteSecurityGroupResponse>"
+    return _ec2_error('UnsupportedOperation')
+
+
+# --- S3 (REST/XML) ---
+
+def _s3_error(status, code):
+    return status, f"<Error><Code>{code}</Code><Message>{code}</Message></Error>"
+
+
+def handle_s3(state, method, path, query):
+    bucket = path.strip('/').split('/')[0]
+    op = next(iter(query), '') if query else ''
+    state.count('s3', f"{method}{'?' + op if op else ''}")
+    if not bucket:
+        names = ''.join(f"<Bucket><Name>{escape(b)}</Name><CreationDate>2024-01-01T00:00:00.000Z</CreationDate></Bucket>"
+                        for b in sorted(state.buckets))
+        return 200, f"<ListAllMyBucketsResult><Buckets>{names}</Buckets></ListAllMyBucketsResult>"
+    if bucket not in state.buckets:
+        return _s3_error(404, 'NoSuchBucket')
+    if method == 'HEAD':
+        return 200, ''
+    if method == 'GET' and op == 'policy':
+        policy = state.buckets[bucket]
+        if policy is None:
+            return _s3_error(404, 'NoSuchBucketPolicy')
+        return 200, json.dumps(policy)
+    if method == 'GET' and op == 'location':
+        # Stub de uma região só: LocationConstraint vazio = us-east-1
+        return 200, "<LocationConstraint/>"
+    if method == 'GET' and op == 'versions':
+        return 200, "<ListVersionsResult><IsTruncated>false</IsTruncated></ListVersionsResult>"
+    if method == 'POST' and op == 'delete':
+        return 200, "<DeleteResult/>"
+    if method == 'PUT':
+        return 200, ''
+    if method == 'DELETE' and not op:
+        del state.buckets[bucket]
+        return 204, ''
+    return _s3_error(400, 'NotImplemented')
+
+
+# --- DynamoDB (JSON 1.0) ---
+
+def _item_key(item):
+    for key in ('id_recurso', 'chave'):
+        if key in item:
+            return next(iter(item[key].values()))
+    return json.dumps(item, sort_keys=True)
+
+
+def handle_dynamodb(state, target, payload):
+    operation = target.split('.')[-1]
+    state.count('dynamodb', operation)
+    table = payload.get('TableName')
+    if operation == 'PutItem':
+        key = (table, _item_key(payload['Item']))
+        if 'attribute_not_exists' in payload.get('ConditionExpression', '') and key in state.items:
+            return 400, {'__type': 'com.amazonaws.dynamodb.v20120810#ConditionalCheckFailedException',
+                         'message': 'The conditional request failed'}
+        state.items[key] = payload['Item']
+        return 200, {}
+    if operation == 'GetItem':
+        item = state.items.get((table, _item_key(payload['Key'])))
+        return 200, {'Item': item} if item else {}
+    if operation == 'DeleteItem':
+        state.items.pop((table, _item_key(payload['Key'])), None)
+        return 200, {}
+    if operation == 'UpdateItem':
+        return 200, {}
+    if operation == 'BatchWriteItem':
+        for table_name, requests in payload.get('RequestItems', {}).items():
+            for request in requests:
+                if 'PutRequest' in request:
+                    item = request['PutRequest']['Item']
+                    state.items[(table_name, _item_key(item))] = item
+        return 200, {'UnprocessedItems': {}}
+    if operation == 'TransactWriteItems':
+        # Tudo ou nada: uma condição falha cancela a transação e devolve o motivo de cada item
+        puts = [(request['Put']['TableName'], request['Put']) for request in payload.get('TransactItems', []) if 'Put' in request]
+        reasons = [{'Code': 'ConditionalCheckFailed'}
+                   if 'attribute_not_exists' in put.get('ConditionExpression', '') and (table_name, _item_key(put['Item'])) in state.items
+                   else {'Code': 'None'} for table_name, put in puts]
+        if any(r['Code'] != 'None' for r in reasons):
+            return 400, {'__type': 'com.amazonaws.dynamodb.v20120810#TransactionCanceledException',
+                         'message': 'Transaction cancelled', 'CancellationReasons': reasons}
+        for table_name, put in puts:
+            state.items[(table_name, _item_key(put['Item']))] = put['Item']
+        return 200, {}
+    if operation in ('Query', 'Scan'):
+        return 200, {'Items': [], 'Count': 0, 'ScannedCount': 0}
+    return 400, {'__type': 'com.amazon.coral.validate#ValidationException', 'message': f'{operation} não suportado no stub'}
+
+
+def _make_handler(state):
+    class AwsStubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Cabeçalhos + corpo em um único write: evita o atraso Nagle/delayed-ACK (~40 ms) por requisição
+        wbufsize = 64 * 1024
+
+        def _dispatch(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            target = self.headers.get('X-Amz-Target', '')
+            url = urlparse(self.path)
+            content_type = 'application/xml'
+
+            if target.startswith('DynamoDB'):
+                status, payload = handle_dynamodb(state, target, json.loads(body or b'{}'))
+                data = json.dumps(payload).encode('utf-8')
+                content_type = 'application/x-amz-json-1.0'
+            elif self.command == 'POST' and url.path == '/' and b'Action=' in body:
+                status, text = handle_ec2(state, parse_qs(body.decode('utf-8')))
+                data = text.encode('utf-8')
+            else:
+                query = parse_qs(url.query, keep_blank_values=True)
+                status, text = handle_s3(state, self.command, url.path, query)
+                data = text.encode('utf-8')
+
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_HEAD = do_DELETE = _dispatch
+
+        def log_message(self, *args):
+            pass
+
+    return AwsStubHandler
+
+
+def start_aws_stub(state=None, port=0):
+    """Sobe o stub em uma thread daemon. Retorna (server, state, endpoint)."""
+    state = state or AwsStubState()
+    server = ThreadingHTTPServer(('127.0.0.1', port), _make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
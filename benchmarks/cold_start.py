@@ -0,0 +1,116 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Benchmark de cold start da Lambda: cada execução é um processo Python novo (container "frio").
+# Mede o import de aws_sentinel_lambda, a primeira invocação e uma segunda invocação (quente)
+# por tipo de evento, com EC2/S3/DynamoDB apontando para o stub local e o LLM para o fake_gemini.
+#
+# Uso: python benchmarks/cold_start.py --runs 10 [--output resultado.json]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+
+def child(event_type):
+    """Executado no processo filho: mede import + 1ª invocação + 2ª invocação."""
+    from events import EVENT_TYPES
+
+    event = EVENT_TYPES[event_type]()
+    t0 = time.perf_counter()
+    import aws_sentinel_lambda
+    t1 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        aws_sentinel_lambda.lambda_handler(event, None)
+        t2 = time.perf_counter()
+        aws_sentinel_lambda.lambda_handler(EVENT_TYPES[event_type](), None)
+    t3 = time.perf_counter()
+    print(json.dumps({
+        'import_ms': (t1 - t0) * 1000,
+        'primeira_invocacao_ms': (t2 - t1) * 1000,
+        'invocacao_quente_ms': (t3 - t2) * 1000,
+    }))
+
+
+def bench_env(aws_endpoint, llm_endpoint):
+    env = dict(os.environ)
+    env.update({
+        'AWS_ENDPOINT_URL': aws_endpoint,
+        'AWS_ACCESS_KEY_ID': 'stub',
+        'AWS_SECRET_ACCESS_KEY': 'stub',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_REGION': 'us-east-1',
+        'GOOGLE_API_KEY': 'stub',
+        'SENTINEL_LLM_ENDPOINT': llm_endpoint,
+        'SENTINEL_CACHE_BACKEND': 'memory',
+        'SENTINEL_PURGE_CHECKPOINT': 'dynamodb',
+    })
+    return env
+
+
+def run(runs, output=None):
+    from aws_stub import start_aws_stub
+    from events import EVENT_TYPES, default_aws_state
+    from stats import percentile
+    from fake_gemini import start_fake_server
+
+    _, state, aws_endpoint = start_aws_stub()
+    _, _, llm_endpoint = start_fake_server()
+    env = bench_env(aws_endpoint, llm_endpoint)
+
+    report = {}
+    for event_type in EVENT_TYPES:
+        samples = []
+        for _ in range(runs):
+            # Estado novo a cada execução: a remediação da anterior apagou SG/bucket
+            fresh = default_aws_state()
+            state.security_groups, state.buckets = fresh['security_groups'], fresh['buckets']
+            state.reset_calls()
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', event_type],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            sample = json.loads(out)
+            sample['chamadas_aws'] = sum(state.calls.values())
+            samples.append(sample)
+
+        report[event_type] = {
+            metric: {
+                'p50': round(statistics.median(s[metric] for s in samples), 2),
+                'p95': round(percentile([s[metric] for s in samples], 95), 2),
+            }
+            for metric in ('import_ms', 'primeira_invocacao_ms', 'invocacao_quente_ms', 'chamadas_aws')
+        }
+
+    print(f"{'evento':<24}{'import p50':>12}{'1ª inv p50':>12}{'quente p50':>12}{'1ª inv p95':>12}{'AWS/run':>9}")
+    for event_type, metrics in report.items():
+        print(f"{event_type:<24}{metrics['import_ms']['p50']:>12}{metrics['primeira_invocacao_ms']['p50']:>12}"
+              f"{metrics['invocacao_quente_ms']['p50']:>12}{metrics['primeira_invocacao_ms']['p95']:>12}"
+              f"{metrics['chamadas_aws']['p50']:>9}")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'runs': runs, 'python': sys.version.split()[0], 'resultados': report}, f, indent=2)
+        print(f"💾 Resultado salvo em {output}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de cold start da Lambda do Sentinel")
+    parser.add_argument('--runs', type=int, default=5, help="Processos frios por tipo de evento")
+    parser.add_argument('--output', help="Arquivo JSON para salvar o resultado")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+    else:
+        run(args.runs, args.output)
@@ -0,0 +1,87 @@
+import copy
+import uuid
+
+# Eventos CloudTrail sintéticos (formato EventBridge) e o estado AWS correspondente no stub.
+
+BENCH_SG = 'sg-0bench000000000001'
+BENCH_BUCKET = 'sentinel-bench-bucket'
+
+PUBLIC_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [{
+        "Sid": "PublicRead",
+        "Effect": "Allow",
+        "Principal": "*",
+        "Action": "s3:GetObject",
+        "Resource": f"arn:aws:s3:::{BENCH_BUCKET}/*",
+    }],
+}
+
+OPEN_SSH = {'IpProtocol': 'tcp', 'FromPort': 22, 'ToPort': 22, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}
+
+
+def _envelope(source, name, request_parameters, response_elements=None):
+    return {
+        "version": "0",
+        "id": str(uuid.uuid4()),
+        "detail-type": "AWS API Call via CloudTrail",
+        "source": f"aws.{source}",
+        "account": "123456789012",
+        "region": "us-east-1",
+        "resources": [],
+        "detail": {
+            "eventVersion": "1.08",
+            "eventID": str(uuid.uuid4()),
+            "eventTime": "2026-01-01T00:00:00Z",
+            "eventSource": f"{source}.amazonaws.com",
+            "eventName": name,
+            "awsRegion": "us-east-1",
+            "sourceIPAddress": "203.0.113.10",
+            "userAgent": "aws-cli/2.15.0 Python/3.11",
+            "userIdentity": {"type": "IAMUser", "userName": "bench-user", "arn": "arn:aws:iam::123456789012:user/bench-user"},
+            "requestParameters": request_parameters,
+            "responseElements": response_elements,
+            "requestID": str(uuid.uuid4()),
+        },
+    }
+
+
+def s3_put_bucket_policy(bucket=BENCH_BUCKET):
+    return _envelope('s3', 'PutBucketPolicy', {"bucketName": bucket, "policy": PUBLIC_POLICY})
+
+
+def sg_authorize_ingress(group_id=BENCH_SG, port=22):
+    return _envelope('ec2', 'AuthorizeSecurityGroupIngress', {
+        "groupId": group_id,
+        "ipPermissions": {"items": [{
+            "ipProtocol": "tcp", "fromPort": port, "toPort": port,
+            "ipRanges": {"items": [{"cidrIp": "0.0.0.0/0"}]},
+        }]},
+    })
+
+
+def sg_create(group_id=BENCH_SG):
+    return _envelope('ec2', 'CreateSecurityGroup',
+                     {"groupName": group_id, "groupDescription": "bench"}, {"groupId": group_id})
+
+
+def iam_generic(user='bench-user'):
+    return _envelope('iam', 'AttachUserPolicy', {
+        "userName": user, "policyArn": "arn:aws:iam::aws:policy/AdministratorAccess",
+    })
+
+
+EVENT_TYPES = {
+    's3_put_bucket_policy': s3_put_bucket_policy,
+    'sg_authorize_ingress': sg_authorize_ingress,
+    'sg_create': sg_create,
+    'iam_generic': iam_generic,
+}
+
+
+def default_aws_state():
+    """Recursos que os eventos acima referenciam: SG com SSH aberto e bucket com policy pública."""
+    return {
+        'security_groups': {BENCH_SG: [copy.deepcopy(OPEN_SSH)]},
+        'buckets': {BENCH_BUCKET: copy.deepcopy(PUBLIC_POLICY)},
+    }
@@ -0,0 +1,309 @@
+import argparse
+import contextlib
+import copy
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+# Replay offline de ponta a ponta: um corpus de eventos CloudTrail passa pelo lambda_handler e um corpus
+# de templates IaC passa pelo sentinel_scan, com EC2/S3/DynamoDB no stub local e o LLM no fake_gemini.
+# Reporta eventos/s, p50/p95/p99 por estágio e chamadas AWS/LLM por evento, e salva/compara um baseline.
+#
+# Uso:
+#   python benchmarks/replay.py --events 500 --templates 60 --save-baseline
+#   python benchmarks/replay.py --events 500 --templates 60 --compare      # exit 1 se regrediu
+#   python benchmarks/replay.py --events-file eventos.jsonl --templates-dir infra/
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+DEFAULT_BASELINE = os.path.join(HERE, 'replay_baseline.json')
+
+# Diferenças de p95 abaixo disso são ruído de agendamento, não regressão
+MIN_REGRESSION_MS = 1.0
+
+
+class StageRecorder:
+    """Envolve funções com cronômetro. Cada chamada vira uma amostra (ms) do estágio."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+        self._patched = []
+
+    def add(self, stage, ms):
+        with self._lock:
+            self.samples[stage].append(ms)
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, (time.perf_counter() - start) * 1000)
+        return timed
+
+    def instrument(self, obj, attr, stage):
+        original = getattr(obj, attr)
+        self._patched.append((obj, attr, original))
+        setattr(obj, attr, self.wrap(stage, original))
+
+    def restore(self):
+        for obj, attr, original in reversed(self._patched):
+            setattr(obj, attr, original)
+        self._patched.clear()
+
+    def report(self):
+        from stats import summarize
+        with self._lock:
+            return {stage: summarize(values) for stage, values in sorted(self.samples.items())}
+
+
+# --- CORPUS ---
+
+def build_event_corpus(count, distinct):
+    """Eventos sintéticos alternando os tipos do events.py, com `distinct` recursos por tipo.
+    Inclui ingress em porta não administrativa, que o motor de regras escala para o LLM."""
+    import events
+
+    builders = [
+        lambda n: events.s3_put_bucket_policy(f"{events.BENCH_BUCKET}-{n}"),
+        lambda n: events.sg_authorize_ingress(f"sg-0bench{n:012x}", port=22),
+        lambda n: events.sg_authorize_ingress(f"sg-0bench{0x800000 + n:012x}", port=8080),
+        lambda n: events.sg_create(f"sg-0bench{0x900000 + n:012x}"),
+        lambda n: events.iam_generic(f"bench-user-{n}"),
+    ]
+    return [builders[i % len(builders)]((i // len(builders)) % max(1, distinct)) for i in range(count)]
+
+
+def load_event_corpus(path):
+    """Eventos gravados (um evento EventBridge por linha, JSONL)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def seed_resources(state, event, parse_ip_permissions):
+    """Recria no stub o recurso que o evento referencia, no estado descrito pelo próprio evento.
+    A remediação do evento anterior pode ter apagado o bucket/SG."""
+    from events import OPEN_SSH
+
+    detail = event.get('detail', {})
+    source = detail.get('eventSource', '').split('.')[0]
+    name = detail.get('eventName', '')
+    params = detail.get('requestParameters') or {}
+    response = detail.get('responseElements') or {}
+
+    if source == 's3' and params.get('bucketName'):
+        policy = params.get('policy')
+        state.buckets[params['bucketName']] = json.loads(policy) if isinstance(policy, str) else copy.deepcopy(policy)
+    elif source == 'ec2' and 'SecurityGroup' in name:
+        group_id = params.get('groupId') or response.get('groupId')
+        if group_id:
+            items = (params.get('ipPermissions') or {}).get('items', [])
+            state.security_groups[group_id] = parse_ip_permissions(items) or [copy.deepcopy(OPEN_SSH)]
+
+
+# --- REPLAY ---
+
+def _phase_result(recorder, units, wall_s, aws_calls, llm_calls, cache_before, cache_after):
+    hits = sum(cache_after[k] - cache_before[k] for k in ('hits_memoria', 'hits_persistente'))
+    lookups = hits + cache_after['misses'] - cache_before['misses']
+    return {
+        'unidades': units,
+        'por_segundo': round(units / wall_s, 2) if wall_s else 0.0,
+        'estagios': recorder.report(),
+        'chamadas_aws_por_evento': round(sum(aws_calls.values()) / units, 3) if units else 0.0,
+        'chamadas_llm_por_evento': round(llm_calls / units, 3) if units else 0.0,
+        'cache_hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+        'chamadas_aws': dict(sorted(aws_calls.items())),
+    }
+
+
+def replay_lambda(corpus, state, llm_config):
+    import aws_sentinel_lambda as lam
+    from sentinel_cache import verdict_cache
+    from sentinel_rules import rule_engine
+
+    recorder = StageRecorder()
+    recorder.instrument(lam, 'get_s3_config', 'coleta')
+    recorder.instrument(lam, 'get_sg_config', 'coleta')
+    recorder.instrument(rule_engine, 'evaluate', 'regras')
+    recorder.instrument(lam, 'ask_gemini', 'llm')
+    recorder.instrument(lam, 'auto_remediate_s3', 'remediacao')
+    recorder.instrument(lam, 'auto_remediate_ec2', 'remediacao')
+    # Gravação condicional + contadores
+    recorder.instrument(lam, 'put_finding', 'persistencia')
+
+    state.reset_calls()
+    llm_before = llm_config.requests
+    cache_before = verdict_cache.report()
+    elapsed = 0.0
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for event in corpus:
+                seed_resources(state, event, lam.parse_cloudtrail_ip_permissions)
+                start = time.perf_counter()
+                lam.lambda_handler(event, None)
+                ms = (time.perf_counter() - start) * 1000
+                recorder.add('total', ms)
+                elapsed += ms / 1000
+    finally:
+        recorder.restore()
+
+    return _phase_result(recorder, len(corpus), elapsed, state.calls, llm_config.requests - llm_before,
+                         cache_before, verdict_cache.report())
+
+
+def replay_scan(paths, state, llm_config, workers, batch=False):
+    import sentinel_scan as scan
+    from sentinel_cache import verdict_cache
+
+    recorder = StageRecorder()
+    recorder.instrument(scan, 'analyze_iac', 'arquivo')
+    recorder.instrument(scan, 'ask_gemini_iac', 'llm')
+    recorder.instrument(scan, 'ask_gemini_iac_batch', 'llm_lote')
+    recorder.instrument(scan, 'save_batch_to_dashboard', 'persistencia')
+
+    state.reset_calls()
+    llm_before = llm_config.requests
+    cache_before = verdict_cache.report()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            results = scan.scan_files_batched(paths) if batch else scan.scan_files(paths, workers)
+            scan.save_batch_to_dashboard(results)
+            elapsed = time.perf_counter() - start
+    finally:
+        recorder.restore()
+    recorder.add('total', elapsed * 1000)
+
+    return _phase_result(recorder, len(paths), elapsed, state.calls, llm_config.requests - llm_before,
+                         cache_before, verdict_cache.report())
+
+
+# --- BASELINE ---
+
+def compare(current, baseline, tolerance):
+    """Lista de regressões (texto). Vazão e p95 toleram `tolerance`; chamadas por evento são exatas."""
+    regressions = []
+    if current.get('config') != baseline.get('config'):
+        print(f"⚠️ Aviso: Configuração diferente do baseline ({baseline.get('config')}). Comparação aproximada.")
+
+    for phase in ('lambda', 'scan'):
+        cur, base = current.get(phase), baseline.get(phase)
+        if not cur or not base:
+            continue
+        if cur['por_segundo'] < base['por_segundo'] * (1 - tolerance):
+            regressions.append(f"{phase}: vazão {base['por_segundo']} -> {cur['por_segundo']}/s")
+        for stage, stats in cur['estagios'].items():
+            old = base['estagios'].get(stage)
+            if not old:
+                continue
+            if stats['p95'] > old['p95'] * (1 + tolerance) and stats['p95'] - old['p95'] > MIN_REGRESSION_MS:
+                regressions.append(f"{phase}/{stage}: p95 {old['p95']} -> {stats['p95']} ms")
+        for key in ('chamadas_aws_por_evento', 'chamadas_llm_por_evento'):
+            if cur[key] > base[key]:
+                regressions.append(f"{phase}: {key} {base[key]} -> {cur[key]}")
+    return regressions
+
+
+def print_report(report):
+    for phase, unit in (('lambda', 'eventos'), ('scan', 'arquivos')):
+        result = report.get(phase)
+        if not result:
+            continue
+        print(f"\n📊 {phase}: {result['unidades']} {unit}, {result['por_segundo']} {unit}/s, "
+              f"AWS/evento {result['chamadas_aws_por_evento']}, LLM/evento {result['chamadas_llm_por_evento']}, "
+              f"cache hit {result['cache_hit_rate']}")
+        print(f"   {'estágio':<14}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage, stats in result['estagios'].items():
+            print(f"   {stage:<14}{stats['n']:>7}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}")
+
+
+def run(args):
+    from aws_stub import AwsStubState, start_aws_stub
+    from cold_start import bench_env
+    from fake_gemini import FakeGeminiConfig, start_fake_server
+    from templates import write_corpus
+
+    _, state, aws_endpoint = start_aws_stub(AwsStubState())
+    _, llm_config, llm_endpoint = start_fake_server(config=FakeGeminiConfig(latency_ms=args.llm_latency))
+    # Antes de importar os módulos do Sentinel, que leem a configuração no import
+    os.environ.update(bench_env(aws_endpoint, llm_endpoint))
+
+    report = {
+        'versao': 1,
+        'python': sys.version.split()[0],
+        'config': {
+            'eventos': args.events_file or args.events,
+            'templates': args.templates_dir or args.templates,
+            'distintos': args.distinct,
+            'workers': args.workers,
+            'lote': args.batch,
+            'llm_latencia_ms': args.llm_latency,
+        },
+    }
+
+    corpus = load_event_corpus(args.events_file) if args.events_file else build_event_corpus(args.events, args.distinct)
+    if corpus:
+        report['lambda'] = replay_lambda(corpus, state, llm_config)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.templates_dir:
+            paths = sorted(glob.glob(os.path.join(args.templates_dir, '*.json')))
+        else:
+            paths = write_corpus(tmp, args.templates, args.distinct)
+        if paths:
+            report['scan'] = replay_scan(paths, state, llm_config, args.workers, args.batch)
+
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Resultado salvo em {args.output}")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Baseline salvo em {args.save_baseline}")
+
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"⚠️ Baseline {args.compare} não encontrado. Rode com --save-baseline primeiro.")
+            return 1
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressão(ões) contra {args.compare}:")
+            for line in regressions:
+                print(f"   - {line}")
+            return 1
+        print(f"\n✅ Sem regressões contra {args.compare} (tolerância {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay offline de eventos e templates pelo Sentinel")
+    parser.add_argument('--events', type=int, default=200, help="Eventos sintéticos no corpus da Lambda")
+    parser.add_argument('--events-file', help="Eventos gravados (JSONL, um evento EventBridge por linha)")
+    parser.add_argument('--templates', type=int, default=30, help="Templates sintéticos no corpus do scanner")
+    parser.add_argument('--templates-dir', help="Diretório com templates reais (*.json)")
+    parser.add_argument('--distinct', type=int, default=10, help="Recursos/templates distintos por tipo (o resto repete)")
+    parser.add_argument('--workers', type=int, default=4, help="Workers do scanner")
+    parser.add_argument('--batch', action='store_true', help="Scanner com análise em lote (scan_files_batched)")
+    parser.add_argument('--llm-latency', type=float, default=0, help="Latência simulada do LLM em ms")
+    parser.add_argument('--output', help="Arquivo JSON para salvar o resultado")
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help="Salva o resultado como baseline")
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, help="Compara com um baseline salvo")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Piora tolerada em vazão/p95 (fração)")
+    sys.exit(run(parser.parse_args()))
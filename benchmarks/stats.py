@@ -0,0 +1,21 @@
+import statistics
+
+# Estatísticas compartilhadas pelos benchmarks.
+
+
+def percentile(values, pct):
+    """Percentil por posição mais próxima (sem interpolação), suficiente para amostras de benchmark."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(values):
+    """{'n', 'p50', 'p95', 'p99'} em ms, arredondados. Lista vazia -> n=0."""
+    if not values:
+        return {'n': 0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    return {
+        'n': len(values),
+        'p50': round(statistics.median(values), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+    }
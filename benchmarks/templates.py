@@ -0,0 +1,103 @@
+import json
+import os
+
+# Templates CloudFormation sintéticos para o replay do sentinel_scan.
+# Cobrem os três caminhos do scanner: template pequeno aprovado, template pequeno com exposição
+# e stack grande (acima de SENTINEL_TEMPLATE_CHUNK_MIN) analisada em grupos de recursos.
+
+
+def s3_bucket(suffix=0):
+    return {
+        "AWSTemplateFormatVersion": "2010-09-09",
+        "Description": f"Bucket de logs {suffix}",
+        "Resources": {
+            "LogsBucket": {
+                "Type": "AWS::S3::Bucket",
+                "Properties": {
+                    "BucketName": f"sentinel-bench-logs-{suffix}",
+                    "VersioningConfiguration": {"Status": "Enabled"},
+                    "BucketEncryption": {"ServerSideEncryptionConfiguration": [
+                        {"ServerSideEncryptionByDefault": {"SSEAlgorithm": "aws:kms"}},
+                    ]},
+                    "PublicAccessBlockConfiguration": {
+                        "BlockPublicAcls": True, "BlockPublicPolicy": True,
+                        "IgnorePublicAcls": True, "RestrictPublicBuckets": True,
+                    },
+                },
+            },
+        },
+    }
+
+
+def open_security_group(suffix=0, port=22):
+    return {
+        "AWSTemplateFormatVersion": "2010-09-09",
+        "Description": f"SG de bastion {suffix}",
+        "Resources": {
+            "BastionSG": {
+                "Type": "AWS::EC2::SecurityGroup",
+                "Properties": {
+                    "GroupDescription": "bastion",
+                    "SecurityGroupIngress": [
+                        {"IpProtocol": "tcp", "FromPort": port, "ToPort": port, "CidrIp": "0.0.0.0/0"},
+                    ],
+                },
+            },
+        },
+    }
+
+
+def web_stack(suffix=0, services=4):
+    """Stack com `services` serviços (SG + instância + bucket cada), ligados por Ref/GetAtt."""
+    resources = {
+        "AppVpc": {"Type": "AWS::EC2::VPC", "Properties": {"CidrBlock": "10.0.0.0/16"}},
+    }
+    for i in range(services):
+        resources[f"Svc{i}SG"] = {
+            "Type": "AWS::EC2::SecurityGroup",
+            "Properties": {
+                "GroupDescription": f"servico {i}",
+                "VpcId": {"Ref": "AppVpc"},
+                "SecurityGroupIngress": [{"IpProtocol": "tcp", "FromPort": 443, "ToPort": 443, "CidrIp": "10.0.0.0/16"}],
+            },
+        }
+        resources[f"Svc{i}Instance"] = {
+            "Type": "AWS::EC2::Instance",
+            "Properties": {
+                "ImageId": "ami-0bench",
+                "InstanceType": "t3.micro",
+                "SecurityGroupIds": [{"Fn::GetAtt": [f"Svc{i}SG", "GroupId"]}],
+            },
+        }
+        resources[f"Svc{i}Bucket"] = {
+            "Type": "AWS::S3::Bucket",
+            "Properties": {"BucketName": f"sentinel-bench-svc{i}-{suffix}"},
+        }
+    return {
+        "AWSTemplateFormatVersion": "2010-09-09",
+        "Description": f"Stack web {suffix}",
+        "Resources": resources,
+    }
+
+
+TEMPLATE_TYPES = {
+    's3_bucket': s3_bucket,
+    'open_security_group': open_security_group,
+    'web_stack': web_stack,
+}
+
+
+def write_corpus(directory, count, distinct):
+    """Grava `count` templates em `directory`, alternando os tipos. Só `distinct` conteúdos diferentes
+    por tipo (o resto repete), para exercitar o cache de vereditos como num monorepo real.
+    Retorna os caminhos em ordem."""
+    builders = list(TEMPLATE_TYPES.items())
+    paths = []
+    for i in range(count):
+        name, build = builders[i % len(builders)]
+        template = build(suffix=(i // len(builders)) % max(1, distinct))
+        path = os.path.join(directory, f"{i:04d}_{name}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(template, f, indent=2)
+        paths.append(path)
+    return paths
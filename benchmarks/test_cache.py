@@ -0,0 +1,93 @@
+import os
+import sys
+import unittest
+
+# Testes determinísticos do cache de vereditos (só o tier em memória, sem AWS nem LLM).
+#
+# Uso: python -m pytest benchmarks (ou python -m unittest discover -s benchmarks)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sentinel_cache import VerdictCache
+
+
+def bucket(name, public=False):
+    return {'bucketName': name, 'publico': public}
+
+
+class Compute:
+    """Veredito falso que conta as chamadas, no lugar do ask_gemini."""
+
+    def __init__(self, status='SEGURO'):
+        self.status = status
+        self.calls = []
+
+    def __call__(self, data):
+        self.calls.append(data['bucketName'])
+        return {'status': self.status, 'risco': data['bucketName']}
+
+    def many(self, items):
+        self.calls.append(sorted(items))
+        return {key: {'status': self.status, 'risco': data['bucketName']} for key, data in items.items()}
+
+
+class VerdictCacheTest(unittest.TestCase):
+    def cache(self, max_items=8):
+        return VerdictCache('memory', ttl=3600, max_items=max_items)
+
+    def test_miss_then_hit_ignores_volatile_fields(self):
+        cache, compute = self.cache(), Compute()
+
+        first = cache.get_or_compute('lambda', {**bucket('a'), 'eventID': '1'}, compute)
+        second = cache.get_or_compute('lambda', {**bucket('a'), 'eventID': '2'}, compute)
+
+        self.assertEqual(first, second)
+        self.assertEqual(compute.calls, ['a'])
+        self.assertEqual(cache.report(), {'hits_memoria': 1, 'hits_persistente': 0, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_lru_evicts_the_least_recently_used(self):
+        cache, compute = self.cache(max_items=2), Compute()
+        for name in ('a', 'b'):
+            cache.get_or_compute('lambda', bucket(name), compute)
+
+        # Usar 'a' o torna o mais recente: a entrada de 'c' despeja 'b'
+        cache.get('lambda', bucket('a'))
+        cache.get_or_compute('lambda', bucket('c'), compute)
+
+        self.assertIsNotNone(cache.get('lambda', bucket('a')))
+        self.assertIsNone(cache.get('lambda', bucket('b')))
+        self.assertIsNotNone(cache.get('lambda', bucket('c')))
+
+    def test_error_verdicts_are_not_cached(self):
+        cache = self.cache()
+        for status in ('ERRO', 'ERRO_IA', 'ERRO_API'):
+            compute = Compute(status)
+            cache.get_or_compute('lambda', bucket(status), compute)
+            cache.get_or_compute('lambda', bucket(status), compute)
+            self.assertEqual(compute.calls, [status, status])
+        # Sem veredito (análise adiada) também não entra
+        cache.put('lambda', bucket('adiado'), None)
+        self.assertIsNone(cache.get('lambda', bucket('adiado')))
+
+    def test_get_or_compute_many_sends_only_distinct_misses(self):
+        cache, compute = self.cache(), Compute()
+        cache.get_or_compute('lambda', bucket('a'), compute)
+
+        results = cache.get_or_compute_many('lambda', {
+            'S3:a': bucket('a'),
+            'S3:b': bucket('b'),
+            'S3:b-reentregue': {**bucket('b'), 'eventTime': 'agora'},
+            'S3:c': bucket('c'),
+        }, compute.many)
+
+        # 'a' veio do cache; as duas versões de 'b' têm a mesma chave canônica e vão uma vez só
+        self.assertEqual(compute.calls, ['a', ['S3:b', 'S3:c']])
+        self.assertEqual({key: verdict['risco'] for key, verdict in results.items()},
+                         {'S3:a': 'a', 'S3:b': 'b', 'S3:b-reentregue': 'b', 'S3:c': 'c'})
+        # E ficaram no cache para a próxima invocação
+        self.assertEqual(cache.get('lambda', bucket('c'))['risco'], 'c')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import unittest
+import boto3
+
+# Testes determinísticos da gravação em lote de achados contra o stub local da AWS (benchmarks/aws_stub.py).
+# Uma reentrega com chaves já gravadas no meio do lote não pode sobrescrevê-las nem contar como achado novo.
+#
+# Uso: python -m pytest benchmarks (ou python -m unittest discover -s benchmarks)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.aws_stub import start_aws_stub
+from sentinel_findings import FindingsWriter, write_findings
+
+
+def finding(index, status='VULNERAVEL'):
+    return {'id_recurso': f"bucket-{index}#evento-{index}", 'tipo': 'S3', 'status': status,
+            'data_evento': '2026-01-01T00:00:00'}
+
+
+class FindingsWriterTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.state, endpoint = start_aws_stub()
+        cls.table = boto3.resource('dynamodb', endpoint_url=endpoint, region_name='us-east-1',
+                                   aws_access_key_id='stub', aws_secret_access_key='stub').Table('SentinelMonitor')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.state.items.clear()
+
+    def stored(self, index):
+        return self.state.items[('SentinelMonitor', finding(index)['id_recurso'])]
+
+    def test_redelivery_skips_existing_keys_inside_the_batch(self):
+        self.assertEqual(write_findings(self.table, [finding(i) for i in range(5)]), 5)
+
+        # Reentrega: 3 chaves já gravadas (com outro conteúdo) no meio de 2 novas e de uma repetida no buffer
+        writer = FindingsWriter(self.table, batch_size=25)
+        for index in (0, 5, 2, 6, 4, 5):
+            writer.add(finding(index, status='CORRIGIDO'))
+        written = writer.flush()
+
+        self.assertEqual(sorted(i['id_recurso'] for i in written), [finding(5)['id_recurso'], finding(6)['id_recurso']])
+        self.assertEqual(writer.stats, {'gravados': 2, 'duplicados': 4})
+        # A condição impediu a sobrescrita dos achados originais
+        self.assertEqual(self.stored(2)['status'], {'S': 'VULNERAVEL'})
+        self.assertEqual(self.stored(6)['status'], {'S': 'CORRIGIDO'})
+
+    def test_full_redelivery_writes_nothing(self):
+        write_findings(self.table, [finding(i) for i in range(3)])
+        self.assertEqual(write_findings(self.table, [finding(i) for i in range(3)]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
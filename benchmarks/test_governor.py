@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+
+# Testes determinísticos do governador do LLM: cota esgotada vira LLMThrottled (adiar), nunca erro HTTP comum.
+# O LLM é o fake_gemini local; a cota é de uma requisição por hora, então a segunda chamada nunca tem token.
+#
+# Uso: python -m pytest benchmarks (ou python -m unittest discover -s benchmarks)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_gemini import start_fake_server
+from sentinel_governor import QuotaExceeded, RateGovernor
+from sentinel_llm import GeminiProvider, LLMClient, LLMThrottled
+
+
+class QuotaExhaustionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server, _, cls.endpoint = start_fake_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        # rpm * janela / 60 = 1 token por janela de uma hora; max_wait=0 adia sem esperar
+        self.governor = RateGovernor('memory', rpm=1 / 60, window=3600, max_wait=0)
+        self.client = LLMClient(GeminiProvider(endpoint=self.endpoint, api_key='stub'), governor=self.governor)
+
+    def test_exhausted_quota_raises_throttled(self):
+        self.client.generate("primeira chamada")
+
+        with self.assertRaises(LLMThrottled) as raised:
+            self.client.generate("segunda chamada")
+
+        self.assertEqual(raised.exception.status, 429)
+        self.assertEqual(self.governor.stats['chamadas'], 1)
+        self.assertEqual(self.governor.stats['adiadas'], 1)
+        # O slot reservado antes de consultar a cota foi devolvido
+        self.assertEqual(self.governor.in_flight, 0)
+        # Falta de cota não é o provedor fora do ar: o circuit breaker não conta
+        self.assertEqual(self.client.breaker.failures, 0)
+
+    def test_governor_defers_instead_of_waiting_past_max_wait(self):
+        self.governor.acquire()
+        self.governor.release(0.0, 200)
+
+        with self.assertRaises(QuotaExceeded):
+            self.governor.acquire()
+
+
+if __name__ == "__main__":
+    unittest.main()
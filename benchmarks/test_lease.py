@@ -0,0 +1,88 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Testes determinísticos do lease por recurso no backend sqlite (o substituto local do DynamoDB).
+# A "outra invocação" roda dentro da auditoria do dono, então a ordem dos eventos é sempre a mesma.
+#
+# Uso: python -m pytest benchmarks (ou python -m unittest discover -s benchmarks)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import sentinel_lease
+from sentinel_lease import LeaseBacklog, LeaseManager
+
+
+class SqliteLeaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self._path = sentinel_lease.LEASE_SQLITE_PATH
+        sentinel_lease.LEASE_SQLITE_PATH = os.path.join(self.tmp, 'leases.db')
+
+    def tearDown(self):
+        sentinel_lease.LEASE_SQLITE_PATH = self._path
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def manager(self, max_rounds=3):
+        return LeaseManager('sqlite', seconds=60, max_rounds=max_rounds)
+
+    def test_acquire_absorb_release_reaudit(self):
+        owner, other = self.manager(), self.manager()
+        audits, absorbed = [], []
+
+        def audit(extra_events):
+            audits.append(list(extra_events))
+            if len(audits) == 1:
+                # Outra invocação chega durante a primeira auditoria: o evento fica no lease do dono
+                absorbed.append(other.run('SG:sg-1', 'evento-2', lambda extra: self.fail("não deveria auditar")))
+            return f"auditoria-{len(audits)}"
+
+        result = owner.run('SG:sg-1', 'evento-1', audit)
+
+        self.assertEqual(absorbed, [None])
+        self.assertEqual(audits, [[], ['evento-2']])
+        self.assertEqual(result, 'auditoria-2')
+        # Lease solto: o próximo evento audita na hora, sem eventos herdados
+        self.assertEqual(other.run('SG:sg-1', 'evento-3', lambda extra: list(extra)), [])
+
+    def test_backlog_stays_on_the_lease_for_the_next_acquirer(self):
+        owner, other = self.manager(max_rounds=1), self.manager()
+        counter = iter(range(2, 100))
+
+        def audit(extra_events):
+            # Cada auditoria recebe um evento novo: o lease nunca volta limpo
+            other.run('SG:sg-1', f"evento-{next(counter)}", lambda extra: self.fail("não deveria auditar"))
+            return 'ok'
+
+        with self.assertRaises(LeaseBacklog):
+            owner.run('SG:sg-1', 'evento-1', audit)
+        # A reentrega (ou o próximo evento) herda o que sobrou em vez de perdê-lo
+        self.assertEqual(other.run('SG:sg-1', 'evento-1', lambda extra: list(extra)), ['evento-3'])
+
+    def test_failed_audit_hands_pending_and_dirty_events_to_the_next_acquirer(self):
+        owner, other = self.manager(), self.manager()
+        audits = []
+
+        def audit(extra_events):
+            audits.append(list(extra_events))
+            # Cada rodada recebe um evento de outra invocação, que retorna sucesso achando que será re-auditado
+            self.assertIsNone(other.run('SG:sg-1', f"evento-{len(audits) + 1}", lambda extra: self.fail("não deveria auditar")))
+            if len(audits) == 2:
+                raise RuntimeError("LLM sem cota")
+            return 'ok'
+
+        with self.assertRaises(RuntimeError):
+            owner.run('SG:sg-1', 'evento-1', audit)
+
+        self.assertEqual(audits, [[], ['evento-2']])
+        # O evento da re-auditoria que falhou e o que chegou durante ela ficam no lease
+        lease = other.acquire('SG:sg-1', 'evento-1')
+        self.assertIsNotNone(lease)
+        self.assertEqual(lease.events, ['evento-2', 'evento-3'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import unittest
+
+# Testes determinísticos do motor de regras: para cada regra, o caso em que ela decide sozinha e o caso
+# ambíguo que precisa escalar para o LLM (evaluate retorna None).
+#
+# Uso: python -m pytest benchmarks (ou python -m unittest discover -s benchmarks)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sentinel_rules import rule_engine, s3_benign, s3_public_principal, sg_admin_port_open, sg_benign
+
+
+def sg(*perms):
+    return {'GroupId': 'sg-1', 'IpPermissions': list(perms)}
+
+
+def ingress(from_port, to_port, cidr='0.0.0.0/0', protocol='tcp'):
+    perm = {'IpProtocol': protocol, 'IpRanges': [{'CidrIp': cidr}], 'Ipv6Ranges': []}
+    if protocol != '-1':
+        perm['FromPort'], perm['ToPort'] = from_port, to_port
+    return perm
+
+
+def s3(*statements, policy=None):
+    return {'bucketName': 'bucket-1', 'policy': policy if policy is not None else {'Statement': list(statements)}}
+
+
+PUBLIC_READ = {'Sid': 'Publico', 'Effect': 'Allow', 'Principal': '*', 'Action': 's3:GetObject'}
+SSL_ONLY = {'Sid': 'SoSSL', 'Effect': 'Deny', 'Principal': '*', 'Action': 's3:*',
+            'Condition': {'Bool': {'aws:SecureTransport': 'false'}}}
+
+
+class RuleEngineTest(unittest.TestCase):
+    def assertDecided(self, resource_type, data, rule, status):
+        verdict = rule_engine.evaluate(resource_type, data)
+        self.assertIsNotNone(verdict)
+        self.assertEqual((verdict['status'], verdict['origem']), (status, f"regra:{rule}"))
+
+    def assertEscalated(self, resource_type, data):
+        self.assertIsNone(rule_engine.evaluate(resource_type, data))
+
+    # --- sg-porta-admin-aberta ---
+
+    def test_sg_admin_port_open_decides(self):
+        self.assertDecided('SG', sg(ingress(22, 22)), 'sg-porta-admin-aberta', 'VULNERAVEL')
+        # Intervalo que engloba uma porta de banco, e "todas as portas" em IPv6
+        self.assertDecided('SG', sg(ingress(3000, 4000)), 'sg-porta-admin-aberta', 'VULNERAVEL')
+        all_v6 = {'IpProtocol': '-1', 'IpRanges': [], 'Ipv6Ranges': [{'CidrIpv6': '::/0'}]}
+        self.assertDecided('SG', sg(all_v6), 'sg-porta-admin-aberta', 'VULNERAVEL')
+
+    def test_sg_admin_port_open_passes(self):
+        # Porta admin só para a rede interna, ou intervalo público que não toca nenhuma porta admin
+        self.assertIsNone(sg_admin_port_open(sg(ingress(22, 22, cidr='10.0.0.0/8'))))
+        self.assertIsNone(sg_admin_port_open(sg(ingress(8000, 8100))))
+
+    # --- sg-sem-exposicao-critica ---
+
+    def test_sg_benign_decides(self):
+        self.assertDecided('SG', sg(ingress(443, 443), ingress(22, 22, cidr='10.0.0.0/8')),
+                           'sg-sem-exposicao-critica', 'SEGURO')
+        self.assertDecided('SG', sg(), 'sg-sem-exposicao-critica', 'SEGURO')
+
+    def test_sg_ambiguous_exposure_escalates(self):
+        # Porta pública que não é web nem admin: só a IA decide
+        self.assertIsNone(sg_benign(sg(ingress(8080, 8080))))
+        self.assertEscalated('SG', sg(ingress(8080, 8080)))
+        # Intervalo que começa em 80 mas não é só a porta web (e não toca porta admin)
+        self.assertEscalated('SG', sg(ingress(80, 100)))
+        # Erro de coleta (sem IpPermissions) nunca vira SEGURO
+        self.assertEscalated('SG', {'id': 'sg-1', 'info': 'Erro Boto3: AccessDenied'})
+
+    # --- s3-principal-publico ---
+
+    def test_s3_public_principal_decides(self):
+        self.assertDecided('S3', s3(PUBLIC_READ), 's3-principal-publico', 'VULNERAVEL')
+        self.assertDecided('S3', s3(policy={'Statement': {**PUBLIC_READ, 'Principal': {'AWS': ['*']}}}),
+                           's3-principal-publico', 'VULNERAVEL')
+
+    def test_s3_public_principal_passes(self):
+        # Principal "*" com condição (ex: restrita à VPC) não é público por definição
+        conditioned = {**PUBLIC_READ, 'Condition': {'StringEquals': {'aws:SourceVpc': 'vpc-1'}}}
+        self.assertIsNone(s3_public_principal(s3(conditioned)))
+        self.assertIsNone(s3_public_principal(s3(policy='NoSuchBucketPolicy')))
+
+    # --- s3-sem-politica-publica ---
+
+    def test_s3_benign_decides(self):
+        self.assertDecided('S3', s3(policy='An error occurred (NoSuchBucketPolicy)'), 's3-sem-politica-publica', 'SEGURO')
+        self.assertDecided('S3', s3(SSL_ONLY), 's3-sem-politica-publica', 'SEGURO')
+
+    def test_s3_allow_statement_escalates(self):
+        conditioned = {**PUBLIC_READ, 'Condition': {'StringEquals': {'aws:SourceVpc': 'vpc-1'}}}
+        cross_account = {'Effect': 'Allow', 'Principal': {'AWS': 'arn:aws:iam::123456789012:root'}, 'Action': 's3:GetObject'}
+        self.assertIsNone(s3_benign(s3(SSL_ONLY, cross_account)))
+        self.assertEscalated('S3', s3(SSL_ONLY, cross_account))
+        self.assertEscalated('S3', s3(conditioned))
+
+    def test_unknown_type_escalates(self):
+        self.assertEscalated('IAM', {'UserName': 'admin'})
+        self.assertEscalated('SG', "estado que não é dict")
+
+
+if __name__ == "__main__":
+    unittest.main()
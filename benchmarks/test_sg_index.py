@@ -0,0 +1,101 @@
+import os
+import random
+import sys
+import unittest
+
+# Testes determinísticos do índice de exposição: a consulta por porta (bisect no _IntervalIndex) precisa
+# responder o mesmo que uma varredura ingênua de todas as regras, sem chamar a API.
+#
+# Uso: python -m pytest benchmarks (ou python -m unittest discover -s benchmarks)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sentinel_sg_index import ExposureIndex, _IntervalIndex
+
+
+def permission(protocol, from_port, to_port, cidr):
+    perm = {'IpProtocol': protocol, 'IpRanges': [{'CidrIp': cidr}]}
+    if protocol != '-1':
+        perm['FromPort'], perm['ToPort'] = from_port, to_port
+    return perm
+
+
+class FakeEc2:
+    def __init__(self, groups):
+        self.groups = groups
+
+    def get_paginator(self, name):
+        groups = self.groups
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                return [{'SecurityGroups': groups}]
+        return Paginator()
+
+
+def loaded_index(groups):
+    index = ExposureIndex()
+    index.load(FakeEc2(groups))
+    return index
+
+
+class IntervalIndexTest(unittest.TestCase):
+    def test_stab_matches_brute_force(self):
+        rng = random.Random(42)
+        intervals = []
+        for value in range(200):
+            lo = rng.randint(0, 65535)
+            intervals.append((lo, min(65535, lo + rng.choice((0, 1, 10, 1000, 40000))), value))
+        index = _IntervalIndex(intervals)
+        probes = [0, 65535] + [lo for lo, _, _ in intervals] + [hi for _, hi, _ in intervals]
+        probes += [rng.randint(0, 65535) for _ in range(500)]
+        for port in probes:
+            expected = {v for lo, hi, v in intervals if lo <= port <= hi}
+            self.assertEqual(index.stab(port), expected, port)
+
+    def test_bounds_are_inclusive(self):
+        index = _IntervalIndex([(22, 22, 'a'), (20, 30, 'b')])
+        self.assertEqual(index.stab(19), frozenset())
+        self.assertEqual(index.stab(22), {'a', 'b'})
+        self.assertEqual(index.stab(30), {'b'})
+        self.assertEqual(index.stab(31), frozenset())
+
+
+class ExposureIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = loaded_index([
+            {'GroupId': 'sg-ssh', 'GroupName': 'ssh', 'IpPermissions': [permission('tcp', 22, 22, '0.0.0.0/0')]},
+            {'GroupId': 'sg-range', 'GroupName': 'range', 'IpPermissions': [permission('tcp', 1000, 6000, '0.0.0.0/0')]},
+            {'GroupId': 'sg-all', 'GroupName': 'all', 'IpPermissions': [permission('-1', None, None, '0.0.0.0/0')]},
+            {'GroupId': 'sg-corp', 'GroupName': 'corp', 'IpPermissions': [permission('tcp', 22, 22, '10.0.0.0/8')]},
+            {'GroupId': 'sg-icmp', 'GroupName': 'icmp', 'IpPermissions': [permission('icmp', 8, 0, '0.0.0.0/0')]},
+        ])
+
+    def test_exposure_report_by_port(self):
+        report = self.index.exposure_report([22, 3389, 8080])
+        self.assertEqual(report[22], ['sg-all', 'sg-ssh'])
+        self.assertEqual(report[3389], ['sg-all', 'sg-range'])
+        self.assertEqual(report[8080], ['sg-all'])
+
+    def test_private_cidr_only_when_asked(self):
+        self.assertNotIn('sg-corp', self.index.exposed(22))
+        self.assertEqual(self.index.exposed(22, cidrs={'10.0.0.0/8'}), ['sg-corp'])
+
+    def test_events_and_revocations_update_the_lookup(self):
+        self.index.apply_event({
+            'eventName': 'AuthorizeSecurityGroupIngress',
+            'requestParameters': {'groupId': 'sg-corp', 'ipPermissions': {'items': [{
+                'ipProtocol': 'tcp', 'fromPort': 5432, 'toPort': 5432,
+                'ipRanges': {'items': [{'cidrIp': '0.0.0.0/0'}]},
+            }]}},
+        })
+        self.assertIn('sg-corp', self.index.exposed(5432))
+
+        self.index.revoke('sg-ssh', self.index.public_rules('sg-ssh'))
+        self.index.remove('sg-all')
+        self.assertEqual(self.index.exposed(22), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import unittest
+from botocore.exceptions import ClientError
+
+# Testes determinísticos do motor de revogação de Security Groups (sem AWS: um EC2 falso em memória).
+#
+# Uso: python -m pytest benchmarks (ou python -m unittest discover -s benchmarks)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sentinel_sg_rules import make_rule, normalize_permissions, revoke_rules
+
+
+class FakeEc2:
+    """Revoga qualquer lote sem `bad`; um lote com `bad` falha inteiro, como a API real."""
+
+    def __init__(self, rules, bad=(), gone=()):
+        self.rules = set(rules)
+        self.bad = set(bad)
+        self.gone = set(gone)
+        self.calls = []
+
+    def revoke_security_group_ingress(self, GroupId, IpPermissions):
+        chunk = normalize_permissions(IpPermissions)
+        self.calls.append(chunk)
+        for code, culprits in (('InvalidParameterValue', self.bad), ('InvalidPermission.NotFound', self.gone)):
+            if chunk & culprits:
+                raise ClientError({'Error': {'Code': code, 'Message': 'lote rejeitado'}}, 'RevokeSecurityGroupIngress')
+        self.rules -= chunk
+        return {'Return': True}
+
+
+def public_rules(count):
+    return [make_rule('tcp', port, port, 'ipv4', '0.0.0.0/0') for port in range(8000, 8000 + count)]
+
+
+class RevokeBisectionTest(unittest.TestCase):
+    def test_chunk_failure_bisects_down_to_the_bad_rule(self):
+        rules = public_rules(8)
+        bad = rules[5]
+        ec2 = FakeEc2(rules, bad=[bad])
+
+        result = revoke_rules(ec2, 'sg-1', rules, chunk_size=8)
+
+        self.assertEqual(set(result.failed), {bad})
+        self.assertEqual(result.revoked, set(rules) - {bad})
+        self.assertEqual(ec2.rules, {bad})
+        # Em profundidade: 8 falha, 4 passa, 4 falha, 2 falha (1 passa, 1 falha), 2 passa.
+        # Só a metade com a regra ruim continua sendo dividida
+        self.assertEqual([len(c) for c in ec2.calls], [8, 4, 4, 2, 1, 1, 2])
+
+    def test_missing_rule_counts_as_removed(self):
+        rules = public_rules(4)
+        ec2 = FakeEc2(rules, gone=[rules[0]])
+
+        result = revoke_rules(ec2, 'sg-1', rules, chunk_size=4)
+
+        self.assertEqual(result.missing, {rules[0]})
+        self.assertEqual(result.removed, set(rules))
+        self.assertEqual(result.failed, {})
+
+    def test_group_not_found_propagates(self):
+        class GoneEc2:
+            def revoke_security_group_ingress(self, GroupId, IpPermissions):
+                raise ClientError({'Error': {'Code': 'InvalidGroup.NotFound', 'Message': ''}}, 'RevokeSecurityGroupIngress')
+
+        with self.assertRaises(ClientError):
+            revoke_rules(GoneEc2(), 'sg-1', public_rules(3), chunk_size=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,17 +1,24 @@
 import streamlit as st
 import boto3
 from datetime import datetime
+from html import escape
 import json
+import time
 from dotenv import load_dotenv
 from streamlit_autorefresh import st_autorefresh
+import sentinel_store as store
+import sentinel_counters as counters
+import sentinel_feed as feed
+import sentinel_archive as archive
+from sentinel_schema import LIST_FIELDS
 
 load_dotenv()
 
 # --- Configurações ---
 st.set_page_config(page_title="Sentinel AI", page_icon="🛡️", layout="wide")
 
-# Atualização Automática Assíncrona a cada 10 segundos
-st_autorefresh(interval=10000, key="data_refresh")
+# Sem feed de mudanças: atualização automática a cada 10 segundos (polling)
+REFRESH_SECONDS = 10
 
 # CSS
 st.markdown("""
@@ -20,11 +27,20 @@ st.markdown("""
     .stButton>button { border-radius: 5px; height: 2.5em; background-color: #262730; color: white; border: 1px solid #444; }
     .stButton>button:hover { border-color: #FFD700; color: #FFD700; }
     .date-text { font-size: 0.85em; color: #aaa; margin-bottom: 5px; }
+    .sentinel-card { background-color: #262730; padding: 15px; border-radius: 8px; margin-bottom: 10px; }
+    .sentinel-tag { padding: 2px 8px; border-radius: 4px; font-size: 0.7em; font-weight: bold; }
+    .sentinel-id { font-size: 0.9em; color: #ddd; margin-top: 8px; }
     </style>
     """, unsafe_allow_html=True)
 
 AWS_REGION = "us-east-2"
 DYNAMODB_TABLE = "SentinelMonitor"
+# Quantos cards cada view busca (queries limitadas, mais recentes primeiro); a tela mostra uma página por vez
+VIEW_LIMIT = 50
+HISTORY_LIMIT = 1000
+PAGE_SIZES = [10, 25, 50]
+# Campos indexados em uma única passada sobre os dados da view (filtros e contagens)
+INDEX_FIELDS = ('tipo', 'estado_visualizacao', 'status_ia', 'gravidade')
 
 AWS_SERVICES = {
     "S3": "S3 (Armazenamento em Nuvem)",
@@ -55,24 +71,110 @@ st.sidebar.markdown("---")
 def get_dynamodb_resource():
     return boto3.resource('dynamodb', region_name=AWS_REGION)
 
-def get_data():
-    table = get_dynamodb_resource().Table(DYNAMODB_TABLE)
+def get_table():
+    return get_dynamodb_resource().Table(DYNAMODB_TABLE)
+
+@st.cache_resource
+def get_feed():
+    """Visão materializada compartilhada por todas as sessões, alimentada pelo DynamoDB Streams
+    (ou pelo JSONL local). None = tabela sem stream, o Dashboard volta ao polling."""
     try:
-        response = table.scan()
-        items = response.get('Items', [])
-        items.sort(key=lambda x: x.get('data_evento', ''), reverse=True)
-        return items
-    except:
+        return feed.start_feed(get_table())
+    except Exception as e:
+        print(f"⚠️ Aviso: Feed de mudanças indisponível ({e}). Usando polling.")
+        return None
+
+def data_version():
+    """Versão dos dados: a do feed, ou a janela de polling atual. É a chave do cache das views."""
+    view = get_feed()
+    if view is not None:
+        return view.version
+    return int(time.time() // REFRESH_SECONDS)
+
+@st.cache_resource
+def get_archive():
+    """Arquivo dos achados antigos (S3 ou diretório local). None = arquivamento desligado."""
+    return archive.open_archive()
+
+def get_hot_data(view):
+    """Busca apenas o que a view mostra: da visão em memória do feed ou, sem feed, via GSI,
+    do mais recente para o mais antigo. Só os campos de lista (a análise completa fica para os detalhes)."""
+    materialized = get_feed()
+    if materialized is not None:
+        return materialized.snapshot(view, HISTORY_LIMIT if view == 'history' else VIEW_LIMIT)
+    table = get_table()
+    try:
+        if view == 'cloud':
+            return store.get_pending_cloud(table, limit=VIEW_LIMIT, fields=LIST_FIELDS)
+        if view == 'pipeline':
+            return store.get_by_tipo(table, 'IAC', limit=VIEW_LIMIT, fields=LIST_FIELDS)
+        return store.get_history(table, HISTORY_LIMIT, datetime.now().strftime('%Y-%m'), fields=LIST_FIELDS)
+    except Exception:
         return []
 
+@st.cache_data(max_entries=2, show_spinner=False)
+def get_cold_history(archive_version):
+    """Histórico do arquivo frio, memoizado pela última execução do arquivamento: o arquivo só muda quando
+    ela roda, então novas versões do feed não voltam a baixar e descomprimir as partições."""
+    return archive.read_history(get_archive(), HISTORY_LIMIT)
+
+def get_data(view):
+    """O Histórico Geral completa com o arquivo o que já saiu da tabela quente."""
+    items = get_hot_data(view)
+    cold = get_archive()
+    if view == 'history' and cold is not None and len(items) < HISTORY_LIMIT:
+        try:
+            hot_ids = {i['id_recurso'] for i in items}
+            cold_items = [r for r in get_cold_history(archive.archive_version(cold)) if r['id_recurso'] not in hot_ids]
+            items = items + cold_items[:HISTORY_LIMIT - len(items)]
+        except Exception as e:
+            print(f"⚠️ Aviso: Não foi possível ler o arquivo de achados: {e}")
+    return items
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_view(view, version):
+    """Dados da view + índice {campo: {valor: [posições]}} montado em uma única passada.
+    Memoizado por versão dos dados: trocar de página, filtrar ou abrir detalhes não consulta nada,
+    e só uma versão nova (mudança no feed ou nova janela de polling) reconstrói a view."""
+    items = get_data(view)
+    index = {field: {} for field in INDEX_FIELDS}
+    for pos, item in enumerate(items):
+        for field in INDEX_FIELDS:
+            index[field].setdefault(str(item.get(field) or '-'), []).append(pos)
+    return items, index
+
+def invalidate_data():
+    """Descarta o que foi memoizado (botão de atualizar ou mudança de estado de um achado)."""
+    get_view.clear()
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_summary(version):
+    """KPIs lidos de um único item de resumo (contadores atômicos mantidos pelos writers).
+    Com o stream, o próprio item de resumo chega pelo feed e não há leitura."""
+    materialized = get_feed()
+    item = materialized.counters() if materialized is not None else None
+    if item is not None:
+        return {name: int(item.get(name, 0)) for name in counters.COUNTERS}
+    try:
+        return counters.get_summary(get_table())
+    except Exception:
+        return {name: 0 for name in counters.COUNTERS}
+
 def update_status(item_id, novo_estado):
-    table = get_dynamodb_resource().Table(DYNAMODB_TABLE)
     try:
-        table.update_item(
-            Key={'id_recurso': item_id},
-            UpdateExpression="set estado_visualizacao = :s",
-            ExpressionAttributeValues={':s': novo_estado}
-        )
+        table = get_table()
+        old_item = store.set_estado(table, item_id, novo_estado)
+        if old_item and novo_estado == 'CONFIRMADO':
+            counters.record_confirmation(table, old_item)
+        materialized = get_feed()
+        if old_item and materialized is not None:
+            # Aplica na hora a mudança desta sessão; o stream entrega a mesma imagem depois (idempotente)
+            new_item = {**old_item, 'estado_visualizacao': novo_estado}
+            if novo_estado == 'CONFIRMADO':
+                new_item.pop('pendente', None)
+            materialized.apply('MODIFY', item_id, new_item)
+        invalidate_data()
+        get_summary.clear()
         return True
     except Exception as e:
         st.error(f"Erro ao atualizar banco: {e}")
@@ -85,10 +187,23 @@ def format_date_br(date_str):
     except:
         return date_str
 
+@st.cache_data(max_entries=256, show_spinner=False)
+def get_analysis(item_id, archive_key=None):
+    """Análise completa do achado, lida só quando o relatório detalhado é aberto:
+    do atributo comprimido na tabela ou, para achados arquivados, do arquivo de origem."""
+    if archive_key:
+        return archive.get_analysis(get_archive(), archive_key, item_id) or {}
+    return store.get_analysis(get_table(), item_id) or {}
+
 # --- Detalhes ---
 @st.dialog("Relatório Detalhado")
 def show_details(item, is_cloud=False):
     estado = item.get('estado_visualizacao')
+    try:
+        analysis = get_analysis(item['id_recurso'], item.get('arquivo'))
+    except Exception as e:
+        print(f"⚠️ Aviso: Não foi possível carregar a análise de {item['id_recurso']}: {e}")
+        analysis = {}
     st.write(f"**Recurso:** `{item['id_recurso']}`")
     st.write(f"**Data:** {format_date_br(item.get('data_evento'))}")
     st.divider()
@@ -97,11 +212,13 @@ def show_details(item, is_cloud=False):
     if estado == 'CONFIRMADO':
         st.warning("⚠️ Incidente revisado e remediação confirmada.")
     else:
-        st.error(item.get('risco', 'Risco identificado.'))
+        st.error(analysis.get('risco') or item.get('risco', 'Risco identificado.'))
+    if analysis.get('detalhe'):
+        st.caption(analysis['detalhe'])
     
     st.divider()
     st.markdown("#### 🛠️ Resposta e Ações")
-    st.info(f"**Ação Automática:** {item.get('auto_correcao', 'Monitoramento ativo.')}")
+    st.info(f"**Ação Automática:** {analysis.get('auto_correcao') or item.get('auto_correcao', 'Monitoramento ativo.')}")
     
     if is_cloud and estado != 'CONFIRMADO':
         st.write("")
@@ -111,85 +228,146 @@ def show_details(item, is_cloud=False):
                 st.rerun()
 
     with st.expander("Ver Log JSON"):
-        st.json(item.get('json_analise', '{}'))
+        st.json(analysis.get('analise') or {})
+
+# --- Atualização ---
+@st.fragment(run_every=feed.FEED_POLL_SECONDS)
+def watch_feed():
+    """Re-renderiza a página só quando a versão do feed muda. Checar a versão é uma leitura em memória,
+    sem consultar o DynamoDB."""
+    if st.session_state.get('feed_version') != get_feed().version:
+        st.rerun(scope='app')
+
+if get_feed() is None:
+    st_autorefresh(interval=REFRESH_SECONDS * 1000, key="data_refresh")
+else:
+    st.session_state['feed_version'] = get_feed().version
+    watch_feed()
 
 # --- Interface ---
 menu = st.sidebar.radio("Navegação", ["🚨 Monitoramento Cloud", "💻 Pipeline CI/CD", "📂 Histórico Geral"])
 if st.sidebar.button("🔄 Atualizar Dashboard"):
+    invalidate_data()
+    get_summary.clear()
     st.rerun()
 
-all_data = get_data()
+def card_style(item):
+    """(cor da borda, cor da tag, texto da tag) do card"""
+    if item.get('estado_visualizacao') == 'CONFIRMADO':
+        return "#FFD700", "#443a00", "⚠️ CONFIRMADO"
+    if item.get('status_ia') == 'VULNERAVEL' or item.get('gravidade') == 'ALTA':
+        return "#ff4b4b", "#632020", "🚫 ALERTA"
+    return "#28a745", "#1b3a1e", "✅ SEGURO"
+
+def card_html(item):
+    tipo = str(item.get('tipo', 'SCAN')).upper()
+    border_color, bg_tag, status_txt = card_style(item)
+    return f"""
+        <div class="sentinel-card" style="border-left: 6px solid {border_color};">
+            <div class="date-text">{escape(format_date_br(item.get('data_evento')) or '')}</div>
+            <span class="sentinel-tag" style="background-color: {bg_tag};">{status_txt}</span>
+            <strong style="margin-left: 5px;">{escape(AWS_SERVICES.get(tipo, tipo))}</strong>
+            <div class="sentinel-id">ID: <code>{escape(str(item.get('id_recurso')))}</code></div>
+        </div>"""
 
-def render_cards(data_list, limit=None, is_cloud=False):
+def paginate(view, total):
+    """Controles de página (tamanho + anterior/próxima). Retorna o intervalo [início, fim) a exibir."""
+    size_key, page_key = f"page_size_{view}", f"page_{view}"
+    pages = lambda: max(1, -(-total // st.session_state.get(size_key, PAGE_SIZES[0])))
+    # Clamp antes dos widgets: a lista pode ter encolhido desde o último refresh
+    st.session_state[page_key] = min(max(st.session_state.get(page_key, 0), 0), pages() - 1)
+
+    c_prev, c_info, c_next, c_size = st.columns([1, 2, 1, 1])
+    if c_prev.button("◀ Anterior", key=f"prev_{view}", disabled=st.session_state[page_key] == 0):
+        st.session_state[page_key] -= 1
+    if c_next.button("Próxima ▶", key=f"next_{view}", disabled=st.session_state[page_key] >= pages() - 1):
+        st.session_state[page_key] += 1
+    size = c_size.selectbox("Por página", PAGE_SIZES, key=size_key, label_visibility="collapsed")
+    st.session_state[page_key] = min(st.session_state[page_key], pages() - 1)
+    page = st.session_state[page_key]
+    c_info.caption(f"Página {page + 1} de {pages()} · {total} registro(s)")
+    return page * size, min((page + 1) * size, total)
+
+def render_cards(view, data_list, is_cloud=False):
+    """Só a página visível é renderizada, em um único bloco HTML, com um seletor + botão para os detalhes
+    (em vez de um botão por card)."""
     if not data_list:
         st.info("Nenhum registro pendente.")
         return
-    display_data = data_list[:limit] if limit else data_list
-    for item in display_data:
-        tipo = item.get('tipo', 'SCAN').upper()
-        servico = AWS_SERVICES.get(tipo, tipo)
-        estado = item.get('estado_visualizacao')
-        
-        if estado == 'CONFIRMADO':
-            border_color = "#FFD700" 
-            bg_tag = "#443a00"
-            status_txt = "⚠️ CONFIRMADO"
-        elif item.get('status_ia') == 'VULNERAVEL' or item.get('gravidade') == 'ALTA':
-            border_color = "#ff4b4b"
-            bg_tag = "#632020"
-            status_txt = "🚫 ALERTA"
-        else:
-            border_color = "#28a745"
-            bg_tag = "#1b3a1e"
-            status_txt = "✅ SEGURO"
-
-        with st.container():
-            st.markdown(f"""
-                <div style="border-left: 6px solid {border_color}; background-color: #262730; padding: 15px; border-radius: 8px; margin-bottom: 10px;">
-                    <div class="date-text">{format_date_br(item.get('data_evento'))}</div>
-                    <div style="margin-bottom: 8px;">
-                        <span style="background-color: {bg_tag}; padding: 2px 8px; border-radius: 4px; font-size: 0.7em; font-weight: bold;">{status_txt}</span>
-                        <strong style="margin-left: 5px;">{servico}</strong>
-                    </div>
-                    <div style="font-size: 0.9em; color: #ddd; margin-bottom: 10px;">
-                        ID: <code>{item.get('id_recurso')}</code>
-                    </div>
-                </div>
-            """, unsafe_allow_html=True)
-            if st.button(f"🔍 Ver Detalhes", key=f"btn_{item['id_recurso']}_{item.get('data_evento', '')}"):
-                show_details(item, is_cloud=is_cloud)
-            st.markdown("<br>", unsafe_allow_html=True)
+    start, end = paginate(view, len(data_list))
+    page_items = data_list[start:end]
+    st.markdown("".join(card_html(item) for item in page_items), unsafe_allow_html=True)
+
+    c_sel, c_btn = st.columns([4, 1])
+    pos = c_sel.selectbox(
+        "Recurso", range(len(page_items)), key=f"sel_{view}", label_visibility="collapsed",
+        format_func=lambda i: f"{format_date_br(page_items[i].get('data_evento'))} · {page_items[i].get('id_recurso')}",
+    )
+    if c_btn.button("🔍 Ver Detalhes", key=f"det_{view}") and pos is not None:
+        show_details(page_items[pos], is_cloud=is_cloud)
+
+def filter_by_index(items, index, filters):
+    """Interseção das posições indexadas para cada filtro ativo ({campo: [valores]})."""
+    positions = None
+    for field, values in filters.items():
+        if not values:
+            continue
+        matched = set()
+        for value in values:
+            matched.update(index[field].get(value, ()))
+        positions = matched if positions is None else positions & matched
+    if positions is None:
+        return items
+    return [items[pos] for pos in sorted(positions)]
+
+def index_caption(index):
+    counts = {field: {v: len(p) for v, p in values.items()} for field, values in index.items()}
+    alerts = counts['status_ia'].get('VULNERAVEL', 0)
+    confirmed = counts['estado_visualizacao'].get('CONFIRMADO', 0)
+    high = counts['gravidade'].get('ALTA', 0)
+    return f"🚫 {alerts} alerta(s) · 🔥 {high} de gravidade ALTA · ⚠️ {confirmed} confirmado(s)"
 
 # --- Abas ---
 if menu == "🚨 Monitoramento Cloud":
     st.header("🚨 Monitoramento Cloud (Pendentes)")
     
-    # FILTRO: Apenas o que NÃO foi confirmado e NÃO é IAC
-    active_cloud = [x for x in all_data if x.get('tipo') != 'IAC' and x.get('estado_visualizacao') != 'CONFIRMADO']
+    # Apenas o que NÃO foi confirmado e NÃO é IAC (índice esparso de pendentes)
+    active_cloud, _ = get_view('cloud', data_version())
+    
+    summary = get_summary(data_version())
     
     k1, k2, k3, k4 = st.columns(4)
-    k1.metric("Ameaças Ativas", len(active_cloud))
-    k2.metric("Críticos 🔥", len([x for x in active_cloud if x.get('gravidade') == 'ALTA']))
-    k3.metric("Auto-Remediados (IA) 🤖", len([x for x in all_data if x.get('auto_correcao') and 'remediado' in str(x.get('auto_correcao')).lower()]))
-    k4.metric("Validações Humanas ✅", len([x for x in all_data if x.get('estado_visualizacao') == 'CONFIRMADO']))
+    k1.metric("Ameaças Ativas", summary['ativas'])
+    k2.metric("Críticos 🔥", summary['criticos'])
+    k3.metric("Auto-Remediados (IA) 🤖", summary['auto_remediados'])
+    k4.metric("Validações Humanas ✅", summary['confirmados'])
     
     st.markdown("---")
-    render_cards(active_cloud, limit=5, is_cloud=True)
+    render_cards('cloud', active_cloud, is_cloud=True)
 
 elif menu == "💻 Pipeline CI/CD":
     st.header("💻 Pipeline CI/CD (Atividade Recente)")
-    pipe = [x for x in all_data if x.get('tipo') == 'IAC']
-    total = len(pipe)
-    reprovados = len([x for x in pipe if x.get('status_ia') == 'VULNERAVEL'])
+    pipe, _ = get_view('pipeline', data_version())
+    summary = get_summary(data_version())
+    total = summary['iac_total']
+    reprovados = summary['iac_reprovados']
     c1, c2, c3 = st.columns(3)
     c1.metric("Commits Analisados", total)
     c2.metric("Aprovados ✅", total - reprovados)
     c3.metric("Bloqueados 🚫", reprovados, delta=reprovados * -1, delta_color="inverse")
     st.markdown("---")
-    render_cards(pipe, limit=5)
+    render_cards('pipeline', pipe)
 
 elif menu == "📂 Histórico Geral":
     st.header("📂 Histórico Geral de Segurança")
-    st.columns(1)[0].metric("Total de Eventos Processados", len(all_data))
+    st.columns(1)[0].metric("Total de Eventos Processados", get_summary(data_version())['total_eventos'])
     st.markdown("---")
-    render_cards(all_data)
\ No newline at end of file
+    history, index = get_view('history', data_version())
+    label = lambda field: lambda v: f"{AWS_SERVICES.get(v, v) if field == 'tipo' else v} ({len(index[field][v])})"
+    f1, f2 = st.columns(2)
+    filters = {
+        'tipo': f1.multiselect("Serviço", sorted(index['tipo']), key="f_tipo", format_func=label('tipo')),
+        'gravidade': f2.multiselect("Gravidade", sorted(index['gravidade']), key="f_gravidade", format_func=label('gravidade')),
+    }
+    st.caption(index_caption(index))
+    render_cards('history', filter_by_index(history, index, filters))
@@ -0,0 +1,137 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Servidor HTTP local que imita o endpoint generateContent do Gemini.
+# Uso: python fake_gemini.py --port 8089 --latency 800 --error-rate 0.1
+# e aponte os clientes com SENTINEL_LLM_ENDPOINT=http://127.0.0.1:8089/v1beta
+
+# Respostas padrão por tipo de prompt (mesmo schema pedido em ask_gemini / analyze_iac)
+VERDICT_CLOUD = {
+    "status": "VULNERAVEL",
+    "risco": "Resposta simulada pelo fake_gemini",
+    "gravidade": "MEDIA",
+    "detalhe": "Veredito sintético para testes offline.",
+    "auto_correcao": "Nenhuma (simulação)."
+}
+VERDICT_IAC = {
+    "status": "APROVADO",
+    "risco": None,
+    "detalhe": "Veredito sintético para testes offline.",
+    "correcao": None
+}
+
+
+class FakeGeminiConfig:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=429, hang_rate=0.0,
+                 verdict_cloud=None, verdict_iac=None, drop_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # Requisições "penduradas" (nunca respondem a tempo) para exercitar o read timeout do cliente
+        self.hang_rate = hang_rate
+        self.verdict_cloud = verdict_cloud or VERDICT_CLOUD
+        self.verdict_iac = verdict_iac or VERDICT_IAC
+        # Prompts em lote: fração dos itens omitidos da resposta, para exercitar o split/retry do cliente
+        self.drop_rate = drop_rate
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def count(self, error=False):
+        with self._lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+
+
+def _batch_ids(prompt):
+    """Ids de um prompt em lote (objeto JSON logo após o marcador 'LOTE'). None se não for lote."""
+    marker = prompt.find('LOTE (objeto "id"')
+    if marker < 0:
+        return None
+    start = prompt.find('{', prompt.find(':', marker))
+    try:
+        return list(json.JSONDecoder().raw_decode(prompt[start:])[0])
+    except ValueError:
+        return None
+
+
+def _make_handler(config):
+    class FakeGeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, como o endpoint real
+        wbufsize = 64 * 1024  # resposta em um único write (sem atraso Nagle/delayed-ACK)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+            if random.random() < config.hang_rate:
+                delay = 10 * 60 * 1000
+            time.sleep(delay / 1000)
+
+            if random.random() < config.error_rate:
+                config.count(error=True)
+                return self._send(config.error_status, {"error": {"code": config.error_status, "message": "Erro injetado"}})
+
+            try:
+                prompt = json.loads(body)['contents'][0]['parts'][0]['text']
+            except Exception:
+                config.count(error=True)
+                return self._send(400, {"error": {"code": 400, "message": "Corpo inválido"}})
+
+            verdict = config.verdict_iac if 'APROVADO' in prompt else config.verdict_cloud
+            batch_ids = _batch_ids(prompt)
+            if batch_ids is not None:
+                verdict = [{"id": i, **verdict} for i in batch_ids if random.random() >= config.drop_rate]
+            text = f"```json\n{json.dumps(verdict, ensure_ascii=False)}\n```"
+            config.count()
+            self._send(200, {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]})
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return FakeGeminiHandler
+
+
+def start_fake_server(port=0, config=None):
+    """Sobe o servidor em uma thread daemon. Retorna (server, config, endpoint) para uso em testes/benchmarks."""
+    config = config or FakeGeminiConfig()
+    server = ThreadingHTTPServer(('127.0.0.1', port), _make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+    return server, config, endpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Gemini local para testes de latência offline")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0, help="Latência base em ms")
+    parser.add_argument('--jitter', type=float, default=0, help="Latência extra aleatória em ms")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fração de respostas com erro (0-1)")
+    parser.add_argument('--error-status', type=int, default=429)
+    parser.add_argument('--hang-rate', type=float, default=0.0, help="Fração de requisições que nunca respondem")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Fração de itens omitidos em respostas de lote")
+    args = parser.parse_args()
+
+    srv, cfg, url = start_fake_server(args.port, FakeGeminiConfig(
+        args.latency, args.jitter, args.error_rate, args.error_status, args.hang_rate, drop_rate=args.drop_rate,
+    ))
+    print(f"🤖 Fake Gemini ouvindo em {url} (SENTINEL_LLM_ENDPOINT={url})")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n📊 {cfg.requests} requisições, {cfg.errors} erros injetados.")
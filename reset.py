@@ -1,25 +1,204 @@
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from sentinel_schema import CONTROL_PREFIXES
+from sentinel_store import findings_only, without_prefixes
+
+# --- CONFIGURAÇÕES ---
+AWS_REGION = "us-east-2"
+DYNAMODB_TABLE = "SentinelMonitor"
+# Segmentos do scan paralelo: cada segmento pagina e apaga a sua fatia da tabela em uma thread própria
+RESET_SEGMENTS = int(os.environ.get('SENTINEL_RESET_SEGMENTS', '8'))
+RESET_MAX_RETRIES = int(os.environ.get('SENTINEL_RESET_MAX_RETRIES', '8'))
+RESET_BACKOFF = float(os.environ.get('SENTINEL_RESET_BACKOFF', '0.1'))
+
+THROTTLING_ERRORS = {'ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded'}
+
+
+def build_filter(tipo=None, older_than_days=None):
+    """Filtro pedido pelo usuário (None = sem filtros). O scan usa scan_filter, que protege os itens internos."""
+    conditions = []
+    if tipo:
+        conditions.append(Attr('tipo').eq(tipo))
+    if older_than_days is not None:
+        # data_evento é str(datetime), então a comparação de strings respeita a ordem cronológica
+        cutoff = str(datetime.now() - timedelta(days=older_than_days))
+        conditions.append(Attr('data_evento').lt(cutoff))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def scan_filter(filter_expression):
+    """Sem filtros: achados e resumos, preservando o estado operacional (leases, checkpoints, cota do LLM)
+    de invocações ainda em andamento. Com filtros: só achados."""
+    if filter_expression is None:
+        return without_prefixes(CONTROL_PREFIXES)
+    return findings_only(filter_expression)
+
+
+def _backoff(attempt):
+    time.sleep(RESET_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+def _call(operation, **kwargs):
+    """Chamada com backoff exponencial em throttling (além dos retries do próprio botocore)."""
+    for attempt in range(RESET_MAX_RETRIES + 1):
+        try:
+            return operation(**kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in THROTTLING_ERRORS or attempt == RESET_MAX_RETRIES:
+                raise
+            _backoff(attempt)
+
+
+def scan_segment(table, segment, total_segments, filter_expression=None, count_only=False):
+    """Páginas de um segmento do scan paralelo, seguindo LastEvaluatedKey até o fim."""
+    kwargs = {'Segment': segment, 'TotalSegments': total_segments}
+    if count_only:
+        kwargs['Select'] = 'COUNT'
+    else:
+        kwargs['ProjectionExpression'] = 'id_recurso'
+    if filter_expression is not None:
+        kwargs['FilterExpression'] = filter_expression
+    while True:
+        response = _call(table.scan, **kwargs)
+        yield response
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        kwargs['ExclusiveStartKey'] = last_key
+
+
+def delete_keys(table, keys):
+    """BatchWriteItem de exclusões (25 por requisição) reenviando UnprocessedItems com backoff."""
+    # O client do resource já converte tipos Python <-> formato do DynamoDB
+    client = table.meta.client
+    for start in range(0, len(keys), 25):
+        pending = [{'DeleteRequest': {'Key': key}} for key in keys[start:start + 25]]
+        for attempt in range(RESET_MAX_RETRIES + 1):
+            response = _call(client.batch_write_item, RequestItems={table.name: pending})
+            pending = (response.get('UnprocessedItems') or {}).get(table.name, [])
+            if not pending:
+                break
+            _backoff(attempt)
+        else:
+            raise RuntimeError(f"{len(pending)} exclusão(ões) não processada(s) após {RESET_MAX_RETRIES} tentativas")
+    return len(keys)
+
+
+def drop_and_recreate(table):
+    """Caminho rápido para zerar tudo: apaga a tabela e recria com o mesmo schema, GSIs, billing e TTL.
+    Segundos em vez de um scan + exclusão de cada item, e sem consumir capacidade de escrita."""
+    client = table.meta.client
+    desc = client.describe_table(TableName=table.name)['Table']
+    try:
+        ttl = client.describe_time_to_live(TableName=table.name)['TimeToLiveDescription']
+    except ClientError:
+        ttl = {}
+    billing = (desc.get('BillingModeSummary') or {}).get('BillingMode', 'PROVISIONED')
+
+    def throughput(source):
+        return {k: source['ProvisionedThroughput'][k] for k in ('ReadCapacityUnits', 'WriteCapacityUnits')}
+
+    params = {
+        'TableName': table.name,
+        'KeySchema': desc['KeySchema'],
+        'AttributeDefinitions': desc['AttributeDefinitions'],
+        'BillingMode': billing,
+    }
+    if billing == 'PROVISIONED':
+        params['ProvisionedThroughput'] = throughput(desc)
+    if desc.get('GlobalSecondaryIndexes'):
+        params['GlobalSecondaryIndexes'] = [
+            {
+                'IndexName': gsi['IndexName'],
+                'KeySchema': gsi['KeySchema'],
+                'Projection': gsi['Projection'],
+                **({'ProvisionedThroughput': throughput(gsi)} if billing == 'PROVISIONED' else {}),
+            }
+            for gsi in desc['GlobalSecondaryIndexes']
+        ]
+    if desc.get('StreamSpecification'):
+        params['StreamSpecification'] = desc['StreamSpecification']
+
+    print(f"💣 Apagando e recriando a tabela {table.name} ({desc.get('ItemCount', '?')} itens)...")
+    client.delete_table(TableName=table.name)
+    client.get_waiter('table_not_exists').wait(TableName=table.name)
+    client.create_table(**params)
+    client.get_waiter('table_exists').wait(TableName=table.name)
+    if ttl.get('TimeToLiveStatus') in ('ENABLED', 'ENABLING'):
+        client.update_time_to_live(
+            TableName=table.name,
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': ttl['AttributeName']},
+        )
+    print(f"✅ Tabela {table.name} recriada vazia.")
+
+
+def reset_dashboard(table=None, tipo=None, older_than_days=None, dry_run=False, drop=False, segments=RESET_SEGMENTS):
+    """Remove achados do Dashboard. Retorna quantos itens foram (ou seriam, em dry-run) removidos.
+
+    - Sem filtros: achados e resumos (leases, checkpoints e a cota do LLM ficam). Com `drop`, apaga e recria
+      a tabela inteira em vez de excluir item a item.
+    - `tipo` (ex: IAC, S3, SG) e/ou `older_than_days`: só os achados que casam com o filtro.
+    - `dry_run`: só conta (scan com Select=COUNT), sem apagar nada.
+    """
+    if table is None:
+        table = boto3.resource('dynamodb', region_name=AWS_REGION).Table(DYNAMODB_TABLE)
+    filter_expression = build_filter(tipo, older_than_days)
+    if drop and filter_expression is not None:
+        raise ValueError("--drop apaga a tabela inteira e não pode ser combinado com filtros.")
+
+    if drop and not dry_run:
+        drop_and_recreate(table)
+        return None
+
+    segments = max(1, segments)
+    print(f"🧹 Iniciando {'contagem' if dry_run else 'limpeza'} da tabela ({segments} segmento(s) em paralelo)...")
+    started = time.time()
+
+    def run_segment(segment):
+        count = 0
+        for page in scan_segment(table, segment, segments, scan_filter(filter_expression), count_only=dry_run):
+            if dry_run:
+                count += page.get('Count', 0)
+            else:
+                count += delete_keys(table, page.get('Items', []))
+        return count
+
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        count = sum(pool.map(run_segment, range(segments)))
+    elapsed = time.time() - started
+
+    if dry_run:
+        print(f"🔎 Dry-run: {count} registro(s) seriam removidos ({elapsed:.1f}s).")
+        return count
+    if count == 0:
+        print("✅ Nenhum registro para remover.")
+        return 0
+    if filter_expression is not None:
+        # Remoção parcial: os contadores do Dashboard precisam refletir o que sobrou
+        from sentinel_counters import reconcile
+        reconcile(table)
+    print(f"🚀 Sucesso! {count} registros removidos em {elapsed:.1f}s. Dashboard {'atualizado' if filter_expression is not None else 'zerado'}.")
+    return count
 
-def reset_dashboard():
-    dynamodb = boto3.resource('dynamodb', region_name="us-east-2")
-    table = dynamodb.Table('SentinelMonitor')
-    
-    print("🧹 Iniciando limpeza da tabela...")
-    
-    # Busca todos os itens (apenas as chaves para ser rápido)
-    scan = table.scan(ProjectionExpression='id_recurso')
-    items = scan.get('Items', [])
-    
-    if not items:
-        print("✅ A tabela já está vazia.")
-        return
-
-    # Apaga item por item
-    with table.batch_writer() as batch:
-        for item in items:
-            batch.delete_item(Key={'id_recurso': item['id_recurso']})
-            
-    print(f"🚀 Sucesso! {len(items)} registros removidos. Dashboard zerado.")
 
 if __name__ == "__main__":
-    reset_dashboard()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sentinel AI - Limpeza da tabela do Dashboard")
+    parser.add_argument('--tipo', help="Remove só achados deste tipo (ex: IAC, S3, SG)")
+    parser.add_argument('--older-than', type=float, metavar='DIAS', help="Remove só achados mais antigos que DIAS")
+    parser.add_argument('--dry-run', action='store_true', help="Só conta o que seria removido")
+    parser.add_argument('--drop', action='store_true', help="Zera tudo apagando e recriando a tabela (mais rápido)")
+    parser.add_argument('--segments', type=int, default=RESET_SEGMENTS, help="Segmentos do scan paralelo")
+    args = parser.parse_args()
+
+    reset_dashboard(tipo=args.tipo, older_than_days=args.older_than, dry_run=args.dry_run,
+                    drop=args.drop, segments=args.segments)
@@ -0,0 +1,237 @@
+import argparse
+import gzip
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+import sentinel_aws as aws
+import sentinel_telemetry as telemetry
+import sentinel_store as store
+from sentinel_schema import ANALYSIS_ATTR, TTL_ATTR, expand_item, list_fields
+
+# Arquivo frio dos achados antigos.
+# Achados mais velhos que SENTINEL_ARCHIVE_AFTER_DAYS vão para arquivos JSONL comprimidos, particionados por dia
+# (ano=AAAA/mes=MM/dia=DD/<execução>.jsonl.gz), no S3 ou em um diretório local. Só depois do upload o item
+# ganha o atributo de TTL, e o próprio DynamoDB o remove da tabela quente. O Histórico Geral lê daqui o que
+# já saiu da tabela.
+
+# --- CONFIGURAÇÕES ---
+# 's3://bucket/prefixo' ou um diretório local; vazio = arquivamento desligado
+ARCHIVE_URI = os.environ.get('SENTINEL_ARCHIVE', '')
+ARCHIVE_AFTER_DAYS = int(os.environ.get('SENTINEL_ARCHIVE_AFTER_DAYS', '90'))
+# Tempo entre arquivar e o TTL apagar o item (o DynamoDB ainda pode levar até ~48h para remover)
+ARCHIVE_TTL_GRACE_HOURS = int(os.environ.get('SENTINEL_ARCHIVE_TTL_GRACE_HOURS', '24'))
+# Meses consultados para trás (a partir do mês do corte) em busca de achados a arquivar
+ARCHIVE_MONTHS_BACK = int(os.environ.get('SENTINEL_ARCHIVE_MONTHS_BACK', '24'))
+DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'SentinelMonitor')
+
+FILE_SUFFIX = '.jsonl.gz'
+# Marcador da última execução, regravado ao fim de cada arquivamento: quem lê usa como versão do arquivo
+MANIFEST_KEY = '_ultima_execucao'
+
+
+class _LocalArchive:
+    """Substituto local do S3 (testes e execução offline)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def put(self, key, data):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Grava em um temporário e renomeia: um leitor nunca vê um arquivo pela metade
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def keys(self, prefix=''):
+        found = []
+        for folder, _, files in os.walk(os.path.join(self.root, prefix)):
+            for name in files:
+                if name.endswith(FILE_SUFFIX):
+                    found.append(os.path.relpath(os.path.join(folder, name), self.root).replace(os.sep, '/'))
+        return sorted(found)
+
+    def get(self, key):
+        with open(os.path.join(self.root, key), 'rb') as f:
+            return f.read()
+
+
+class _S3Archive:
+    def __init__(self, bucket, prefix='', region=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.s3 = aws.client('s3', region)
+
+    def put(self, key, data):
+        self.s3.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data, ContentType='application/x-ndjson',
+                           ContentEncoding='gzip')
+
+    def keys(self, prefix=''):
+        found = []
+        pages = self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefix + prefix)
+        for page in pages:
+            found.extend(o['Key'][len(self.prefix):] for o in page.get('Contents', []) if o['Key'].endswith(FILE_SUFFIX))
+        return sorted(found)
+
+    def get(self, key):
+        return self.s3.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body'].read()
+
+
+def open_archive(uri=ARCHIVE_URI):
+    """Backend do arquivo a partir da URI. None = arquivamento desligado."""
+    if not uri:
+        return None
+    if uri.startswith('s3://'):
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        return _S3Archive(bucket, prefix)
+    return _LocalArchive(uri)
+
+
+def partition(data_evento):
+    """Partição de um achado pela data do evento (estilo Hive, legível pelo Athena)."""
+    day = str(data_evento)[:10]
+    return f"ano={day[:4]}/mes={day[5:7]}/dia={day[8:10]}"
+
+
+def _partition_day(key):
+    parts = dict(p.split('=', 1) for p in key.split('/')[:-1] if '=' in p)
+    return f"{parts.get('ano')}-{parts.get('mes')}-{parts.get('dia')}"
+
+
+def encode_records(items):
+    lines = (json.dumps(expand_item(item), ensure_ascii=False, default=str) for item in items)
+    return gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'))
+
+
+def decode_records(data):
+    return [json.loads(line) for line in gzip.decompress(data).decode('utf-8').splitlines() if line.strip()]
+
+
+def _mark_expiring(table, items, expires_at):
+    """Grava o TTL nos itens já arquivados. Retorna quantos foram marcados."""
+    marked = 0
+    for item in items:
+        try:
+            table.update_item(
+                Key={'id_recurso': item['id_recurso']},
+                UpdateExpression=f"set {TTL_ATTR} = :ttl",
+                ConditionExpression="attribute_exists(id_recurso)",
+                ExpressionAttributeValues={':ttl': expires_at},
+            )
+            marked += 1
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    return marked
+
+
+def archive_findings(table, archive, older_than_days=ARCHIVE_AFTER_DAYS, months_back=ARCHIVE_MONTHS_BACK,
+                     run_id=None, now=None):
+    """Copia para o arquivo os achados mais velhos que `older_than_days` e agenda a remoção via TTL.
+
+    Idempotente por construção: um item só recebe o TTL depois que o arquivo da sua partição foi gravado.
+    Se a execução cair no meio, a próxima arquiva de novo os que ficaram sem TTL (quem lê descarta
+    registros repetidos pelo id_recurso).
+    """
+    now = now or datetime.now()
+    run_id = run_id or f"{now.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    cutoff = str(now - timedelta(days=older_than_days))
+    with telemetry.invocation('archive_findings'):
+        items = store.get_archivable(table, cutoff, months_back)
+        by_day = {}
+        for item in items:
+            by_day.setdefault(partition(item['data_evento']), []).append(item)
+
+        expires_at = int(time.time()) + ARCHIVE_TTL_GRACE_HOURS * 3600
+        archived = 0
+        for part, day_items in sorted(by_day.items()):
+            data = encode_records(day_items)
+            archive.put(f"{part}/{run_id}{FILE_SUFFIX}", data)
+            telemetry.incr('arquivo_bytes', len(data))
+            archived += _mark_expiring(table, day_items, expires_at)
+        telemetry.incr('achados_arquivados', archived)
+        if by_day:
+            archive.put(MANIFEST_KEY, run_id.encode('utf-8'))
+
+    print(f"🗄️ {archived} achado(s) anteriores a {cutoff[:10]} arquivados em {len(by_day)} partição(ões); "
+          f"saem da tabela pelo TTL ({TTL_ATTR}).")
+    return {'arquivados': archived, 'particoes': len(by_day), 'corte': cutoff, 'execucao': run_id}
+
+
+def archive_version(archive):
+    """Execução que gravou por último no arquivo (uma única leitura pequena). None se ainda não há marcador."""
+    try:
+        return archive.get(MANIFEST_KEY).decode('utf-8')
+    except FileNotFoundError:
+        return None
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+        return None
+
+
+def iter_records(archive):
+    """Todos os registros do arquivo, partição por partição (reconciliação de contadores)."""
+    seen = set()
+    for key in archive.keys():
+        for record in decode_records(archive.get(key)):
+            if record['id_recurso'] not in seen:
+                seen.add(record['id_recurso'])
+                yield record
+
+
+def read_history(archive, limit, exclude=()):
+    """Achados arquivados, do mais recente para o mais antigo, só com os campos de lista.
+    Cada registro leva a chave do arquivo de origem (`arquivo`) para o relatório detalhado."""
+    by_day = {}
+    for key in archive.keys():
+        by_day.setdefault(_partition_day(key), []).append(key)
+    records, seen = [], set(exclude)
+    for day in sorted(by_day, reverse=True):
+        day_records = []
+        for key in by_day[day]:
+            for record in decode_records(archive.get(key)):
+                if record['id_recurso'] in seen:
+                    continue
+                seen.add(record['id_recurso'])
+                day_records.append({**list_fields(record), 'arquivo': key})
+        day_records.sort(key=lambda r: r.get('data_evento', ''), reverse=True)
+        records.extend(day_records)
+        if len(records) >= limit:
+            break
+    return records[:limit]
+
+
+def get_analysis(archive, key, item_id):
+    """Análise completa de um achado arquivado (relê só o arquivo de origem)."""
+    for record in decode_records(archive.get(key)):
+        if record['id_recurso'] == item_id:
+            return record.get(ANALYSIS_ATTR)
+    return None
+
+
+def archive_handler(event, context):
+    """Entrada agendada (EventBridge Scheduler). O evento pode trazer 'dias' para sobrescrever o corte."""
+    archive = open_archive()
+    if archive is None:
+        return {'status': 'DESLIGADO', 'detalhe': 'SENTINEL_ARCHIVE não configurado.'}
+    days = int((event or {}).get('dias', ARCHIVE_AFTER_DAYS))
+    return archive_findings(aws.table(DYNAMODB_TABLE), archive, days)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sentinel AI - Arquivamento de achados antigos")
+    parser.add_argument('--archive', default=ARCHIVE_URI, help="'s3://bucket/prefixo' ou um diretório local")
+    parser.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS, help="Idade mínima do achado arquivado")
+    parser.add_argument('--months-back', type=int, default=ARCHIVE_MONTHS_BACK, help="Meses consultados antes do corte")
+    args = parser.parse_args()
+
+    target = open_archive(args.archive)
+    if target is None:
+        print("Uso: python sentinel_archive.py --archive s3://bucket/prefixo (ou SENTINEL_ARCHIVE)")
+        exit(1)
+    archive_findings(aws.table(DYNAMODB_TABLE, store.AWS_REGION), target, args.older_than_days, args.months_back)
@@ -0,0 +1,52 @@
+import threading
+import sentinel_telemetry as telemetry
+
+# Clientes/recursos AWS criados sob demanda e memoizados no escopo do módulo.
+# Cada serviço só paga o custo de construção (modelos do botocore, credenciais) no primeiro uso,
+# e o objeto é reaproveitado nas invocações quentes da Lambda.
+
+# Reentrante: table() constrói o resource() dentro da própria seção crítica
+_lock = threading.RLock()
+_cache = {}
+
+
+def _memoized(key, factory):
+    obj = _cache.get(key)
+    if obj is None:
+        with _lock:
+            obj = _cache.get(key)
+            if obj is None:
+                obj = _cache[key] = factory()
+    return obj
+
+
+def client(service, region=None):
+    def factory():
+        import boto3
+        return telemetry.watch_boto3(boto3.client(service, region_name=region))
+    return _memoized(('client', service, region), factory)
+
+
+def resource(service, region=None):
+    def factory():
+        import boto3
+        obj = boto3.resource(service, region_name=region)
+        telemetry.watch_boto3(obj.meta.client)
+        return obj
+    return _memoized(('resource', service, region), factory)
+
+
+def table(name, region=None):
+    return _memoized(('table', name, region), lambda: resource('dynamodb', region).Table(name))
+
+
+def override(kind, name, obj, region=None):
+    """Substitui um cliente/recurso/tabela (ex: stubs em benchmarks). kind: 'client', 'resource' ou 'table'."""
+    with _lock:
+        _cache[(kind, name, region)] = obj
+
+
+def reset():
+    """Descarta tudo que foi memoizado (simula um container novo)."""
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import sentinel_aws as aws
+import sentinel_telemetry as telemetry
+
+# --- CONFIGURAÇÕES ---
+# Backend persistente: 'memory' (só o tier em processo), 'dynamodb' ou 'sqlite'
+CACHE_BACKEND = os.environ.get('SENTINEL_CACHE_BACKEND', 'memory').lower()
+CACHE_TTL = int(os.environ.get('SENTINEL_CACHE_TTL', '86400'))
+CACHE_MAX_ITEMS = int(os.environ.get('SENTINEL_CACHE_MAX_ITEMS', '1024'))
+CACHE_TABLE = os.environ.get('SENTINEL_CACHE_TABLE', 'SentinelVerdictCache')
+CACHE_SQLITE_PATH = os.environ.get('SENTINEL_CACHE_SQLITE', '/tmp/sentinel_cache.db')
+
+# Versão do "contrato" de veredito. Mudou o prompt? Incrementa e o cache antigo é ignorado.
+CACHE_VERSION = 'v2'
+
+# Campos que mudam a cada evento mas não alteram o veredito de segurança
+VOLATILE_KEYS = {
+    'eventTime', 'eventID', 'requestID', 'sharedEventID', 'sourceIPAddress',
+    'userAgent', 'tlsDetails', 'sessionContext', 'ResponseMetadata', 'creationDate',
+}
+
+
+def canonicalize(data):
+    """Remove campos voláteis recursivamente para que configs iguais gerem o mesmo hash."""
+    if isinstance(data, dict):
+        return {k: canonicalize(v) for k, v in data.items() if k not in VOLATILE_KEYS}
+    if isinstance(data, list):
+        return [canonicalize(v) for v in data]
+    return data
+
+
+def make_key(namespace, data):
+    """Hash SHA-256 do JSON canônico (chaves ordenadas) prefixado pelo namespace."""
+    canonical = json.dumps(canonicalize(data), sort_keys=True, separators=(',', ':'), default=str)
+    digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    return f"{CACHE_VERSION}:{namespace}:{digest}"
+
+
+class _MemoryTier:
+    """LRU com TTL. Vive no escopo do módulo, então sobrevive a invocações 'quentes' da Lambda."""
+
+    def __init__(self, max_items, ttl):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, verdict = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return verdict
+
+    def put(self, key, verdict, expires_at=None):
+        with self._lock:
+            self._data[key] = (expires_at or time.time() + self.ttl, verdict)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+
+class _DynamoTier:
+    """Tier compartilhado entre containers. A expiração fica a cargo do TTL nativo (atributo 'expira_em')."""
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+
+    @property
+    def table(self):
+        # Criada no primeiro uso, não no import do módulo
+        return aws.table(self.table_name, os.environ.get('AWS_REGION'))
+
+    def get(self, key):
+        item = self.table.get_item(Key={'chave': key}).get('Item')
+        # O TTL do DynamoDB pode levar horas para remover o item, então conferimos aqui também
+        if not item or int(item.get('expira_em', 0)) < time.time():
+            return None
+        return json.loads(item['veredito']), int(item['expira_em'])
+
+    def put(self, key, verdict, expires_at):
+        self.table.put_item(Item={'chave': key, 'veredito': json.dumps(verdict), 'expira_em': int(expires_at)})
+
+
+class _SqliteTier:
+    """Substituto local do DynamoDB, útil no CI e em testes offline."""
+
+    def __init__(self, path, max_items):
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts (chave TEXT PRIMARY KEY, veredito TEXT, expira_em INTEGER, usado_em REAL)"
+        )
+        self.conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT veredito, expira_em FROM verdicts WHERE chave = ? AND expira_em >= ?", (key, int(time.time()))
+            ).fetchone()
+            if not row:
+                return None
+            self.conn.execute("UPDATE verdicts SET usado_em = ? WHERE chave = ?", (time.time(), key))
+            self.conn.commit()
+            return json.loads(row[0]), row[1]
+
+    def put(self, key, verdict, expires_at):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)",
+                (key, json.dumps(verdict), int(expires_at), time.time()),
+            )
+            # Eviction: expirados primeiro, depois os menos usados recentemente
+            self.conn.execute("DELETE FROM verdicts WHERE expira_em < ?", (int(time.time()),))
+            self.conn.execute(
+                "DELETE FROM verdicts WHERE chave NOT IN (SELECT chave FROM verdicts ORDER BY usado_em DESC LIMIT ?)",
+                (self.max_items,),
+            )
+            self.conn.commit()
+
+
+class VerdictCache:
+    """Cache de vereditos endereçado por conteúdo, com tier em memória + tier persistente opcional."""
+
+    def __init__(self, backend=CACHE_BACKEND, ttl=CACHE_TTL, max_items=CACHE_MAX_ITEMS):
+        self.ttl = ttl
+        self.memory = _MemoryTier(max_items, ttl)
+        self.persistent = None
+        self._stats_lock = threading.Lock()
+        self.stats = {'hits_memoria': 0, 'hits_persistente': 0, 'misses': 0}
+        try:
+            if backend == 'dynamodb':
+                self.persistent = _DynamoTier(CACHE_TABLE)
+            elif backend == 'sqlite':
+                self.persistent = _SqliteTier(CACHE_SQLITE_PATH, max_items)
+        except Exception as e:
+            print(f"⚠️ Aviso: Cache persistente indisponível ({backend}), usando apenas memória: {e}")
+
+    def _count(self, stat):
+        with self._stats_lock:
+            self.stats[stat] += 1
+        telemetry.incr(f"cache_{stat}")
+
+    def get(self, namespace, data):
+        key = make_key(namespace, data)
+        verdict = self.memory.get(key)
+        if verdict is not None:
+            self._count('hits_memoria')
+            return verdict
+        if self.persistent:
+            try:
+                found = self.persistent.get(key)
+            except Exception as e:
+                print(f"⚠️ Aviso: Falha ao ler cache persistente: {e}")
+                found = None
+            if found:
+                verdict, expires_at = found
+                self.memory.put(key, verdict, expires_at)
+                self._count('hits_persistente')
+                return verdict
+        self._count('misses')
+        return None
+
+    def put(self, namespace, data, verdict):
+        # Falhas da IA (ERRO_IA, ERRO_API...) nunca são cacheadas
+        if not isinstance(verdict, dict) or str(verdict.get('status', 'ERRO')).startswith('ERRO'):
+            return
+        key = make_key(namespace, data)
+        expires_at = time.time() + self.ttl
+        self.memory.put(key, verdict, expires_at)
+        if self.persistent:
+            try:
+                self.persistent.put(key, verdict, expires_at)
+            except Exception as e:
+                print(f"⚠️ Aviso: Falha ao gravar cache persistente: {e}")
+
+    def get_or_compute(self, namespace, data, compute):
+        """Retorna o veredito cacheado ou chama `compute(data)` (ex: ask_gemini) e guarda o resultado."""
+        verdict = self.get(namespace, data)
+        if verdict is not None:
+            return verdict
+        verdict = compute(data)
+        self.put(namespace, data, verdict)
+        return verdict
+
+    def get_or_compute_many(self, namespace, items, compute_many):
+        """Versão em lote: `items` é {chave: dado}. Os misses vão juntos para `compute_many({chave: dado})`,
+        que retorna {chave: veredito}. Dados idênticos entre si são enviados uma única vez."""
+        results, pending = {}, {}
+        for key, data in items.items():
+            verdict = self.get(namespace, data)
+            if verdict is not None:
+                results[key] = verdict
+            else:
+                pending.setdefault(make_key(namespace, data), []).append(key)
+        if not pending:
+            return results
+
+        computed = compute_many({keys[0]: items[keys[0]] for keys in pending.values()})
+        for keys in pending.values():
+            verdict = computed.get(keys[0])
+            self.put(namespace, items[keys[0]], verdict)
+            for key in keys:
+                results[key] = verdict
+        return results
+
+    def report(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        hits = stats['hits_memoria'] + stats['hits_persistente']
+        total = hits + stats['misses']
+        stats['hit_rate'] = round(hits / total, 3) if total else 0.0
+        return stats
+
+
+# Instância global: compartilhada entre invocações quentes e entre lambda/scan no mesmo processo
+verdict_cache = VerdictCache()
@@ -0,0 +1,146 @@
+import itertools
+import sys
+from collections import Counter, defaultdict
+from sentinel_schema import SUMMARY_PREFIX, is_finding
+
+# --- CONFIGURAÇÕES ---
+AWS_REGION = "us-east-2"
+DYNAMODB_TABLE = "SentinelMonitor"
+
+# Itens de resumo vivem na própria tabela de achados, com prefixo reservado e sem atributos de GSI
+SUMMARY_TOTAL = f'{SUMMARY_PREFIX}TOTAL'
+
+COUNTERS = (
+    'total_eventos',    # Total de Eventos Processados
+    'ativas',           # Ameaças Ativas (cloud pendente)
+    'criticos',         # Críticos (cloud pendente com gravidade ALTA)
+    'auto_remediados',  # Auto-Remediados (IA)
+    'confirmados',      # Validações Humanas
+    'iac_total',        # Commits Analisados
+    'iac_reprovados',   # Bloqueados
+)
+
+
+def is_summary_key(item_id):
+    return str(item_id).startswith(SUMMARY_PREFIX)
+
+
+def write_deltas(item):
+    """Incrementos gerados pela gravação de um achado (mesma semântica das métricas do Dashboard)."""
+    deltas = Counter(total_eventos=1)
+    if item.get('tipo') == 'IAC':
+        deltas['iac_total'] += 1
+        if item.get('status_ia') == 'VULNERAVEL':
+            deltas['iac_reprovados'] += 1
+    elif item.get('estado_visualizacao') != 'CONFIRMADO':
+        deltas['ativas'] += 1
+        if item.get('gravidade') == 'ALTA':
+            deltas['criticos'] += 1
+    if item.get('auto_correcao') and 'remediado' in str(item.get('auto_correcao')).lower():
+        deltas['auto_remediados'] += 1
+    return deltas
+
+
+def confirm_deltas(old_item):
+    """Incrementos gerados quando um humano confirma a remediação de um achado pendente."""
+    deltas = Counter(confirmados=1)
+    if old_item.get('tipo') != 'IAC':
+        deltas['ativas'] -= 1
+        if old_item.get('gravidade') == 'ALTA':
+            deltas['criticos'] -= 1
+    return deltas
+
+
+def _day_key(data_evento):
+    return f"{SUMMARY_PREFIX}{str(data_evento)[:10]}"
+
+
+def _apply(table, key, deltas):
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    table.update_item(
+        Key={'id_recurso': key},
+        UpdateExpression="ADD " + ", ".join(f"#{k} :{k}" for k in deltas),
+        ExpressionAttributeNames={f"#{k}": k for k in deltas},
+        ExpressionAttributeValues={f":{k}": v for k, v in deltas.items()},
+    )
+
+
+def _apply_sharded(table, deltas_by_day):
+    """Contador atômico (ADD) no item TOTAL e no shard diário de cada dia afetado."""
+    total = Counter()
+    for day_key, deltas in deltas_by_day.items():
+        total.update(deltas)
+        _apply(table, day_key, deltas)
+    _apply(table, SUMMARY_TOTAL, total)
+
+
+def record_items(table, items):
+    """Atualiza os contadores após gravar um ou mais achados. Um update por shard, não por item."""
+    try:
+        by_day = defaultdict(Counter)
+        for item in items:
+            by_day[_day_key(item.get('data_evento'))].update(write_deltas(item))
+        _apply_sharded(table, by_day)
+    except Exception as e:
+        # Contador desatualizado não pode derrubar a gravação; a reconciliação corrige depois
+        print(f"⚠️ Aviso: Falha ao atualizar contadores: {e}")
+
+
+def record_confirmation(table, old_item):
+    try:
+        _apply_sharded(table, {_day_key(old_item.get('data_evento')): confirm_deltas(old_item)})
+    except Exception as e:
+        print(f"⚠️ Aviso: Falha ao atualizar contadores: {e}")
+
+
+def get_summary(table, key=SUMMARY_TOTAL):
+    """Lê um item de resumo (TOTAL ou RESUMO#AAAA-MM-DD) com todos os contadores como int."""
+    item = table.get_item(Key={'id_recurso': key}).get('Item', {})
+    return {name: int(item.get(name, 0)) for name in COUNTERS}
+
+
+def reconcile(table):
+    """Reconstrói todos os contadores a partir dos achados (scan paginado) e sobrescreve os resumos.
+    Achados que já saíram da tabela para o arquivo (sentinel_archive) também contam."""
+    from sentinel_store import scan_all
+    from sentinel_archive import open_archive, iter_records
+
+    print("🧮 Reconciliando contadores a partir da tabela de achados...")
+    by_day = defaultdict(Counter)
+    stale_keys = set()
+    seen = set()
+    archive = open_archive()
+    for item in itertools.chain(scan_all(table), iter_records(archive) if archive else ()):
+        if is_summary_key(item['id_recurso']):
+            stale_keys.add(item['id_recurso'])
+            continue
+        if not is_finding(item) or item['id_recurso'] in seen:
+            # Itens internos (checkpoints, leases, cota) não são achados; arquivados ainda na tabela contam uma vez
+            continue
+        seen.add(item['id_recurso'])
+        deltas = write_deltas({**item, 'estado_visualizacao': None})
+        if item.get('estado_visualizacao') == 'CONFIRMADO':
+            deltas.update(confirm_deltas(item))
+        by_day[_day_key(item.get('data_evento'))].update(deltas)
+
+    total = Counter()
+    with table.batch_writer() as batch:
+        for day_key, deltas in by_day.items():
+            total.update(deltas)
+            batch.put_item(Item={'id_recurso': day_key, **{k: deltas.get(k, 0) for k in COUNTERS}})
+            stale_keys.discard(day_key)
+        batch.put_item(Item={'id_recurso': SUMMARY_TOTAL, **{k: total.get(k, 0) for k in COUNTERS}})
+        stale_keys.discard(SUMMARY_TOTAL)
+        for key in stale_keys:
+            batch.delete_item(Key={'id_recurso': key})
+    print(f"✅ Contadores reconciliados: {dict((k, total.get(k, 0)) for k in COUNTERS)}")
+
+
+if __name__ == "__main__":
+    if '--reconcile' not in sys.argv:
+        print("Uso: python sentinel_counters.py --reconcile")
+        sys.exit(1)
+    import boto3
+    reconcile(boto3.resource('dynamodb', region_name=AWS_REGION).Table(DYNAMODB_TABLE))
@@ -0,0 +1,282 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+import sentinel_aws as aws
+from sentinel_counters import SUMMARY_PREFIX, SUMMARY_TOTAL
+from sentinel_schema import LIST_FIELDS, is_finding, list_fields
+
+# Feed de mudanças da tabela de achados para o Dashboard.
+# Um leitor em background (DynamoDB Streams, ou um arquivo JSONL como substituto local) mantém uma
+# visão materializada em memória compartilhada por todas as sessões. As sessões só re-renderizam
+# quando a versão da visão muda, em vez de reler a tabela a cada 10 segundos.
+
+# --- CONFIGURAÇÕES ---
+# 'auto' (stream se a tabela tiver um, senão polling), 'dynamodb', 'file' ou 'off'
+FEED_MODE = os.environ.get('SENTINEL_FEED', 'auto').lower()
+# Substituto local do stream: os writers anexam cada mudança neste JSONL e o Dashboard o acompanha
+FEED_FILE = os.environ.get('SENTINEL_FEED_FILE', '')
+FEED_POLL_SECONDS = float(os.environ.get('SENTINEL_FEED_POLL', '1'))
+FEED_MAX_ITEMS = int(os.environ.get('SENTINEL_FEED_MAX_ITEMS', '2000'))
+# Intervalo para redescobrir shards (splits criam shards filhos)
+FEED_SHARD_REFRESH = float(os.environ.get('SENTINEL_FEED_SHARD_REFRESH', '60'))
+
+_deserializer = TypeDeserializer()
+_file_lock = threading.Lock()
+
+
+def publish(event_name, item):
+    """Espelha uma gravação no JSONL do substituto local (no-op sem SENTINEL_FEED_FILE).
+    Na AWS quem entrega as mudanças é o próprio DynamoDB Streams."""
+    if not FEED_FILE:
+        return
+    line = json.dumps({'eventName': event_name, 'item': list_fields(item)}, default=str, ensure_ascii=False) + '\n'
+    try:
+        with _file_lock, open(FEED_FILE, 'a', encoding='utf-8') as f:
+            f.write(line)
+    except Exception as e:
+        print(f"⚠️ Aviso: Não foi possível publicar no feed local: {e}")
+
+
+class FindingsView:
+    """Achados recentes em memória + versão monotônica. Itens pendentes nunca são descartados;
+    os demais saem do mais antigo para o mais novo acima de `max_items`."""
+
+    def __init__(self, max_items=FEED_MAX_ITEMS):
+        self.max_items = max_items
+        self.items = {}
+        self.summary = {}
+        self.version = 0
+        self._cond = threading.Condition()
+
+    def _upsert(self, event_name, key, item):
+        if event_name == 'REMOVE':
+            # Remoção de algo que a visão não tem (ex: lease LEASE# solto) não muda nada na tela
+            return self.items.pop(key, None) is not None or self.summary.pop(key, None) is not None
+        if str(key).startswith(SUMMARY_PREFIX):
+            self.summary[key] = item
+        elif is_finding(item):
+            # A análise comprimida fica fora da memória: o relatório detalhado a busca sob demanda
+            self.items[key] = list_fields(item)
+        else:
+            # Itens internos (checkpoints, leases, cota do LLM) não são achados
+            return False
+        return True
+
+    def apply(self, event_name, key, item=None):
+        with self._cond:
+            if self._upsert(event_name, key, item):
+                self._evict()
+                self.version += 1
+                self._cond.notify_all()
+
+    def load(self, items):
+        """Carga inicial (bootstrap), uma única versão nova."""
+        with self._cond:
+            for item in items:
+                self._upsert('INSERT', item['id_recurso'], item)
+            self._evict()
+            self.version += 1
+            self._cond.notify_all()
+
+    def _evict(self):
+        excess = len(self.items) - self.max_items
+        if excess <= 0:
+            return
+        candidates = sorted((i.get('data_evento', ''), k) for k, i in self.items.items() if 'pendente' not in i)
+        for _, key in candidates[:excess]:
+            del self.items[key]
+
+    def wait_for(self, version, timeout):
+        """Long-poll: bloqueia até a versão passar de `version` (ou até o timeout). Retorna a versão atual."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def snapshot(self, view, limit=None):
+        """Itens de uma view do Dashboard, do mais recente para o mais antigo."""
+        with self._cond:
+            items = list(self.items.values())
+        if view == 'cloud':
+            items = [i for i in items if 'pendente' in i]
+        elif view == 'pipeline':
+            items = [i for i in items if i.get('tipo') == 'IAC']
+        items.sort(key=lambda i: i.get('data_evento', ''), reverse=True)
+        return items[:limit] if limit else items
+
+    def counters(self, key=SUMMARY_TOTAL):
+        with self._cond:
+            return self.summary.get(key)
+
+
+def bootstrap(view, table, limit):
+    """Estado inicial da visão a partir dos GSIs (mesmas consultas do Dashboard em modo polling)."""
+    import sentinel_store as store
+    items = store.get_history(table, limit, datetime.now().strftime('%Y-%m'), fields=LIST_FIELDS)
+    items += store.get_pending_cloud(table, fields=LIST_FIELDS)
+    item = table.get_item(Key={'id_recurso': SUMMARY_TOTAL}).get('Item')
+    view.load(items + ([item] if item else []))
+
+
+class DynamoStreamFeed(threading.Thread):
+    """Lê os shards do DynamoDB Streams da tabela e aplica INSERT/MODIFY/REMOVE na visão."""
+
+    def __init__(self, view, table, stream_arn, region=None, poll_seconds=FEED_POLL_SECONDS):
+        super().__init__(daemon=True, name='sentinel-feed')
+        self.view = view
+        self.table = table
+        self.stream_arn = stream_arn
+        self.streams = aws.client('dynamodbstreams', region)
+        self.poll_seconds = poll_seconds
+        self.iterators = {}
+        self.known_shards = set()
+        self._last_refresh = 0.0
+
+    def _shards(self):
+        shards, kwargs = [], {'StreamArn': self.stream_arn}
+        while True:
+            desc = self.streams.describe_stream(**kwargs)['StreamDescription']
+            shards.extend(desc.get('Shards', []))
+            if not desc.get('LastEvaluatedShardId'):
+                return shards
+            kwargs['ExclusiveStartShardId'] = desc['LastEvaluatedShardId']
+
+    def prime(self):
+        """Iteradores LATEST nos shards abertos. Chamado antes do bootstrap para não perder
+        gravações feitas entre a carga inicial e o início da leitura (reaplicar é idempotente)."""
+        self._refresh_shards(initial=True)
+
+    def _refresh_shards(self, initial=False):
+        for shard in self._shards():
+            shard_id = shard['ShardId']
+            if shard_id in self.known_shards:
+                continue
+            self.known_shards.add(shard_id)
+            closed = 'EndingSequenceNumber' in shard.get('SequenceNumberRange', {})
+            if initial and closed:
+                continue
+            # Shards que surgem depois (splits) são lidos desde o início
+            self.iterators[shard_id] = self.streams.get_shard_iterator(
+                StreamArn=self.stream_arn, ShardId=shard_id,
+                ShardIteratorType='LATEST' if initial else 'TRIM_HORIZON',
+            )['ShardIterator']
+        self._last_refresh = time.time()
+
+    def _apply(self, record):
+        data = record['dynamodb']
+        key = _deserializer.deserialize(data['Keys']['id_recurso'])
+        if record['eventName'] == 'REMOVE':
+            self.view.apply('REMOVE', key)
+            return
+        if 'NewImage' in data:
+            item = {k: _deserializer.deserialize(v) for k, v in data['NewImage'].items()}
+        else:
+            # Stream KEYS_ONLY: busca o item atual
+            item = self.table.get_item(Key={'id_recurso': key}).get('Item')
+        self.view.apply(record['eventName'], key, item)
+
+    def poll_once(self):
+        if time.time() - self._last_refresh > FEED_SHARD_REFRESH:
+            self._refresh_shards()
+        for shard_id, iterator in list(self.iterators.items()):
+            try:
+                response = self.streams.get_records(ShardIterator=iterator, Limit=1000)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ExpiredIteratorException':
+                    raise
+                print(f"⚠️ Iterador do shard {shard_id} expirou; retomando do mais recente.")
+                self.iterators[shard_id] = self.streams.get_shard_iterator(
+                    StreamArn=self.stream_arn, ShardId=shard_id, ShardIteratorType='LATEST',
+                )['ShardIterator']
+                continue
+            for record in response.get('Records', []):
+                self._apply(record)
+            if response.get('NextShardIterator'):
+                self.iterators[shard_id] = response['NextShardIterator']
+            else:
+                # Shard fechado e lido até o fim
+                del self.iterators[shard_id]
+
+    def run(self):
+        while True:
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"⚠️ Aviso: Falha ao ler o stream da tabela: {e}")
+                time.sleep(self.poll_seconds * 5)
+            time.sleep(self.poll_seconds)
+
+
+class FileFeed(threading.Thread):
+    """Substituto local do stream: acompanha o JSONL escrito por `publish` (como um tail -f)."""
+
+    def __init__(self, view, path, poll_seconds=FEED_POLL_SECONDS):
+        super().__init__(daemon=True, name='sentinel-feed-file')
+        self.view = view
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.offset = 0
+        self._partial = ''
+
+    def poll_once(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                f.seek(self.offset)
+                chunk = f.read()
+                self.offset = f.tell()
+        except FileNotFoundError:
+            return
+        lines = (self._partial + chunk).split('\n')
+        # A última linha pode estar sendo escrita ainda
+        self._partial = lines.pop()
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                item = record.get('item') or {}
+                self.view.apply(record['eventName'], item.get('id_recurso'), item)
+            except Exception as e:
+                print(f"⚠️ Aviso: Linha inválida no feed local: {e}")
+
+    def run(self):
+        while True:
+            self.poll_once()
+            time.sleep(self.poll_seconds)
+
+
+def start_feed(table, mode=FEED_MODE, max_items=FEED_MAX_ITEMS):
+    """Cria a visão materializada e o leitor em background. None = sem feed (o Dashboard volta ao polling)."""
+    if mode == 'off':
+        return None
+    view = FindingsView(max_items)
+    if mode == 'file' or (mode == 'auto' and FEED_FILE):
+        if not FEED_FILE:
+            raise ValueError("SENTINEL_FEED=file exige SENTINEL_FEED_FILE.")
+        reader = FileFeed(view, FEED_FILE)
+        reader.poll_once()
+        reader.start()
+        print(f"📡 Feed local ativo: {FEED_FILE}")
+        return view
+
+    try:
+        stream_arn = table.latest_stream_arn
+    except Exception as e:
+        if mode == 'auto':
+            print(f"⚠️ Aviso: Não foi possível consultar o stream da tabela ({e}). Usando polling.")
+            return None
+        raise
+    if not stream_arn:
+        if mode == 'auto':
+            print("ℹ️ Tabela sem DynamoDB Streams (python sentinel_store.py --migrate habilita). Usando polling.")
+            return None
+        raise ValueError(f"A tabela {table.name} não tem DynamoDB Streams habilitado.")
+    reader = DynamoStreamFeed(view, table, stream_arn, table.meta.client.meta.region_name)
+    reader.prime()
+    bootstrap(view, table, max_items)
+    reader.start()
+    print(f"📡 Feed do DynamoDB Streams ativo: {stream_arn}")
+    return view
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from botocore.exceptions import ClientError
+import sentinel_telemetry as telemetry
+from sentinel_counters import record_items
+from sentinel_feed import publish
+from sentinel_schema import compact_item
+
+# Gravação de achados no DynamoDB, compartilhada pela Lambda, pela varredura e pelo scanner de IaC.
+# A chave é determinística (recurso + eventID do CloudTrail), então uma reentrega do EventBridge/SQS
+# produz a mesma chave e vira no-op, em vez de uma linha duplicada e contadores inflados.
+# Todo achado é gravado no esquema compacto (sentinel_schema): a análise completa vai comprimida em um atributo.
+
+# --- CONFIGURAÇÕES ---
+# Itens por TransactWriteItems (máximo aceito aqui: 25)
+FINDINGS_BATCH_SIZE = int(os.environ.get('SENTINEL_FINDINGS_BATCH_SIZE', '25'))
+# Reenvios de transações canceladas por throttling/conflito antes de cair para gravações individuais
+FINDINGS_MAX_RETRIES = int(os.environ.get('SENTINEL_FINDINGS_MAX_RETRIES', '5'))
+FINDINGS_BACKOFF = float(os.environ.get('SENTINEL_FINDINGS_BACKOFF', '0.05'))
+
+KEY_ATTR = 'id_recurso'
+
+
+def finding_key(resource_id, source_id=None, content=None):
+    """Chave do achado. `source_id` é o eventID do CloudTrail (ou outra origem estável, ex: id da varredura).
+    Sem eventID, usa o hash do conteúdo do evento (`content`): a reentrega do mesmo evento continua caindo
+    na mesma chave. Sem nenhum dos dois, um uuid (nunca colide, mas também não deduplica)."""
+    if source_id:
+        return f"{resource_id}#{source_id}"
+    if content is not None:
+        digest = hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return f"{resource_id}#{digest[:32]}"
+    return f"{resource_id}#{uuid.uuid4().hex}"
+
+
+def put_finding(table, item):
+    """Gravação condicional de um achado. Retorna False se a chave já existia (reentrega)."""
+    item = compact_item(item)
+    try:
+        table.put_item(Item=item, ConditionExpression='attribute_not_exists(id_recurso)')
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        print(f"♻️ Achado {item[KEY_ATTR]} já registrado (evento reentregue). Nada a gravar.")
+        telemetry.incr('achados_duplicados')
+        return False
+    telemetry.incr('achados_gravados')
+    record_items(table, [item])
+    publish('INSERT', item)
+    return True
+
+
+class FindingsWriter:
+    """Buffer de achados gravados com TransactWriteItems.
+
+    Cada Put da transação leva `attribute_not_exists(id_recurso)`, a mesma condição do put_finding: a
+    existência é verificada na própria escrita, não em uma leitura anterior que outra invocação pode
+    invalidar. Uma condição falha cancela a transação inteira; os motivos do cancelamento dizem quais
+    chaves já existiam, e o restante é reenviado sem elas. Os contadores do Dashboard só recebem os itens
+    cuja escrita condicional passou.
+    """
+
+    def __init__(self, table, batch_size=FINDINGS_BATCH_SIZE, max_retries=FINDINGS_MAX_RETRIES, backoff=FINDINGS_BACKOFF):
+        self.table = table
+        self.batch_size = min(max(1, batch_size), 25)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.buffer = {}
+        self.stats = {'gravados': 0, 'duplicados': 0}
+
+    def add(self, item):
+        item = compact_item(item)
+        key = item[KEY_ATTR]
+        if key in self.buffer:
+            self.stats['duplicados'] += 1
+            return
+        self.buffer[key] = item
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def _sleep(self, attempt):
+        # Backoff exponencial com jitter, como recomendado para throttling e conflitos de transação
+        time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def _write(self, items):
+        """TransactWriteItems condicional. Retorna (gravados, duplicados, sobras para gravar um a um)."""
+        # O client do resource já converte tipos Python <-> formato do DynamoDB
+        client = self.table.meta.client
+        pending, duplicates, attempt = list(items), [], 0
+        while pending:
+            try:
+                client.transact_write_items(TransactItems=[
+                    {'Put': {'TableName': self.table.name, 'Item': item,
+                             'ConditionExpression': f'attribute_not_exists({KEY_ATTR})'}}
+                    for item in pending
+                ])
+                return pending, duplicates, []
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                reasons = e.response.get('CancellationReasons') or []
+            if len(reasons) != len(pending):
+                # Sem motivos por item não há como separar as chaves repetidas: fica para o put_finding
+                return [], duplicates, pending
+            failed = {i for i, r in enumerate(reasons) if r.get('Code') == 'ConditionalCheckFailed'}
+            if failed:
+                # Chaves já gravadas (reentrega): saem do lote e o resto é reenviado na hora
+                duplicates += [pending[i] for i in sorted(failed)]
+                pending = [item for i, item in enumerate(pending) if i not in failed]
+                continue
+            # Throttling ou conflito com outra transação: reenvia o lote inteiro com backoff
+            if attempt >= self.max_retries:
+                return [], duplicates, pending
+            telemetry.incr('achados_reenviados', len(pending))
+            self._sleep(attempt)
+            attempt += 1
+        return [], duplicates, []
+
+    def flush(self):
+        """Grava o buffer. Retorna a lista de itens efetivamente novos."""
+        if not self.buffer:
+            return []
+        batch, self.buffer = list(self.buffer.values()), {}
+        written, duplicates, leftover = self._write(batch)
+        self.stats['duplicados'] += len(duplicates)
+        telemetry.incr('achados_duplicados', len(duplicates))
+        if written:
+            record_items(self.table, written)
+            telemetry.incr('achados_gravados', len(written))
+            for item in written:
+                publish('INSERT', item)
+        # Throttling persistente: uma a uma, com a mesma condição na escrita
+        for item in leftover:
+            if put_finding(self.table, item):
+                written.append(item)
+            else:
+                self.stats['duplicados'] += 1
+        self.stats['gravados'] += len(written)
+        return written
+
+
+def write_findings(table, items, batch_size=FINDINGS_BATCH_SIZE):
+    """Atalho para gravar uma lista de achados. Retorna quantos eram novos."""
+    with FindingsWriter(table, batch_size) as writer:
+        for item in items:
+            writer.add(item)
+    return writer.stats['gravados']
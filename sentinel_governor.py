@@ -0,0 +1,271 @@
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from botocore.exceptions import ClientError
+import sentinel_aws as aws
+import sentinel_telemetry as telemetry
+from sentinel_schema import QUOTA_PREFIX
+
+# Governador de vazão das chamadas ao LLM, compartilhado entre containers da Lambda e o scanner.
+# Duas camadas:
+# - Cota global (token bucket por janela): um contador atômico no DynamoDB limita as requisições por minuto
+#   de todos os containers juntos, e um 429 pausa todo mundo por alguns segundos.
+# - Concorrência adaptativa (AIMD) por processo: +1 slot a cada "janela" de sucessos rápidos,
+#   metade dos slots ao ver 429 ou latência acima do alvo.
+# Sem cota disponível a chamada espera a próxima janela (fila), em vez de virar ERRO_IA.
+
+# --- CONFIGURAÇÕES ---
+# 'dynamodb' (cota compartilhada na tabela de achados) ou 'memory' (só este processo, para rodar local)
+GOVERNOR_BACKEND = os.environ.get('SENTINEL_GOVERNOR_BACKEND', 'memory').lower()
+DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'SentinelMonitor')
+# Cota do provedor em requisições por minuto (0 = sem cota, só a concorrência adaptativa)
+GOVERNOR_RPM = int(os.environ.get('SENTINEL_LLM_RPM', '0'))
+# Janela de reabastecimento do bucket (s): janelas curtas evitam rajadas de um minuto inteiro de cota
+GOVERNOR_WINDOW = float(os.environ.get('SENTINEL_GOVERNOR_WINDOW', '10'))
+GOVERNOR_MIN_CONCURRENCY = int(os.environ.get('SENTINEL_GOVERNOR_MIN_CONCURRENCY', '1'))
+GOVERNOR_MAX_CONCURRENCY = int(os.environ.get('SENTINEL_GOVERNOR_MAX_CONCURRENCY', '16'))
+GOVERNOR_INITIAL_CONCURRENCY = int(os.environ.get('SENTINEL_GOVERNOR_INITIAL_CONCURRENCY', '4'))
+# Latência (s) acima da qual a chamada conta como sinal de congestionamento
+GOVERNOR_LATENCY_TARGET = float(os.environ.get('SENTINEL_GOVERNOR_LATENCY_TARGET', '15'))
+# Pausa global (s) depois de um 429
+GOVERNOR_COOLDOWN = float(os.environ.get('SENTINEL_GOVERNOR_COOLDOWN', '5'))
+# Espera máxima (s) por cota/slot antes de adiar a análise (o evento volta para a fila)
+GOVERNOR_MAX_WAIT = float(os.environ.get('SENTINEL_GOVERNOR_MAX_WAIT', '60'))
+
+QUOTA_KEY = f'{QUOTA_PREFIX}LLM'
+# Fator do decremento multiplicativo e intervalo mínimo entre dois decrementos
+# (várias chamadas em voo vendo o mesmo 429 contam como um único sinal)
+DECREASE_FACTOR = 0.5
+DECREASE_INTERVAL = 1.0
+
+
+class QuotaExceeded(Exception):
+    """Sem cota nem slot dentro da espera máxima: a análise deve ser adiada."""
+
+
+class _MemoryQuota:
+    """Bucket por janela só deste processo (testes e execução local)."""
+
+    def __init__(self):
+        self.window = None
+        self.used = 0
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def take(self, now, window_seconds, limit):
+        """(True, None) se pegou um token; senão (False, instante em que vale tentar de novo)."""
+        window = int(now // window_seconds)
+        with self._lock:
+            if self.paused_until > now:
+                return False, self.paused_until
+            if self.window != window:
+                self.window, self.used = window, 0
+            if self.used >= limit:
+                return False, (window + 1) * window_seconds
+            self.used += 1
+            return True, None
+
+    def pause(self, until):
+        with self._lock:
+            self.paused_until = max(self.paused_until, until)
+
+
+class _DynamoQuota:
+    """Um único item (COTA#LLM) com a janela atual, os tokens usados nela e a pausa global.
+    Cada token é um UpdateItem condicional (ADD atômico); trocar de janela zera o contador."""
+
+    @property
+    def table(self):
+        # Criada no primeiro uso, não no import do módulo
+        return aws.table(DYNAMODB_TABLE)
+
+    def _update(self, expression, condition, values):
+        try:
+            self.table.update_item(
+                Key={'id_recurso': QUOTA_KEY},
+                UpdateExpression=expression,
+                ConditionExpression=f"({condition}) and (attribute_not_exists(pausa_ate) or pausa_ate <= :agora)",
+                ExpressionAttributeValues=values,
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+
+    def take(self, now, window_seconds, limit):
+        window = int(now // window_seconds)
+        # Números inteiros: o resource do boto3 não aceita float
+        values = {':janela': window, ':um': 1, ':agora': int(now)}
+        # Caminho comum: mesma janela e ainda há tokens
+        if self._update("add usados :um", "janela = :janela and usados < :limite", {**values, ':limite': limit}):
+            return True, None
+        # Primeira chamada da janela: reinicia o contador
+        if self._update("set janela = :janela, usados = :um", "attribute_not_exists(janela) or janela < :janela", values):
+            return True, None
+        item = self.table.get_item(Key={'id_recurso': QUOTA_KEY}).get('Item') or {}
+        paused_until = float(item.get('pausa_ate', 0))
+        if paused_until > now:
+            return False, paused_until
+        if int(item.get('janela', window)) > window:
+            # Relógio deste container atrás dos outros: tenta de novo em instantes
+            return False, now + 0.1
+        return False, (window + 1) * window_seconds
+
+    def pause(self, until):
+        try:
+            self.table.update_item(
+                Key={'id_recurso': QUOTA_KEY},
+                UpdateExpression="set pausa_ate = :ate",
+                ConditionExpression="attribute_not_exists(pausa_ate) or pausa_ate < :ate",
+                ExpressionAttributeValues={':ate': math.ceil(until)},
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+
+class _Slot:
+    """Uma chamada em voo. Quem chama preenche `status` com o HTTP status da resposta."""
+
+    def __init__(self, governor):
+        self.governor = governor
+        self.status = None
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.governor.release(time.time() - self.started, self.status)
+
+
+class RateGovernor:
+    """Cota global + concorrência AIMD para as chamadas ao LLM. Uso: `with governor.slot() as s: ...; s.status = 200`."""
+
+    def __init__(self, backend=GOVERNOR_BACKEND, rpm=GOVERNOR_RPM, window=GOVERNOR_WINDOW,
+                 min_concurrency=GOVERNOR_MIN_CONCURRENCY, max_concurrency=GOVERNOR_MAX_CONCURRENCY,
+                 initial_concurrency=GOVERNOR_INITIAL_CONCURRENCY, latency_target=GOVERNOR_LATENCY_TARGET,
+                 cooldown=GOVERNOR_COOLDOWN, max_wait=GOVERNOR_MAX_WAIT):
+        self.window = window
+        # Tokens por janela (pelo menos 1, senão uma cota baixa com janela curta travaria tudo)
+        self.limit_per_window = max(1, round(rpm * window / 60)) if rpm > 0 else None
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.concurrency = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._completed = deque()  # instantes das chamadas concluídas no último minuto (vazão)
+        self.stats = {'chamadas': 0, 'throttles': 0, 'lentas': 0, 'esperas': 0, 'espera_s': 0.0, 'adiadas': 0}
+        self.quota = None
+        if self.limit_per_window:
+            try:
+                self.quota = _DynamoQuota() if backend == 'dynamodb' else _MemoryQuota()
+            except Exception as e:
+                print(f"⚠️ Aviso: Cota compartilhada indisponível ({backend}), usando só este processo: {e}")
+                self.quota = _MemoryQuota()
+
+    def slot(self):
+        self.acquire()
+        return _Slot(self)
+
+    def acquire(self, max_wait=None):
+        """Espera um slot de concorrência e um token da cota. QuotaExceeded se passar da espera máxima."""
+        started = time.time()
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = started + max_wait
+        with self._cond:
+            while self.in_flight >= int(self.concurrency):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._defer(started, max_wait)
+                self._cond.wait(remaining)
+            self.in_flight += 1
+        try:
+            while self.quota is not None:
+                now = time.time()
+                try:
+                    ok, retry_at = self.quota.take(now, self.window, self.limit_per_window)
+                except Exception as e:
+                    # Falha no contador compartilhado não pode travar a análise
+                    print(f"⚠️ Aviso: Falha ao consultar a cota do LLM ({e}); seguindo sem cota.")
+                    break
+                if ok:
+                    break
+                if retry_at > deadline:
+                    self._defer(started, max_wait)
+                # Jitter para os containers não voltarem todos no mesmo instante
+                time.sleep(max(0.0, retry_at - now) + random.uniform(0, min(1.0, self.window / 10)))
+        except QuotaExceeded:
+            self._release_slot()
+            raise
+        waited = time.time() - started
+        if waited >= 0.01:
+            with self._cond:
+                self.stats['esperas'] += 1
+                self.stats['espera_s'] += waited
+            telemetry.incr('llm_governor_espera_ms', int(waited * 1000))
+
+    def _defer(self, started, max_wait):
+        with self._cond:
+            self.stats['adiadas'] += 1
+        telemetry.incr('llm_governor_adiadas')
+        raise QuotaExceeded(f"Sem cota/slot do LLM após {time.time() - started:.0f}s (limite {max_wait:.0f}s).")
+
+    def _release_slot(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def release(self, latency, status=None):
+        """Fecha a chamada e ajusta a concorrência (AIMD) pelo resultado."""
+        throttled = status == 429
+        slow = latency > self.latency_target
+        now = time.time()
+        with self._cond:
+            self.in_flight -= 1
+            self.stats['chamadas'] += 1
+            self._completed.append(now)
+            if throttled or slow:
+                self.stats['throttles' if throttled else 'lentas'] += 1
+                if now - self._last_decrease >= DECREASE_INTERVAL:
+                    self.concurrency = max(self.min_concurrency, self.concurrency * DECREASE_FACTOR)
+                    self._last_decrease = now
+            elif status is not None and status < 500:
+                # Aumento aditivo: +1 slot depois de ~`concorrência` sucessos seguidos
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self._cond.notify_all()
+        if throttled:
+            telemetry.incr('llm_governor_429')
+            if self.quota is not None:
+                try:
+                    self.quota.pause(now + self.cooldown)
+                except Exception as e:
+                    print(f"⚠️ Aviso: Não foi possível pausar a cota compartilhada: {e}")
+        elif slow:
+            telemetry.incr('llm_governor_lentas')
+
+    def report(self):
+        """Vazão (chamadas/s no último minuto), concorrência atual e contadores de espera/throttle."""
+        now = time.time()
+        with self._cond:
+            while self._completed and now - self._completed[0] > 60:
+                self._completed.popleft()
+            stats = dict(self.stats)
+            stats['concorrencia'] = int(self.concurrency)
+            stats['em_voo'] = self.in_flight
+            stats['vazao_por_s'] = round(len(self._completed) / 60, 3)
+        stats['espera_s'] = round(stats['espera_s'], 3)
+        stats['cota_por_janela'] = self.limit_per_window
+        return stats
+
+
+# Instância global: compartilhada por todas as chamadas ao LLM do processo
+governor = RateGovernor()
@@ -0,0 +1,274 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from botocore.exceptions import ClientError
+import sentinel_aws as aws
+import sentinel_telemetry as telemetry
+from sentinel_s3_purge import PURGE_TIME_BUDGET
+from sentinel_schema import LEASE_PREFIX
+
+# Lease por recurso entre invocações concorrentes da Lambda.
+# Uma rajada do CloudTrail (CreateSecurityGroup + vários AuthorizeSecurityGroupIngress) dispara uma invocação
+# por evento. Só quem detém o lease audita; as outras anexam o evento ao lease ("sujo") e retornam na hora.
+# Ao terminar, o dono confere se o lease ficou sujo e faz uma única re-auditoria com os eventos acumulados.
+
+# --- CONFIGURAÇÕES ---
+# 'dynamodb' (itens LEASE# na tabela de achados), 'sqlite' (substituto local) ou 'off'
+LEASE_BACKEND = os.environ.get('SENTINEL_LEASE', 'dynamodb').lower()
+DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'SentinelMonitor')
+LEASE_SQLITE_PATH = os.environ.get('SENTINEL_LEASE_SQLITE', '/tmp/sentinel_leases.db')
+# Folga sobre o orçamento da purga: coleta, análise do LLM e persistência da mesma auditoria
+LEASE_MARGIN_SECONDS = int(os.environ.get('SENTINEL_LEASE_MARGIN_SECONDS', '120'))
+# Validade do lease: precisa cobrir uma auditoria inteira, inclusive a purga de um bucket. Por padrão deriva do
+# orçamento da purga, senão o lease venceria no meio dela e uma segunda invocação começaria a mesma exclusão
+LEASE_SECONDS = int(os.environ.get('SENTINEL_LEASE_SECONDS') or int(PURGE_TIME_BUDGET) + LEASE_MARGIN_SECONDS)
+# Re-auditorias seguidas antes de devolver o lease com os eventos restantes (evita um dono preso numa rajada sem fim)
+LEASE_MAX_ROUNDS = int(os.environ.get('SENTINEL_LEASE_MAX_ROUNDS', '3'))
+
+
+class _DynamoLeases:
+    """Leases como itens internos da tabela de achados (sem data_evento, fora dos GSIs e dos contadores).
+    Toda transição é uma escrita condicional, então duas invocações nunca são donas ao mesmo tempo."""
+
+    @property
+    def table(self):
+        # Criada no primeiro uso, não no import do módulo
+        return aws.table(DYNAMODB_TABLE)
+
+    def _key(self, key):
+        return {'id_recurso': f"{LEASE_PREFIX}{key}"}
+
+    def acquire(self, key, owner, now, expires_at):
+        """Retorna os eventos deixados por um dono anterior que expirou, ou None se o lease está ocupado."""
+        try:
+            response = self.table.update_item(
+                Key=self._key(key),
+                UpdateExpression="set dono = :dono, expira_em = :expira, eventos = :vazio",
+                ConditionExpression="attribute_not_exists(id_recurso) or expira_em < :agora",
+                ExpressionAttributeValues={':dono': owner, ':expira': expires_at, ':vazio': [], ':agora': now},
+                ReturnValues='ALL_OLD',
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return None
+        return list((response.get('Attributes') or {}).get('eventos', []))
+
+    def mark_dirty(self, key, owner, now, event):
+        """Anexa o evento a um lease vigente de outro dono. False se o lease não existe mais."""
+        try:
+            self.table.update_item(
+                Key=self._key(key),
+                UpdateExpression="set eventos = list_append(if_not_exists(eventos, :vazio), :evento)",
+                ConditionExpression="attribute_exists(id_recurso) and expira_em >= :agora and dono <> :dono",
+                ExpressionAttributeValues={':vazio': [], ':evento': [event], ':agora': now, ':dono': owner},
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+        return True
+
+    def release(self, key, owner, expires_at):
+        """Solta o lease se está limpo. Se ficou sujo, renova, esvazia e retorna os eventos acumulados.
+        Retorna [] quando solto (ou quando o lease já não é deste dono)."""
+        try:
+            self.table.delete_item(
+                Key=self._key(key),
+                ConditionExpression="dono = :dono and size(eventos) = :zero",
+                ExpressionAttributeValues={':dono': owner, ':zero': 0},
+            )
+            return []
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        try:
+            response = self.table.update_item(
+                Key=self._key(key),
+                UpdateExpression="set eventos = :vazio, expira_em = :expira",
+                ConditionExpression="dono = :dono",
+                ExpressionAttributeValues={':vazio': [], ':expira': expires_at, ':dono': owner},
+                ReturnValues='UPDATED_OLD',
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return []
+        return list((response.get('Attributes') or {}).get('eventos', []))
+
+    def hand_off(self, key, owner, events):
+        """Devolve `events` ao lease e o deixa vencido: a próxima aquisição herda a fila inteira."""
+        try:
+            self.table.update_item(
+                Key=self._key(key),
+                UpdateExpression="set eventos = list_append(:pendentes, if_not_exists(eventos, :vazio)), expira_em = :vencido",
+                ConditionExpression="dono = :dono",
+                ExpressionAttributeValues={':pendentes': list(events), ':vazio': [], ':vencido': 0, ':dono': owner},
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+
+class _SqliteLeases:
+    """Substituto local do DynamoDB, útil no CI e em testes offline. Funciona entre processos:
+    cada transição roda numa transação BEGIN IMMEDIATE (lock de escrita do arquivo)."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS leases (chave TEXT PRIMARY KEY, dono TEXT, expira_em INTEGER, eventos TEXT)")
+
+    def _transaction(self, operation):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(self.conn)
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    @staticmethod
+    def _row(conn, key):
+        return conn.execute("SELECT dono, expira_em, eventos FROM leases WHERE chave = ?", (key,)).fetchone()
+
+    def acquire(self, key, owner, now, expires_at):
+        def operation(conn):
+            row = self._row(conn, key)
+            if row and row[1] >= now:
+                return None
+            conn.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?, '[]')", (key, owner, expires_at))
+            return json.loads(row[2]) if row else []
+        return self._transaction(operation)
+
+    def mark_dirty(self, key, owner, now, event):
+        def operation(conn):
+            row = self._row(conn, key)
+            if not row or row[1] < now or row[0] == owner:
+                return False
+            conn.execute("UPDATE leases SET eventos = ? WHERE chave = ?", (json.dumps(json.loads(row[2]) + [event]), key))
+            return True
+        return self._transaction(operation)
+
+    def release(self, key, owner, expires_at):
+        def operation(conn):
+            row = self._row(conn, key)
+            if not row or row[0] != owner:
+                return []
+            events = json.loads(row[2])
+            if not events:
+                conn.execute("DELETE FROM leases WHERE chave = ?", (key,))
+                return []
+            conn.execute("UPDATE leases SET eventos = '[]', expira_em = ? WHERE chave = ?", (expires_at, key))
+            return events
+        return self._transaction(operation)
+
+    def hand_off(self, key, owner, events):
+        def operation(conn):
+            row = self._row(conn, key)
+            if not row or row[0] != owner:
+                return
+            conn.execute("UPDATE leases SET eventos = ?, expira_em = 0 WHERE chave = ?",
+                         (json.dumps(list(events) + json.loads(row[2])), key))
+        self._transaction(operation)
+
+
+class LeaseBacklog(RuntimeError):
+    """O recurso continuou recebendo eventos além de LEASE_MAX_ROUNDS re-auditorias. Os eventos restantes
+    ficaram no lease (vencido); a falha faz a reentrega deste evento herdá-los."""
+
+
+class Lease:
+    def __init__(self, key, owner, events):
+        self.key = key
+        self.owner = owner
+        # Eventos herdados de um dono anterior que expirou sem terminar
+        self.events = events
+
+
+class LeaseManager:
+    """Lease + debounce por recurso. `run` é o ponto de entrada usado pela Lambda."""
+
+    def __init__(self, backend=LEASE_BACKEND, seconds=LEASE_SECONDS, max_rounds=LEASE_MAX_ROUNDS):
+        self.seconds = seconds
+        self.max_rounds = max(1, max_rounds)
+        self.store = None
+        try:
+            if backend == 'dynamodb':
+                self.store = _DynamoLeases()
+            elif backend == 'sqlite':
+                self.store = _SqliteLeases(LEASE_SQLITE_PATH)
+        except Exception as e:
+            print(f"⚠️ Aviso: Lease indisponível ({backend}), auditorias sem coordenação: {e}")
+
+    def acquire(self, key, event):
+        """Lease do recurso, ou None se outra invocação já audita (o evento fica anexado ao lease dela)."""
+        owner = uuid.uuid4().hex
+        # Novas tentativas cobrem a corrida "lease solto entre a tentativa de aquisição e a marcação"
+        for _ in range(3):
+            now = int(time.time())
+            events = self.store.acquire(key, owner, now, now + self.seconds)
+            if events is not None:
+                return Lease(key, owner, events)
+            if self.store.mark_dirty(key, owner, now, event):
+                return None
+        # Lease trocando de dono sem parar: melhor auditar em duplicidade do que perder o evento
+        return Lease(key, owner, [])
+
+    def release(self, lease):
+        """[] se o lease foi solto; senão os eventos chegados durante a auditoria (lease renovado)."""
+        return self.store.release(lease.key, lease.owner, int(time.time()) + self.seconds)
+
+    def run(self, key, event, audit):
+        """Executa `audit(eventos_extras)` sob o lease do recurso e repete enquanto o lease voltar sujo.
+
+        `event` é o resumo serializável deste evento (o que as re-auditorias recebem). Retorna o resultado
+        da última auditoria, ou None se o evento foi absorvido pela auditoria em curso de outra invocação.
+        Levanta LeaseBacklog se ainda sobrarem eventos após `max_rounds` re-auditorias.
+        """
+        if self.store is None:
+            return audit([])
+        try:
+            lease = self.acquire(key, event)
+        except Exception as e:
+            print(f"⚠️ Aviso: Falha ao obter lease de {key} ({e}); auditando sem coordenação.")
+            return audit([])
+        if lease is None:
+            print(f"⏳ {key} já está em auditoria; evento anexado para a re-auditoria.")
+            telemetry.incr('auditorias_adiadas')
+            return None
+
+        result = None
+        pending = lease.events
+        try:
+            result = audit(pending)
+            for round_number in range(self.max_rounds + 1):
+                pending = self.release(lease)
+                if not pending:
+                    return result
+                if round_number == self.max_rounds:
+                    break
+                print(f"🔁 {len(pending)} evento(s) chegaram durante a auditoria de {key}; re-auditando.")
+                telemetry.incr('re_auditorias')
+                result = audit(pending)
+            self.store.hand_off(lease.key, lease.owner, pending)
+        except Exception:
+            # Falhou no meio (ex: LLMThrottled): devolve o lease vencido com os eventos em aberto. Quem os anexou
+            # já retornou sucesso, então a reentrega deste evento (ou o próximo) precisa herdá-los
+            try:
+                self.store.hand_off(lease.key, lease.owner, pending)
+            except Exception as e:
+                print(f"⚠️ Aviso: Não foi possível devolver o lease de {key}: {e}")
+            raise
+        telemetry.incr('leases_devolvidos')
+        raise LeaseBacklog(f"{key} continua recebendo eventos após {self.max_rounds} re-auditoria(s); "
+                           f"{len(pending)} evento(s) devolvidos ao lease para a próxima invocação.")
+
+
+# Instância global: reaproveitada entre invocações quentes
+lease_manager = LeaseManager()
@@ -0,0 +1,318 @@
+import json
+import os
+import time
+import random
+import threading
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
+import sentinel_telemetry as telemetry
+from sentinel_governor import governor as default_governor, QuotaExceeded
+
+# --- CONFIGURAÇÕES ---
+LLM_PROVIDER = os.environ.get('SENTINEL_LLM_PROVIDER', 'gemini').lower()
+LLM_MODEL = os.environ.get('SENTINEL_LLM_MODEL', 'gemini-2.0-flash')
+LLM_ENDPOINT = os.environ.get('SENTINEL_LLM_ENDPOINT', 'https://generativelanguage.googleapis.com/v1beta')
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('SENTINEL_HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.environ.get('SENTINEL_HTTP_READ_TIMEOUT', '60'))
+HTTP_MAX_RETRIES = int(os.environ.get('SENTINEL_HTTP_MAX_RETRIES', '4'))
+HTTP_BACKOFF_BASE = float(os.environ.get('SENTINEL_HTTP_BACKOFF_BASE', '1'))
+HTTP_BACKOFF_MAX = float(os.environ.get('SENTINEL_HTTP_BACKOFF_MAX', '30'))
+HTTP_POOL_SIZE = int(os.environ.get('SENTINEL_HTTP_POOL_SIZE', '10'))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Análise em lote: vários recursos por requisição, limitados por um orçamento de tokens do prompt
+BATCH_TOKEN_BUDGET = int(os.environ.get('SENTINEL_LLM_BATCH_TOKENS', '24000'))
+BATCH_MAX_ITEMS = int(os.environ.get('SENTINEL_LLM_BATCH_MAX_ITEMS', '20'))
+
+# Circuit breaker: após N falhas seguidas, rejeita chamadas por X segundos (sem esperar timeouts)
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('SENTINEL_BREAKER_FAILURES', '5'))
+BREAKER_RESET_TIMEOUT = float(os.environ.get('SENTINEL_BREAKER_RESET', '30'))
+
+
+class LLMError(Exception):
+    """Erro base do cliente de LLM."""
+
+
+class LLMHTTPError(LLMError):
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status}: {body[:300]}")
+        self.status = status
+
+
+class LLMThrottled(LLMHTTPError):
+    """Cota do provedor esgotada (429 persistente ou sem cota no governador): a análise deve ser adiada,
+    não registrada como falha."""
+
+    def __init__(self, body):
+        super().__init__(429, body)
+
+
+class LLMResponseError(LLMError):
+    """Resposta sem texto ou sem JSON válido."""
+
+
+class LLMUnavailable(LLMError):
+    """Circuit breaker aberto: o provedor falhou repetidamente."""
+
+
+def parse_json_response(text):
+    """Extrai o primeiro objeto/array JSON do texto, tolerando cercas ```json, prefixos e sufixos."""
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else cleaned[3:]
+        if cleaned.rstrip().endswith("```"):
+            cleaned = cleaned.rstrip()[:-3]
+    try:
+        return json.loads(cleaned)
+    except ValueError:
+        pass
+    decoder = json.JSONDecoder()
+    for i, char in enumerate(cleaned):
+        if char in '{[':
+            try:
+                return decoder.raw_decode(cleaned[i:])[0]
+            except ValueError:
+                continue
+    raise LLMResponseError(f"Resposta sem JSON válido: {text[:200]}")
+
+
+def estimate_tokens(text):
+    """Estimativa barata (~4 caracteres por token), suficiente para dimensionar lotes."""
+    return len(text) // 4 + 1
+
+
+def pack_batches(texts, budget=BATCH_TOKEN_BUDGET, max_items=BATCH_MAX_ITEMS):
+    """Agrupa {chave: texto} em listas de chaves, na ordem, sem passar do orçamento nem de max_items.
+    Um item maior que o orçamento vai sozinho no seu lote."""
+    batches, current, used = [], [], 0
+    for key, text in texts.items():
+        cost = estimate_tokens(text)
+        if current and (used + cost > budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(key)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_keyed_verdicts(text, keys):
+    """Lê o array [{"id": chave, ...veredito}] e retorna {chave: veredito} só para as chaves válidas.
+    Ids desconhecidos são ignorados; ids repetidos invalidam aquela chave (será reanalisada)."""
+    data = parse_json_response(text)
+    if isinstance(data, dict) and len(keys) == 1 and 'id' not in data:
+        # Lote de um item: o modelo às vezes devolve o objeto solto
+        return {keys[0]: data}
+    if isinstance(data, dict):
+        data = data.get('resultados', [data])
+    if not isinstance(data, list):
+        raise LLMResponseError(f"Lote sem array de vereditos: {text[:200]}")
+    wanted = set(keys)
+    results, duplicated = {}, set()
+    for entry in data:
+        if not isinstance(entry, dict) or str(entry.get('id')) not in wanted:
+            continue
+        key = str(entry['id'])
+        if key in results:
+            duplicated.add(key)
+        results[key] = {k: v for k, v in entry.items() if k != 'id'}
+    for key in duplicated:
+        results.pop(key)
+    return results
+
+
+class GeminiProvider:
+    """Monta a requisição generateContent e extrai o texto da resposta do Gemini."""
+
+    def __init__(self, model=LLM_MODEL, endpoint=LLM_ENDPOINT, api_key=None):
+        self.model = model
+        self.endpoint = endpoint.rstrip('/')
+        self.api_key = api_key if api_key is not None else os.environ.get('GOOGLE_API_KEY', '')
+
+    def build_request(self, prompt):
+        url = f"{self.endpoint}/models/{self.model}:generateContent"
+        # Chave no header em vez da query string: não vaza em logs de URL
+        headers = {"Content-Type": "application/json", "x-goog-api-key": self.api_key}
+        body = {"contents": [{"parts": [{"text": prompt}]}]}
+        return url, headers, body
+
+    def extract_text(self, result):
+        try:
+            return result['candidates'][0]['content']['parts'][0]['text']
+        except (KeyError, IndexError, TypeError):
+            raise LLMResponseError(f"Resposta inesperada do Gemini: {json.dumps(result)[:200]}")
+
+
+PROVIDERS = {'gemini': GeminiProvider}
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            # Meio-aberto: depois do reset_timeout deixa uma chamada de teste passar
+            if time.time() - self.opened_at >= self.reset_timeout:
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+
+class LLMClient:
+    """Cliente único para todas as chamadas de LLM: pool keep-alive, timeouts, retry com backoff e circuit breaker.
+
+    Usa urllib3 (já vem com o botocore), então funciona igual na Lambda, no CI e local.
+    """
+
+    def __init__(self, provider=None, pool_size=HTTP_POOL_SIZE, governor=None):
+        self.provider = provider or PROVIDERS[LLM_PROVIDER]()
+        self.breaker = CircuitBreaker()
+        # Cota global + concorrência adaptativa: cada tentativa HTTP ocupa um slot do governador
+        self.governor = governor or default_governor
+        self.http = urllib3.PoolManager(
+            maxsize=pool_size,
+            block=False,
+            retries=False,
+            timeout=urllib3.Timeout(connect=HTTP_CONNECT_TIMEOUT, read=HTTP_READ_TIMEOUT),
+        )
+
+    @property
+    def configured(self):
+        return bool(getattr(self.provider, 'api_key', True))
+
+    def _post(self, url, headers, body):
+        for attempt in range(HTTP_MAX_RETRIES + 1):
+            try:
+                with self.governor.slot() as slot:
+                    response = self.http.request('POST', url, body=json.dumps(body).encode('utf-8'), headers=headers)
+                    slot.status = response.status
+                if response.status not in RETRYABLE_STATUS or attempt == HTTP_MAX_RETRIES:
+                    return response
+                reason = f"HTTP {response.status}"
+            except QuotaExceeded as e:
+                raise LLMThrottled(str(e))
+            except (urllib3.exceptions.TimeoutError, urllib3.exceptions.ProtocolError,
+                    urllib3.exceptions.NewConnectionError) as e:
+                if attempt == HTTP_MAX_RETRIES:
+                    raise LLMError(f"Falha de rede: {e}")
+                reason = type(e).__name__
+
+            # Full jitter: espera aleatória entre 0 e base * 2^tentativa (limitada)
+            delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+            telemetry.incr('llm_retries')
+            print(f"⏳ {reason}. Nova tentativa {attempt + 1}/{HTTP_MAX_RETRIES} em {delay:.1f}s...")
+            time.sleep(delay)
+
+    def generate(self, prompt):
+        """Envia o prompt e retorna o texto gerado."""
+        if not self.breaker.allow():
+            telemetry.incr('llm_rejeitadas')
+            raise LLMUnavailable("Circuit breaker aberto: LLM indisponível no momento.")
+        url, headers, body = self.provider.build_request(prompt)
+        telemetry.incr('llm_chamadas')
+        telemetry.incr('llm_prompt_bytes', len(prompt.encode('utf-8')))
+        try:
+            with telemetry.stage('llm'):
+                response = self._post(url, headers, body)
+            telemetry.incr('llm_resposta_bytes', len(response.data))
+            if response.status == 429:
+                raise LLMThrottled(response.data.decode('utf-8', 'replace'))
+            if response.status != 200:
+                raise LLMHTTPError(response.status, response.data.decode('utf-8', 'replace'))
+            text = self.provider.extract_text(json.loads(response.data.decode('utf-8')))
+        except LLMThrottled:
+            # Limite de taxa não é o provedor fora do ar: quem trata é o governador, não o breaker
+            raise
+        except LLMError:
+            self.breaker.record_failure()
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            raise LLMError(str(e))
+        self.breaker.record_success()
+        return text
+
+    def generate_json(self, prompt):
+        """Envia o prompt e retorna o JSON da resposta já parseado."""
+        return parse_json_response(self.generate(prompt))
+
+    def _generate_keyed(self, keys, items, build_prompt):
+        """Um lote; se a resposta vier incompleta ou malformada, divide e repete só as chaves sem veredito."""
+        try:
+            results = parse_keyed_verdicts(self.generate(build_prompt({k: items[k] for k in keys})), keys)
+        except LLMResponseError:
+            results = {}
+        except LLMError as e:
+            # HTTP, rede ou breaker aberto: dividir o lote não ajuda
+            return {}, {k: e for k in keys}
+
+        missing = [k for k in keys if k not in results]
+        if not missing:
+            return results, {}
+        if len(keys) == 1:
+            return results, {keys[0]: LLMResponseError(f"Sem veredito válido para '{keys[0]}'")}
+
+        telemetry.incr('llm_lote_divisoes')
+        errors = {}
+        half = len(missing) // 2
+        for part in ([missing] if len(missing) == 1 else [missing[:half], missing[half:]]):
+            part_results, part_errors = self._generate_keyed(part, items, build_prompt)
+            results.update(part_results)
+            errors.update(part_errors)
+        return results, errors
+
+    def generate_batch(self, items, build_prompt, workers=1):
+        """Analisa {chave: dado} em lotes. `build_prompt({chave: dado})` deve pedir um array JSON
+        com exatamente um objeto {"id": chave, ...} por entrada.
+
+        Retorna (resultados, erros): {chave: veredito} e {chave: LLMError} para o que não teve veredito.
+        """
+        if not items:
+            return {}, {}
+        texts = {k: json.dumps(v, default=str) for k, v in items.items()}
+        batches = pack_batches(texts)
+        telemetry.incr('llm_lotes', len(batches))
+        telemetry.incr('llm_lote_itens', len(items))
+
+        run = telemetry.bind(lambda keys: self._generate_keyed(keys, items, build_prompt))
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+            outcomes = list(pool.map(run, batches))
+
+        results, errors = {}, {}
+        for batch_results, batch_errors in outcomes:
+            results.update(batch_results)
+            errors.update(batch_errors)
+        return results, errors
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Cliente global (reaproveita conexões entre invocações quentes da Lambda)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
@@ -0,0 +1,246 @@
+import json
+import os
+from urllib.parse import unquote
+import sentinel_telemetry as telemetry
+from sentinel_llm import estimate_tokens
+from sentinel_sg_rules import PUBLIC_CIDRS, normalize_permissions, to_permissions
+
+# Redução do JSON enviado ao LLM: só os campos que pesam no veredito de segurança, em ordem canônica,
+# com estruturas repetidas colapsadas e um teto de tokens com marcadores explícitos de corte.
+# As regras locais continuam vendo o dado completo; só o prompt recebe a versão reduzida.
+
+# --- CONFIGURAÇÕES ---
+PAYLOAD_TOKEN_BUDGET = int(os.environ.get('SENTINEL_PAYLOAD_TOKENS', '6000'))
+PAYLOAD_IAC_TOKEN_BUDGET = int(os.environ.get('SENTINEL_PAYLOAD_IAC_TOKENS', '16000'))
+PAYLOAD_MAX_LIST = int(os.environ.get('SENTINEL_PAYLOAD_MAX_LIST', '50'))
+PAYLOAD_MAX_STRING = int(os.environ.get('SENTINEL_PAYLOAD_MAX_STRING', '2000'))
+
+# Campos do CloudTrail que chegam ao LLM (o resto é transporte: userAgent, tlsDetails, requestID...)
+CLOUDTRAIL_FIELDS = ('eventSource', 'eventName', 'awsRegion', 'errorCode', 'errorMessage',
+                     'userIdentity', 'requestParameters', 'responseElements')
+IDENTITY_FIELDS = ('type', 'arn', 'accountId', 'invokedBy')
+POLICY_FIELDS = ('Sid', 'Effect', 'Principal', 'NotPrincipal', 'Action', 'NotAction',
+                 'Resource', 'NotResource', 'Condition')
+# Parâmetros de eventos IAM que chegam como documento JSON url-encoded
+POLICY_DOCUMENT_KEYS = ('policyDocument', 'assumeRolePolicyDocument', 'permissionsBoundary')
+# Ruído de transporte que às vezes aparece aninhado em requestParameters/responseElements
+NOISE_KEYS = frozenset({'ResponseMetadata', 'requestId', 'requestID', 'RequestId', 'userAgent', 'tlsDetails',
+                        'sessionContext', 'sourceIPAddress', 'eventID', 'eventTime', 'creationDate'})
+# Metadados de editores que não mudam o template implantado
+TEMPLATE_NOISE_KEYS = frozenset({'AWS::CloudFormation::Designer', 'cfn-lint', 'cfn_nag'})
+
+# Níveis de corte tentados em ordem até o payload caber no orçamento: (itens por lista, caracteres por string)
+_LEVELS = ((None, None), (PAYLOAD_MAX_LIST, PAYLOAD_MAX_STRING), (20, 500), (5, 120))
+
+
+def to_prompt_json(payload):
+    """Serialização usada nos prompts: chaves ordenadas, sem espaços e sem escapar acentos."""
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def _sort_key(value):
+    return to_prompt_json(value)
+
+
+def compact(value, drop=NOISE_KEYS, canonical_lists=True):
+    """Remove chaves de ruído e valores vazios. Com `canonical_lists`, listas viram conjuntos ordenados
+    e elementos idênticos são colapsados em um só (dicts repetidos ganham '_repeticoes')."""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in drop:
+                continue
+            item = compact(item, drop, canonical_lists)
+            if canonical_lists and item in (None, '', [], {}):
+                continue
+            result[key] = item
+        return result
+    if isinstance(value, list):
+        items = [compact(v, drop, canonical_lists) for v in value]
+        if not canonical_lists:
+            return items
+        counts, order = {}, {}
+        for item in items:
+            key = _sort_key(item)
+            counts[key] = counts.get(key, 0) + 1
+            order.setdefault(key, item)
+        collapsed = []
+        for key in sorted(order):
+            item = order[key]
+            if isinstance(item, dict) and counts[key] > 1:
+                item = {**item, '_repeticoes': counts[key]}
+            collapsed.append(item)
+        return collapsed
+    return value
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _parse_document(document):
+    """Documento de policy em dict, string JSON ou string url-encoded (eventos IAM)."""
+    if isinstance(document, str):
+        for candidate in (document, unquote(document)):
+            try:
+                return json.loads(candidate)
+            except ValueError:
+                continue
+    return document
+
+
+def reduce_policy(document):
+    """Policy IAM/S3 canônica: só os campos de autorização, Action/Resource como listas ordenadas,
+    statements idênticos colapsados. Strings que não são JSON (ex: erro ao ler a policy) passam adiante."""
+    document = _parse_document(document)
+    if not isinstance(document, dict):
+        return document
+    statements = []
+    for statement in _as_list(document.get('Statement', [])):
+        if not isinstance(statement, dict):
+            continue
+        reduced = {}
+        for field in POLICY_FIELDS:
+            if field not in statement:
+                continue
+            value = statement[field]
+            if field in ('Action', 'NotAction', 'Resource', 'NotResource'):
+                value = sorted(set(map(str, _as_list(value))))
+            elif field in ('Principal', 'NotPrincipal') and isinstance(value, dict):
+                value = {k: sorted(set(map(str, _as_list(v)))) for k, v in value.items()}
+            reduced[field] = value
+        statements.append(reduced)
+    return {'Statement': compact(statements, drop=frozenset())}
+
+
+def reduce_s3(config):
+    """Config coletada de um bucket ({'bucketName', 'policy'})."""
+    return {'bucketName': config.get('bucketName'), 'policy': reduce_policy(config.get('policy'))}
+
+
+def _reduce_permissions(permissions):
+    """IpPermissions deduplicadas e agrupadas por protocolo/portas; origens públicas primeiro."""
+    reduced = []
+    for perm in to_permissions(normalize_permissions(permissions)):
+        for field in ('IpRanges', 'Ipv6Ranges'):
+            if field in perm:
+                perm[field] = sorted(perm[field], key=lambda r: (next(iter(r.values())) not in PUBLIC_CIDRS, to_prompt_json(r)))
+        reduced.append(perm)
+    return reduced
+
+
+def reduce_security_group(sg):
+    """Saída do describe_security_groups (ou do índice de exposição) sem metadados de conta e tags."""
+    reduced = {k: sg[k] for k in ('GroupId', 'GroupName', 'VpcId') if k in sg}
+    reduced['IpPermissions'] = _reduce_permissions(sg.get('IpPermissions'))
+    if sg.get('IpPermissionsEgress'):
+        reduced['IpPermissionsEgress'] = _reduce_permissions(sg['IpPermissionsEgress'])
+    return reduced
+
+
+def reduce_cloudtrail_event(detail):
+    """Evento CloudTrail genérico: quem fez o quê, em qual recurso, com quais parâmetros."""
+    reduced = {k: detail[k] for k in CLOUDTRAIL_FIELDS if detail.get(k) not in (None, '', {}, [])}
+    identity = detail.get('userIdentity') or {}
+    if identity:
+        reduced['userIdentity'] = {k: identity[k] for k in IDENTITY_FIELDS if k in identity}
+        # MFA é o único dado do sessionContext que pesa no veredito
+        mfa = ((identity.get('sessionContext') or {}).get('attributes') or {}).get('mfaAuthenticated')
+        if mfa is not None:
+            reduced['userIdentity']['mfaAuthenticated'] = mfa
+    reduced = compact(reduced)
+    params = reduced.get('requestParameters')
+    if isinstance(params, dict) and 'policy' in params:
+        # PutBucketPolicy e afins: a policy vem inteira no evento
+        params['policy'] = reduce_policy(params['policy'])
+    return reduced
+
+
+def _decode_policies(value):
+    if isinstance(value, dict):
+        return {k: reduce_policy(v) if k in POLICY_DOCUMENT_KEYS else _decode_policies(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode_policies(v) for v in value]
+    return value
+
+
+def reduce_iam_event(detail):
+    """Evento IAM: como o genérico, mas com os documentos de policy (url-encoded no CloudTrail)
+    decodificados e canônicos, tanto nos parâmetros quanto na resposta (ex: role.assumeRolePolicyDocument)."""
+    reduced = reduce_cloudtrail_event(detail)
+    for field in ('requestParameters', 'responseElements'):
+        if field in reduced:
+            reduced[field] = _decode_policies(reduced[field])
+    return reduced
+
+
+def reduce_resource(data):
+    """Escolhe o redutor pelo formato do dado coletado pela Lambda."""
+    if not isinstance(data, dict):
+        return data
+    if 'eventSource' in data and 'eventName' in data:
+        if str(data['eventSource']).startswith('iam.'):
+            return reduce_iam_event(data)
+        return reduce_cloudtrail_event(data)
+    if 'GroupId' in data and 'IpPermissions' in data:
+        return reduce_security_group(data)
+    if 'bucketName' in data and 'policy' in data:
+        return reduce_s3(data)
+    return compact(data)
+
+
+def _strip_template_noise(value):
+    if isinstance(value, dict):
+        return {k: _strip_template_noise(v) for k, v in value.items() if k not in TEMPLATE_NOISE_KEYS}
+    if isinstance(value, list):
+        return [_strip_template_noise(v) for v in value]
+    return value
+
+
+def reduce_template(template):
+    """Template CloudFormation sem metadados de editor. A ordem das listas é preservada
+    (Fn::Join, Fn::Select e afins dependem dela); as chaves saem ordenadas na serialização."""
+    if not isinstance(template, dict):
+        return template
+    reduced = _strip_template_noise({k: v for k, v in template.items() if k != 'AWSTemplateFormatVersion'})
+    return compact(reduced, drop=frozenset(), canonical_lists=False)
+
+
+def _truncate(value, max_list, max_string):
+    if isinstance(value, dict):
+        return {k: _truncate(v, max_list, max_string) for k, v in value.items()}
+    if isinstance(value, list):
+        items = [_truncate(v, max_list, max_string) for v in value[:max_list]]
+        if len(value) > max_list:
+            items.append(f"…[+{len(value) - max_list} item(ns) omitido(s)]")
+        return items
+    if isinstance(value, str) and len(value) > max_string:
+        return value[:max_string] + f"…[+{len(value) - max_string} caractere(s)]"
+    return value
+
+
+def fit_budget(payload, budget):
+    """Corta listas e strings longas, em níveis, até caber em `budget` tokens.
+    Se nem o nível mais agressivo couber, envia o JSON parcial com um marcador de corte."""
+    for max_list, max_string in _LEVELS:
+        candidate = payload if max_list is None else _truncate(payload, max_list, max_string)
+        text = to_prompt_json(candidate)
+        if estimate_tokens(text) <= budget:
+            return candidate
+    return {'_truncado': f"payload cortado em ~{budget} tokens", 'json_parcial': text[:budget * 4]}
+
+
+def _measure(raw, payload):
+    telemetry.incr('payload_bruto_bytes', len(json.dumps(raw, default=str)))
+    telemetry.incr('payload_bytes', len(to_prompt_json(payload)))
+    return payload
+
+
+def minimize(data, budget=PAYLOAD_TOKEN_BUDGET):
+    """Payload de recurso/evento pronto para o prompt da Lambda."""
+    return _measure(data, fit_budget(reduce_resource(data), budget))
+
+
+def minimize_template(template, budget=PAYLOAD_IAC_TOKEN_BUDGET):
+    """Template pronto para o prompt do scanner de IaC."""
+    return _measure(template, fit_budget(reduce_template(template), budget))
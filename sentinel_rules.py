@@ -0,0 +1,205 @@
+import os
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+# --- CONFIGURAÇÕES ---
+# Permite desligar o fast path (ex: para comparar vereditos com a IA)
+RULES_ENABLED = os.environ.get('SENTINEL_RULES_ENABLED', 'true').lower() != 'false'
+
+# Portas administrativas e de banco de dados que nunca devem ficar abertas para a internet
+ADMIN_DB_PORTS = (
+    21, 22, 23, 135, 139, 445, 1433, 1521, 2375, 2376, 3306, 3389,
+    5432, 5439, 5601, 5900, 5984, 6379, 9200, 9300, 11211, 27017,
+)
+# Portas públicas "esperadas" (web). Só elas abertas para o mundo = configuração benigna
+WEB_PORTS = (80, 443)
+PUBLIC_CIDRS = frozenset({'0.0.0.0/0', '::/0'})
+
+# Compilado uma única vez no import: tupla ordenada permite busca por intervalo com bisect
+_ADMIN_PORTS_SORTED = tuple(sorted(set(ADMIN_DB_PORTS)))
+_WEB_PORTS = frozenset(WEB_PORTS)
+
+
+def _range_hits_ports(from_port, to_port, sorted_ports):
+    """Retorna a primeira porta de `sorted_ports` dentro de [from_port, to_port], ou None."""
+    i = bisect_left(sorted_ports, from_port)
+    if i < len(sorted_ports) and sorted_ports[i] <= to_port:
+        return sorted_ports[i]
+    return None
+
+
+def _perm_port_range(perm):
+    """Normaliza o intervalo de portas de uma IpPermission. Protocolo -1 significa todas as portas."""
+    if str(perm.get('IpProtocol')) == '-1':
+        return 0, 65535
+    return perm.get('FromPort', 0), perm.get('ToPort', 65535)
+
+
+def _public_cidrs(perm):
+    cidrs = [r.get('CidrIp') for r in perm.get('IpRanges', []) if isinstance(r, dict)]
+    cidrs += [r.get('CidrIpv6') for r in perm.get('Ipv6Ranges', []) if isinstance(r, dict)]
+    return [c for c in cidrs if c in PUBLIC_CIDRS]
+
+
+def _verdict(status, risco, gravidade, detalhe, auto_correcao, rule_name):
+    """Monta o veredito no mesmo schema retornado por ask_gemini (e lido pelo Dashboard)."""
+    return {
+        "status": status,
+        "risco": risco,
+        "gravidade": gravidade,
+        "detalhe": detalhe,
+        "auto_correcao": auto_correcao,
+        "origem": f"regra:{rule_name}",
+    }
+
+
+class RuleEngine:
+    """Avalia regras determinísticas localmente. Retorna um veredito definitivo ou None (escalar para a IA)."""
+
+    def __init__(self):
+        self._rules = {}
+        self._lock = threading.Lock()
+        self.hits = Counter()
+
+    def rule(self, resource_type, name):
+        """Decorator para registrar uma regra. A ordem de registro é a ordem de avaliação."""
+        def decorator(func):
+            self._rules.setdefault(resource_type, []).append((name, func))
+            return func
+        return decorator
+
+    def evaluate(self, resource_type, data):
+        if not RULES_ENABLED or not isinstance(data, dict):
+            return None
+        for name, func in self._rules.get(resource_type, []):
+            try:
+                verdict = func(data)
+            except Exception as e:
+                print(f"⚠️ Aviso: Regra {name} falhou, ignorando: {e}")
+                continue
+            if verdict is not None:
+                with self._lock:
+                    self.hits[name] += 1
+                return verdict
+        with self._lock:
+            self.hits['escalado_llm'] += 1
+        return None
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.hits)
+        escalated = stats.get('escalado_llm', 0)
+        total = sum(stats.values())
+        stats['llm_evitado'] = total - escalated
+        return stats
+
+
+rule_engine = RuleEngine()
+
+
+# --- REGRAS: SECURITY GROUP (saída de get_sg_config) ---
+
+@rule_engine.rule('SG', 'sg-porta-admin-aberta')
+def sg_admin_port_open(sg):
+    for perm in sg.get('IpPermissions', []):
+        if not isinstance(perm, dict):
+            continue
+        cidrs = _public_cidrs(perm)
+        if not cidrs:
+            continue
+        from_port, to_port = _perm_port_range(perm)
+        port = _range_hits_ports(from_port, to_port, _ADMIN_PORTS_SORTED)
+        if port is not None:
+            return _verdict(
+                "VULNERAVEL",
+                f"Porta administrativa/banco {port} exposta para a internet ({cidrs[0]})",
+                "ALTA",
+                f"Security Group {sg.get('GroupId')} permite ingress {perm.get('IpProtocol')} {from_port}-{to_port} de {', '.join(cidrs)}.",
+                "Revogar a regra inbound e restringir a origem a CIDRs corporativos, VPN ou Security Groups.",
+                'sg-porta-admin-aberta',
+            )
+    return None
+
+
+@rule_engine.rule('SG', 'sg-sem-exposicao-critica')
+def sg_benign(sg):
+    # Só decide quando o estado Boto3 veio completo (erros de coleta vão para a IA)
+    if 'IpPermissions' not in sg:
+        return None
+    for perm in sg['IpPermissions']:
+        if not isinstance(perm, dict):
+            return None
+        if not _public_cidrs(perm):
+            continue
+        from_port, to_port = _perm_port_range(perm)
+        # Aberto para o mundo em algo que não é 80/443: ambíguo, a IA decide
+        if from_port != to_port or from_port not in _WEB_PORTS:
+            return None
+    return _verdict(
+        "SEGURO",
+        "Nenhuma exposição crítica",
+        "BAIXA",
+        f"Security Group {sg.get('GroupId')} não expõe portas além de HTTP/HTTPS para a internet.",
+        "Nenhuma ação necessária.",
+        'sg-sem-exposicao-critica',
+    )
+
+
+# --- REGRAS: S3 (saída de get_s3_config) ---
+
+def _is_wildcard_principal(principal):
+    if principal == '*':
+        return True
+    if isinstance(principal, dict):
+        aws = principal.get('AWS')
+        return aws == '*' or (isinstance(aws, list) and '*' in aws)
+    return False
+
+
+def _statements(policy):
+    statements = policy.get('Statement', [])
+    return [statements] if isinstance(statements, dict) else statements
+
+
+@rule_engine.rule('S3', 's3-principal-publico')
+def s3_public_principal(config):
+    policy = config.get('policy')
+    if not isinstance(policy, dict):
+        return None
+    for stmt in _statements(policy):
+        if not isinstance(stmt, dict):
+            continue
+        if stmt.get('Effect') == 'Allow' and _is_wildcard_principal(stmt.get('Principal')) and not stmt.get('Condition'):
+            return _verdict(
+                "VULNERAVEL",
+                "Bucket policy concede acesso público (Principal: \"*\") sem condições",
+                "ALTA",
+                f"Statement {stmt.get('Sid', '(sem Sid)')} do bucket {config.get('bucketName')} permite {stmt.get('Action')} para qualquer principal.",
+                "Remover o statement público e habilitar o S3 Block Public Access.",
+                's3-principal-publico',
+            )
+    return None
+
+
+@rule_engine.rule('S3', 's3-sem-politica-publica')
+def s3_benign(config):
+    policy = config.get('policy')
+    # Bucket sem policy é privado por padrão
+    if isinstance(policy, str) and 'NoSuchBucketPolicy' in policy:
+        return _verdict(
+            "SEGURO", "Bucket sem política pública", "BAIXA",
+            f"Bucket {config.get('bucketName')} não possui bucket policy.",
+            "Nenhuma ação necessária.", 's3-sem-politica-publica',
+        )
+    if not isinstance(policy, dict):
+        return None
+    # Benigno apenas se a policy só restringe (ex: SSL-only). Qualquer Allow fica para a IA avaliar
+    for stmt in _statements(policy):
+        if not isinstance(stmt, dict) or stmt.get('Effect') != 'Deny':
+            return None
+    return _verdict(
+        "SEGURO", "Bucket policy apenas restritiva", "BAIXA",
+        f"Bucket {config.get('bucketName')} só possui statements Deny na policy.",
+        "Nenhuma ação necessária.", 's3-sem-politica-publica',
+    )
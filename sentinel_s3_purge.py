@@ -0,0 +1,223 @@
+import json
+import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from botocore.exceptions import ClientError
+import sentinel_aws as aws
+import sentinel_telemetry as telemetry
+from sentinel_schema import PURGE_PREFIX
+
+# --- CONFIGURAÇÕES ---
+PURGE_WORKERS = int(os.environ.get('SENTINEL_PURGE_WORKERS', '8'))
+PURGE_MAX_RETRIES = int(os.environ.get('SENTINEL_PURGE_MAX_RETRIES', '3'))
+# Teto do tempo gasto apagando nesta invocação; na Lambda vale o menor entre ele e o tempo restante da invocação
+PURGE_TIME_BUDGET = float(os.environ.get('SENTINEL_PURGE_TIME_BUDGET', '600'))
+# Acima deste número de versões listadas, o grosso da exclusão vai para uma regra de lifecycle
+PURGE_LIFECYCLE_THRESHOLD = int(os.environ.get('SENTINEL_PURGE_LIFECYCLE_THRESHOLD', '1000000'))
+# 'dynamodb' (compartilhado entre containers) ou um diretório local
+PURGE_CHECKPOINT = os.environ.get('SENTINEL_PURGE_CHECKPOINT', 'dynamodb')
+DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'SentinelMonitor')
+
+CHECKPOINT_PREFIX = PURGE_PREFIX
+LIFECYCLE_RULE_ID = 'sentinel-purge'
+
+
+class CheckpointStore:
+    """Guarda os marcadores de listagem (KeyMarker/VersionIdMarker) já apagados com sucesso.
+
+    `prefix` separa outros usos do mesmo mecanismo (ex: a varredura completa usa SWEEP_PREFIX).
+    """
+
+    def __init__(self, backend=PURGE_CHECKPOINT, prefix=CHECKPOINT_PREFIX):
+        self.backend = backend
+        self.prefix = prefix
+
+    def _dynamo(self):
+        return aws.table(DYNAMODB_TABLE)
+
+    def _path(self, bucket):
+        return os.path.join(self.backend, f"{self.prefix.strip('#').lower()}-{bucket}.state")
+
+    def load(self, bucket):
+        try:
+            if self.backend == 'dynamodb':
+                item = self._dynamo().get_item(Key={'id_recurso': f"{self.prefix}{bucket}"}).get('Item')
+                return json.loads(item['estado']) if item else None
+            with open(self._path(bucket), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ Aviso: Não foi possível ler o checkpoint de {bucket}: {e}")
+            return None
+
+    def save(self, bucket, state):
+        try:
+            if self.backend == 'dynamodb':
+                self._dynamo().put_item(Item={'id_recurso': f"{self.prefix}{bucket}", 'estado': json.dumps(state)})
+            else:
+                os.makedirs(self.backend, exist_ok=True)
+                with open(self._path(bucket), 'w', encoding='utf-8') as f:
+                    json.dump(state, f)
+        except Exception as e:
+            print(f"⚠️ Aviso: Não foi possível gravar o checkpoint de {bucket}: {e}")
+
+    def clear(self, bucket):
+        try:
+            if self.backend == 'dynamodb':
+                self._dynamo().delete_item(Key={'id_recurso': f"{self.prefix}{bucket}"})
+            elif os.path.exists(self._path(bucket)):
+                os.remove(self._path(bucket))
+        except Exception as e:
+            print(f"⚠️ Aviso: Não foi possível limpar o checkpoint de {bucket}: {e}")
+
+
+def block_public_access(s3, bucket):
+    """Corta o acesso público em segundos, antes de qualquer exclusão (policies públicas deixam de valer)."""
+    s3.put_public_access_block(
+        Bucket=bucket,
+        PublicAccessBlockConfiguration={
+            'BlockPublicAcls': True,
+            'IgnorePublicAcls': True,
+            'BlockPublicPolicy': True,
+            'RestrictPublicBuckets': True,
+        },
+    )
+
+
+def apply_expiration_lifecycle(s3, bucket):
+    """Fallback para buckets enormes: o próprio S3 expira versões, delete markers e uploads incompletos."""
+    s3.put_bucket_lifecycle_configuration(
+        Bucket=bucket,
+        LifecycleConfiguration={'Rules': [{
+            'ID': LIFECYCLE_RULE_ID,
+            'Status': 'Enabled',
+            'Filter': {'Prefix': ''},
+            'Expiration': {'Days': 1},
+            'NoncurrentVersionExpiration': {'NoncurrentDays': 1},
+            'AbortIncompleteMultipartUpload': {'DaysAfterInitiation': 1},
+        }, {
+            'ID': f"{LIFECYCLE_RULE_ID}-markers",
+            'Status': 'Enabled',
+            'Filter': {'Prefix': ''},
+            'Expiration': {'ExpiredObjectDeleteMarker': True},
+        }]},
+    )
+
+
+def delete_batch(s3, bucket, objects):
+    """Apaga até 1000 versões. Reenvia apenas as chaves que voltaram em `Errors`. Retorna as que falharam de vez."""
+    pending = objects
+    for attempt in range(PURGE_MAX_RETRIES + 1):
+        try:
+            response = s3.delete_objects(Bucket=bucket, Delete={'Objects': pending, 'Quiet': True})
+            errors = response.get('Errors', [])
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchBucket', '404'):
+                raise
+            errors = [{'Key': o['Key'], 'VersionId': o.get('VersionId'), 'Code': e.response['Error']['Code']} for o in pending]
+        if not errors:
+            return []
+        pending = [{'Key': err['Key'], 'VersionId': err['VersionId']} if err.get('VersionId') else {'Key': err['Key']} for err in errors]
+        if attempt < PURGE_MAX_RETRIES:
+            time.sleep(random.uniform(0, 0.2 * (2 ** attempt)))
+    return errors
+
+
+def purge_bucket(s3, bucket, checkpoints=None, workers=PURGE_WORKERS, time_budget=PURGE_TIME_BUDGET, deadline=None):
+    """Esvazia e exclui o bucket. Listagem e exclusões correm em paralelo (janela limitada de lotes em voo).
+
+    O checkpoint só avança até o último lote cuja exclusão terminou junto com todos os anteriores,
+    então uma invocação seguinte pode retomar de onde esta parou sem pular objetos.
+    `deadline` (epoch) é o limite da invocação que chamou: o orçamento nunca passa dele, senão a Lambda
+    seria morta no meio de um lote sem gravar o checkpoint.
+    """
+    checkpoints = checkpoints or CheckpointStore()
+    started = time.time()
+    if deadline is not None:
+        time_budget = max(0.0, min(time_budget, deadline - started))
+
+    block_public_access(s3, bucket)
+    print(f"🔒 Acesso público bloqueado em {bucket}.")
+
+    state = checkpoints.load(bucket) or {'apagados': 0, 'falhas': 0}
+    if state.get('KeyMarker'):
+        print(f"⏯️ Retomando exclusão de {bucket} a partir de '{state['KeyMarker']}' ({state['apagados']} já apagados).")
+
+    paginate_args = {'Bucket': bucket, 'PaginationConfig': {'PageSize': 1000}}
+    if state.get('KeyMarker'):
+        paginate_args['KeyMarker'] = state['KeyMarker']
+        if state.get('VersionIdMarker'):
+            paginate_args['VersionIdMarker'] = state['VersionIdMarker']
+
+    listed = state['apagados']
+    in_flight = {}  # future -> (ordem, marcadores após o lote)
+    done_order = {}
+    next_to_commit = 0
+    order = 0
+    failed_keys = []
+    exhausted_budget = False
+
+    def _commit_finished():
+        """Avança o checkpoint sobre os lotes concluídos em ordem."""
+        nonlocal next_to_commit
+        while next_to_commit in done_order:
+            markers, deleted = done_order.pop(next_to_commit)
+            state['apagados'] += deleted
+            if markers:
+                state['KeyMarker'], state['VersionIdMarker'] = markers
+            next_to_commit += 1
+        checkpoints.save(bucket, state)
+
+    def _collect(done):
+        for future in done:
+            batch_order, markers, size = in_flight.pop(future)
+            errors = future.result()
+            failed_keys.extend(errors)
+            done_order[batch_order] = (markers, size - len(errors))
+        _commit_finished()
+
+    delete = telemetry.bind(delete_batch)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for page in s3.get_paginator('list_object_versions').paginate(**paginate_args):
+            objects = [{'Key': v['Key'], 'VersionId': v['VersionId']} for v in page.get('Versions', [])]
+            objects += [{'Key': m['Key'], 'VersionId': m['VersionId']} for m in page.get('DeleteMarkers', [])]
+            listed += len(objects)
+            markers = (page['NextKeyMarker'], page.get('NextVersionIdMarker', '')) if page.get('IsTruncated') else None
+            if objects:
+                # Janela limitada: no máximo 2x workers lotes em memória
+                while len(in_flight) >= workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    _collect(done)
+                in_flight[pool.submit(delete, s3, bucket, objects)] = (order, markers, len(objects))
+            else:
+                done_order[order] = (markers, 0)
+            order += 1
+
+            if time.time() - started > time_budget or listed > PURGE_LIFECYCLE_THRESHOLD:
+                exhausted_budget = True
+                break
+        done, _ = wait(in_flight)
+        _collect(done)
+
+    state['falhas'] = len(failed_keys)
+    if exhausted_budget:
+        apply_expiration_lifecycle(s3, bucket)
+        checkpoints.save(bucket, state)
+        msg = (f"Acesso público bloqueado e {state['apagados']} objetos/versões apagados. Bucket grande demais para esta "
+               f"invocação: regra de lifecycle aplicada e a exclusão continuará a partir do checkpoint.")
+        print(f"⏸️ {msg}")
+        return {"status": "PARCIAL", "acao": "Exclusão de Bucket S3", "detalhe": msg}
+
+    if failed_keys:
+        checkpoints.save(bucket, {'apagados': state['apagados'], 'falhas': len(failed_keys)})
+        msg = f"Acesso público bloqueado, mas {len(failed_keys)} objeto(s) não puderam ser apagados (ex: {failed_keys[0].get('Code')})."
+        print(f"⚠️ {msg}")
+        return {"status": "PARCIAL", "acao": "Exclusão de Bucket S3", "detalhe": msg}
+
+    s3.delete_bucket(Bucket=bucket)
+    checkpoints.clear(bucket)
+    msg = f"Bucket {bucket} e todo seu conteúdo ({state['apagados']} objetos/versões) foram excluídos com sucesso."
+    print(f"✅ {msg}")
+    return {"status": "SUCESSO", "acao": "Exclusão de Bucket S3", "detalhe": msg}
@@ -2,9 +2,11 @@ import json
 import sys
 import os
 import glob
-import requests
-import boto3
+import argparse
+import hashlib
+import subprocess
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # Carrega var de ambiente localmente. 
 # No GitHub Actions (CI/CD), as vars vêm do Secrets e o dotenv não é necessário.
@@ -14,50 +16,126 @@ try:
 except ImportError:
     pass
 
+# Módulos do Sentinel leem a configuração do ambiente no import, então vêm depois do dotenv
+import sentinel_aws as aws
+import sentinel_telemetry as telemetry
+from sentinel_cache import verdict_cache
+from sentinel_governor import governor
+from sentinel_llm import get_client as get_llm_client, LLMHTTPError, LLMThrottled
+from sentinel_payload import minimize_template, to_prompt_json
+from sentinel_store import index_fields
+from sentinel_findings import write_findings
+from sentinel_template import should_chunk, analyze_template_chunked, group_resources, build_sub_template, merge_group_results
+
 # --- CONFIGURAÇÃO ---
-GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-2')
 DYNAMODB_TABLE = 'SentinelMonitor'
 
+# Análises simultâneas (timeouts e retry das chamadas ficam no cliente de LLM compartilhado)
+SCAN_WORKERS = int(os.environ.get('SENTINEL_SCAN_WORKERS', '4'))
+# Vários templates (e grupos de stacks grandes) por requisição ao LLM
+SCAN_BATCH = os.environ.get('SENTINEL_SCAN_BATCH', '0') == '1'
+# Passadas extras sobre os arquivos adiados por falta de cota do LLM (cada chamada ainda espera o governador)
+SCAN_DEFER_PASSES = int(os.environ.get('SENTINEL_SCAN_DEFER_PASSES', '2'))
+
+# Modo incremental: manifesto com o hash dos templates já aprovados.
+# Sem extensão .json de propósito, para não ser apanhado pelo glob do scanner.
+MANIFEST_PATH = os.environ.get('SENTINEL_MANIFEST', '.sentinel_manifest')
+
 try:
-    dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
-    table = dynamodb.Table(DYNAMODB_TABLE)
+    table = aws.table(DYNAMODB_TABLE, AWS_REGION)
 except Exception as e:
     print(f"⚠️ Aviso: Não foi possível conectar ao DynamoDB: {e}")
     table = None
 
-def save_to_dashboard(filename, status, risco, detalhe, correcao):
-    """Salva o resultado do scan no DynamoDB para o Dashboard"""
-    if not table: return
+# Sem cota do LLM nesta execução: o arquivo não foi analisado (nem aprovado, nem reprovado)
+DEFERRED_STATUS = 'ADIADO'
+DEFERRED_RESULT = {"status": DEFERRED_STATUS, "risco": "Análise adiada: cota do LLM esgotada"}
 
-    try:
-        run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
-        
-        item = {
-            'id_recurso': f"PR-{run_id}-{filename}",
-            'data_evento': str(datetime.now()),
-            'tipo': 'IAC',
-            'status_ia': 'VULNERAVEL' if status == 'REPROVADO' else 'SEGURO',
-            'risco': risco if risco else "Nenhum risco detectado",
-            'detalhe': detalhe if detalhe else "Arquivo aprovado na análise estática.",
-            'auto_correcao': correcao if correcao else "Nenhuma ação necessária.", # Campo restaurado
-            'usuario': 'GitHub Actions CI/CD',
-            'json_analise': json.dumps({'status': status, 'file': filename})
-        }
-        table.put_item(Item=item)
-        print(f"💾 Resultado de '{filename}' salvo no Dashboard.")
-    except Exception as e:
-        print(f"❌ Erro ao salvar no banco: {e}")
+def scan_run_id(now=None):
+    """Identificador da execução. No GitHub Actions é o run + tentativa, então salvar o mesmo arquivo
+    duas vezes no mesmo job não duplica a linha. Fora do CI, o timestamp de sempre."""
+    if os.environ.get('GITHUB_RUN_ID'):
+        return f"{os.environ['GITHUB_RUN_ID']}-{os.environ.get('GITHUB_RUN_ATTEMPT', '1')}"
+    return (now or datetime.now()).strftime("%Y%m%d-%H%M%S")
+
+def build_dashboard_item(filename, status, risco, detalhe, correcao, recursos=None):
+    """Monta o item do Dashboard para o resultado do scan de um arquivo"""
+    now = datetime.now()
+    run_id = scan_run_id(now)
+    analise = {'status': status, 'file': filename}
+    if recursos:
+        # Relatório por recurso (templates analisados em grupos)
+        analise['recursos'] = recursos
+    return {
+        'id_recurso': f"PR-{run_id}-{filename}",
+        'data_evento': str(now),
+        'tipo': 'IAC',
+        'status_ia': 'VULNERAVEL' if status == 'REPROVADO' else 'SEGURO',
+        'risco': risco if risco else "Nenhum risco detectado",
+        'detalhe': detalhe if detalhe else "Arquivo aprovado na análise estática.",
+        'auto_correcao': correcao if correcao else "Nenhuma ação necessária.", # Campo restaurado
+        'usuario': 'GitHub Actions CI/CD',
+        'json_analise': json.dumps(analise),
+        # Atributos dos GSIs consultados pelo Dashboard
+        **index_fields('IAC', str(now))
+    }
+
+def save_batch_to_dashboard(results):
+    """Salva vários resultados [(filename, res), ...] em lotes de 25, sem regravar os que já estão na tabela"""
+    # Arquivos adiados não têm veredito: gravá-los viraria um achado "SEGURO" sem análise
+    results = [(filename, res) for filename, res in results if res.get('status') != DEFERRED_STATUS]
+    if not table or not results: return
+
+    with telemetry.invocation('save_batch_to_dashboard'):
+        telemetry.incr('itens', len(results))
+        try:
+            items = [
+                build_dashboard_item(
+                    filename, res.get('status', 'ERRO'), res.get('risco'), res.get('detalhe'), res.get('correcao'),
+                    res.get('recursos'),
+                )
+                for filename, res in results
+            ]
+            written = write_findings(table, items)
+            print(f"💾 {written} resultado(s) salvos no Dashboard.")
+        except Exception as e:
+            print(f"❌ Erro ao salvar no banco: {e}")
 
 def analyze_iac(file_path):
+    # Métricas por arquivo (SENTINEL_METRICS=1 para emitir também no CI)
+    with telemetry.invocation('analyze_iac'):
+        telemetry.set_property('arquivo', file_path)
+        result = _analyze_iac(file_path)
+        telemetry.set_property('veredito', result.get('status'))
+        return result
+
+def _analyze_iac(file_path):
     print(f"\n🔍 Sentinel AI: Auditoria Semântica em '{file_path}'...")
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
+        with telemetry.stage('leitura'), open(file_path, 'r', encoding='utf-8') as f:
             iac_data = json.load(f)
     except Exception as e:
         return {"status": "ERRO_LEITURA", "risco": f"Erro ao ler arquivo: {e}"}
 
+    def analyze(data):
+        # Template idêntico a um já auditado: reaproveita o veredito sem chamar o Gemini
+        try:
+            return verdict_cache.get_or_compute('iac', data, ask_gemini_iac)
+        except LLMThrottled as e:
+            print(f"⏸️ Análise de '{file_path}' adiada: {e}")
+            return dict(DEFERRED_RESULT)
+
+    # Stacks grandes: grupos de recursos conectados analisados em paralelo, em prompts menores
+    with telemetry.stage('analise'):
+        if should_chunk(iac_data):
+            return analyze_template_chunked(iac_data, analyze)
+        return analyze(iac_data)
+
+def ask_gemini_iac(iac_data):
+    """Envia o template IaC para o Gemini e retorna o veredito APROVADO/REPROVADO"""
+
     # PROMPT AMPLIADO (Auditoria Geral de Segurança)
     prompt = f"""
     Atue como Auditor DevSecOps Sênior. Sua missão é realizar uma análise de segurança profunda neste arquivo de Infraestrutura como Código (IaC).
@@ -70,7 +148,7 @@ def analyze_iac(file_path):
     4. GOVERNANÇA: Ausência de logs, monitoramento ou versionamento.
     5. SEGREDOS: Chaves de acesso ou senhas expostas no código.
 
-    ARQUIVO: {json.dumps(iac_data, default=str)}
+    ARQUIVO: {to_prompt_json(minimize_template(iac_data))}
 
     Responda ESTRITAMENTE em formato JSON (sem markdown):
     {{
@@ -81,44 +159,224 @@ def analyze_iac(file_path):
     }}
     """
     
-    # Usando o modelo flash 2.0 que é mais rápido e inteligente para código
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}"
-    headers = {"Content-Type": "application/json"}
-    body = {"contents": [{"parts": [{"text": prompt}]}]}
-    
+    # Modelo e endpoint configuráveis (SENTINEL_LLM_MODEL / SENTINEL_LLM_ENDPOINT); padrão: gemini-2.0-flash
     try:
-        response = requests.post(url, headers=headers, json=body)
-        if response.status_code != 200: 
-            print(f"Erro API: {response.text}")
-            return {"status": "ERRO_API"}
-        
-        text = response.json()['candidates'][0]['content']['parts'][0]['text']
-        clean_text = text.replace("```json", "").replace("```", "").strip()
-        return json.loads(clean_text)
+        return get_llm_client().generate_json(prompt)
+    except LLMThrottled:
+        # Sem cota não é falha do template: quem chamou adia o arquivo para uma nova passada
+        raise
+    except LLMHTTPError as e:
+        print(f"Erro API: {e}")
+        return {"status": "ERRO_API"}
     except Exception as e:
         print(f"Erro na análise: {e}")
         return {"status": "ERRO_GERAL"}
 
+def ask_gemini_iac_batch(templates):
+    """Versão em lote do ask_gemini_iac: {chave: template} -> {chave: veredito}"""
+
+    def build_prompt(batch):
+        return f"""
+    Atue como Auditor DevSecOps Sênior. Sua missão é realizar uma análise de segurança profunda em CADA um dos {len(batch)} arquivos de Infraestrutura como Código (IaC) abaixo, de forma independente.
+    Não se limite a regras fixas. Identifique qualquer configuração que viole os princípios do AWS Well-Architected Framework ou Benchmarks CIS.
+
+    FOCO DA ANÁLISE:
+    1. EXPOSIÇÃO: Portas administrativas ou de banco de dados abertas para o mundo.
+    2. PRIVILÉGIO: Uso de "AdministratorAccess", "Action: *" ou falta de MFA.
+    3. CRIPTOGRAFIA: Recursos de armazenamento (S3, EBS, RDS) sem criptografia ativa.
+    4. GOVERNANÇA: Ausência de logs, monitoramento ou versionamento.
+    5. SEGREDOS: Chaves de acesso ou senhas expostas no código.
+
+    LOTE (objeto "id" -> ARQUIVO): {to_prompt_json(batch)}
+
+    Responda ESTRITAMENTE com um array JSON (sem markdown), com exatamente um objeto por id:
+    [
+        {{
+            "id": "id do arquivo, exatamente como recebido",
+            "status": "APROVADO" ou "REPROVADO",
+            "risco": "Título do risco (ex: RDS sem Criptografia)",
+            "detalhe": "Explicação técnica de como isso afeta a segurança",
+            "correcao": "O que o desenvolvedor deve mudar no código"
+        }}
+    ]
+    """
+
+    templates = {key: minimize_template(template) for key, template in templates.items()}
+    results, errors = get_llm_client().generate_batch(templates, build_prompt, workers=SCAN_WORKERS)
+    for key, e in errors.items():
+        if isinstance(e, LLMThrottled):
+            # Fica sem veredito (e fora do cache): scan_files_batched adia a unidade
+            print(f"⏸️ Análise de {key} adiada: {e}")
+            continue
+        print(f"Erro na análise de {key}: {e}")
+        results[key] = {"status": "ERRO_API" if isinstance(e, LLMHTTPError) else "ERRO_GERAL"}
+    return results
+
+def retry_deferred(results, rescan, passes=SCAN_DEFER_PASSES):
+    """Novas passadas só sobre os arquivos adiados por falta de cota, com `rescan(arquivos)` -> [(arquivo, res)].
+    O que continuar sem cota depois de `passes` passadas sai como ADIADO (nunca como ERRO_API)."""
+    results = dict(results)
+    for attempt in range(passes):
+        deferred = [f for f, res in results.items() if res.get('status') == DEFERRED_STATUS]
+        if not deferred:
+            break
+        print(f"⏳ {len(deferred)} arquivo(s) adiados por falta de cota do LLM; nova passada ({attempt + 1}/{passes}).")
+        telemetry.incr('arquivos_adiados', len(deferred))
+        results.update(rescan(deferred))
+    return list(results.items())
+
+def scan_files_batched(files):
+    """Como scan_files, mas com as análises agrupadas em poucas requisições.
+    Templates pequenos vão inteiros; stacks grandes entram como seus grupos de recursos conectados."""
+    return retry_deferred(_scan_files_batched(files), _scan_files_batched)
+
+def _scan_files_batched(files):
+    with telemetry.invocation('scan_files_batched'):
+        telemetry.incr('arquivos', len(files))
+        results, units, chunked = {}, {}, {}
+        for file_path in files:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    iac_data = json.load(f)
+            except Exception as e:
+                results[file_path] = {"status": "ERRO_LEITURA", "risco": f"Erro ao ler arquivo: {e}"}
+                continue
+            if should_chunk(iac_data):
+                groups = group_resources(iac_data['Resources'])
+                chunked[file_path] = groups
+                for i, group in enumerate(groups):
+                    units[f"{file_path}#{i}"] = build_sub_template(iac_data, group)
+            else:
+                units[file_path] = iac_data
+
+        print(f"🧠 {len(files)} arquivo(s) -> {len(units)} unidade(s) de análise em lote.")
+        verdicts = verdict_cache.get_or_compute_many('iac', units, ask_gemini_iac_batch)
+
+        for file_path in files:
+            if file_path in chunked:
+                groups = chunked[file_path]
+                results[file_path] = merge_group_results(
+                    groups, [verdicts.get(f"{file_path}#{i}") or DEFERRED_RESULT for i in range(len(groups))])
+            elif file_path not in results:
+                results[file_path] = verdicts.get(file_path) or dict(DEFERRED_RESULT)
+        return [(f, results[f]) for f in files]
+
+def file_hash(file_path):
+    """SHA-256 do conteúdo bruto do arquivo"""
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_manifest(path=MANIFEST_PATH):
+    """Carrega o manifesto {arquivo: {hash, veredito}} dos templates aprovados anteriormente"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('arquivos', {})
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️ Aviso: Manifesto inválido ({e}). Todos os arquivos serão analisados.")
+        return {}
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Grava o manifesto de forma atômica (arquivo temporário + rename)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'versao': 1, 'arquivos': manifest}, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def changed_files(base_ref):
+    """Arquivos alterados em relação a `base_ref` (inclui mudanças não commitadas). None se o git falhar."""
+    try:
+        committed = subprocess.run(
+            ['git', 'diff', '--name-only', '--diff-filter=ACMR', f'{base_ref}...HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        local = subprocess.run(
+            ['git', 'diff', '--name-only', '--diff-filter=ACMR', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        untracked = subprocess.run(
+            ['git', 'ls-files', '--others', '--exclude-standard'],
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        return set(committed) | set(local) | set(untracked)
+    except Exception as e:
+        print(f"⚠️ Aviso: Não foi possível comparar com '{base_ref}' ({e}). Fazendo scan completo.")
+        return None
+
+def scan_files(files, workers=SCAN_WORKERS):
+    """Analisa os arquivos em paralelo (pool limitado). O resultado mantém a ordem de `files`.
+    Os adiados por falta de cota são refeitos um a um, sem disputar a cota com o pool inteiro."""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(zip(files, pool.map(analyze_iac, files)))
+    return retry_deferred(results, lambda deferred: [(f, analyze_iac(f)) for f in deferred])
+
 # --- MAIN ---
 if __name__ == "__main__":
-    files = glob.glob("*.json")
+    parser = argparse.ArgumentParser(description="Sentinel AI - Scanner de IaC")
+    parser.add_argument('--workers', type=int, default=SCAN_WORKERS, help="Análises simultâneas (padrão: SENTINEL_SCAN_WORKERS ou 4)")
+    parser.add_argument('--incremental', action='store_true', help="Pula arquivos aprovados cujo hash não mudou desde o último scan")
+    parser.add_argument('--manifest', default=MANIFEST_PATH, help="Caminho do manifesto de hashes aprovados")
+    parser.add_argument('--batch', action='store_true', default=SCAN_BATCH, help="Agrupa vários templates por requisição ao LLM (padrão: SENTINEL_SCAN_BATCH)")
+    parser.add_argument('--base-ref', help="Analisa só os arquivos alterados em relação a este ref do git (ex: origin/main)")
+    args = parser.parse_args()
+
+    # Ordenado para que o relatório seja determinístico entre execuções
+    files = sorted(glob.glob("*.json"))
     # Ignora arquivos de configuração de ambiente do node/python
     files = [f for f in files if f not in ["package.json", "tsconfig.json", "package-lock.json"]]
+
+    if args.base_ref:
+        changed = changed_files(args.base_ref)
+        if changed is not None:
+            unchanged = [f for f in files if f not in changed]
+            files = [f for f in files if f in changed]
+            print(f"🔀 Diff contra '{args.base_ref}': {len(files)} arquivo(s) alterado(s), {len(unchanged)} inalterado(s) ignorado(s).")
     
     if not files:
         print("ℹ️ Nenhum arquivo IaC encontrado para análise.")
         sys.exit(0)
 
+    # Arquivos já aprovados e com o mesmo conteúdo reaproveitam o último veredito
+    reused = []
+    if args.incremental:
+        manifest = load_manifest(args.manifest)
+        hashes = {f: file_hash(f) for f in files}
+        to_scan = []
+        for f in files:
+            entry = manifest.get(f)
+            if entry and entry.get('hash') == hashes[f]:
+                reused.append((f, entry['veredito']))
+            else:
+                to_scan.append(f)
+        print(f"♻️ Modo incremental: {len(reused)} arquivo(s) reaproveitado(s), {len(to_scan)} para analisar.")
+    else:
+        to_scan = files
+
+    results = scan_files_batched(to_scan) if args.batch else scan_files(to_scan, args.workers)
+    save_batch_to_dashboard(results)
+
+    if args.incremental:
+        for f, res in results:
+            if res.get('status') == 'APROVADO':
+                manifest[f] = {'hash': hashes[f], 'veredito': res}
+            else:
+                manifest.pop(f, None)
+        try:
+            save_manifest(manifest, args.manifest)
+        except Exception as e:
+            print(f"⚠️ Aviso: Não foi possível gravar o manifesto: {e}")
+
+    reused_files = {f for f, _ in reused}
+    results = sorted(results + reused, key=lambda r: r[0])
+
     fails = 0
     
-    for file_name in files:
-        res = analyze_iac(file_name)
+    print("\n📋 Relatório do Sentinel AI:")
+    for file_name, res in results:
         status = res.get('status', 'ERRO')
         risco = res.get('risco')
-        detalhe = res.get('detalhe')
         correcao = res.get('correcao')
-        
-        save_to_dashboard(file_name, status, risco, detalhe, correcao)
 
         if status == 'REPROVADO':
             print(f"🚫 [FALHA] {file_name}")
@@ -126,11 +384,18 @@ if __name__ == "__main__":
             print(f"   Correção: {correcao}")
             fails += 1
         elif status == 'APROVADO':
-            print(f"✅ [OK] {file_name}")
+            print(f"✅ [OK] {file_name}{' (inalterado)' if file_name in reused_files else ''}")
+        elif status == DEFERRED_STATUS:
+            # Sem veredito não dá para liberar o pipeline; rodar de novo quando a cota voltar
+            print(f"⏳ [ADIADO] {file_name} (cota do LLM esgotada)")
+            fails += 1
         else:
             print(f"⚠️ [ERRO] {file_name}")
             fails += 1
 
+    print(f"\n🗃️ Cache de vereditos: {json.dumps(verdict_cache.report())}")
+    print(f"🚦 Governador do LLM: {json.dumps(governor.report())}")
+
     if fails > 0:
         print(f"\n❌ Pipeline bloqueado: {fails} vulnerabilidade(s) encontrada(s).")
         sys.exit(1)
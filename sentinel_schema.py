@@ -0,0 +1,106 @@
+import json
+import os
+import zlib
+
+# Esquema compacto dos itens de achado.
+# As listas do Dashboard só precisam de poucos campos curtos; a análise completa (risco, detalhe, ação e o JSON
+# da IA) vai em um único atributo binário comprimido, lido só quando o relatório detalhado é aberto.
+# Itens no formato antigo (risco/detalhe repetidos dentro de `json_analise`) continuam legíveis.
+
+# --- CONFIGURAÇÕES ---
+# Tamanho máximo de risco/auto_correcao no item (o texto completo fica na análise comprimida)
+SCHEMA_SUMMARY_CHARS = int(os.environ.get('SENTINEL_SCHEMA_SUMMARY_CHARS', '200'))
+SCHEMA_COMPRESS_LEVEL = int(os.environ.get('SENTINEL_SCHEMA_COMPRESS_LEVEL', '6'))
+
+# Atributo binário com a análise completa (zlib + JSON)
+ANALYSIS_ATTR = 'analise'
+# Timestamp (epoch) do TTL do DynamoDB: só é gravado depois que o achado foi arquivado
+TTL_ATTR = 'expira_ttl'
+LEGACY_ANALYSIS_ATTR = 'json_analise'
+# Campos que saem do item e só existem na análise comprimida
+DETAIL_FIELDS = ('detalhe', LEGACY_ANALYSIS_ATTR)
+SUMMARY_FIELDS = ('risco', 'auto_correcao')
+# O que as listas do Dashboard leem (cards, filtros, KPIs e o índice de pendentes)
+LIST_FIELDS = ('id_recurso', 'data_evento', 'tipo', 'status_ia', 'gravidade', 'estado_visualizacao',
+               'risco', 'auto_correcao', 'usuario', 'mes', 'pendente')
+
+# Itens internos dividem a tabela com os achados: nenhum tem data_evento e todo id_recurso interno começa
+# com um destes prefixos. Feed, reset, migração e reconciliação reconhecem os dois por is_finding.
+SUMMARY_PREFIX = 'RESUMO#'     # contadores do Dashboard (sentinel_counters)
+PURGE_PREFIX = 'PURGA#'        # checkpoints da purga de buckets (sentinel_s3_purge)
+SWEEP_PREFIX = 'VARREDURA#'    # checkpoints da varredura completa (sentinel_sweep)
+LEASE_PREFIX = 'LEASE#'        # leases por recurso (sentinel_lease)
+QUOTA_PREFIX = 'COTA#'         # cota compartilhada do LLM (sentinel_governor)
+# Estado operacional: sobrevive ao reset do Dashboard (só o --drop apaga)
+CONTROL_PREFIXES = (PURGE_PREFIX, SWEEP_PREFIX, LEASE_PREFIX, QUOTA_PREFIX)
+INTERNAL_PREFIXES = (SUMMARY_PREFIX,) + CONTROL_PREFIXES
+
+
+def is_internal_key(item_id):
+    return str(item_id).startswith(INTERNAL_PREFIXES)
+
+
+def is_finding(item):
+    """True para achados; False para resumos, checkpoints, leases e a cota do LLM."""
+    return bool(item) and 'data_evento' in item and not is_internal_key(item.get('id_recurso', ''))
+
+
+def _clip(text):
+    text = str(text)
+    return text if len(text) <= SCHEMA_SUMMARY_CHARS else text[:SCHEMA_SUMMARY_CHARS - 1] + '…'
+
+
+def _parse_legacy(raw):
+    if not isinstance(raw, str):
+        return raw
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw
+
+
+def compact_item(item):
+    """Item completo (como montado pelos writers) -> item compacto. Idempotente."""
+    if ANALYSIS_ATTR in item or not any(field in item for field in DETAIL_FIELDS):
+        return item
+    analysis = {field: item[field] for field in SUMMARY_FIELDS + ('detalhe',) if field in item}
+    analysis['analise'] = _parse_legacy(item.get(LEGACY_ANALYSIS_ATTR))
+    compact = {k: v for k, v in item.items() if k not in DETAIL_FIELDS}
+    for field in SUMMARY_FIELDS:
+        if field in compact:
+            compact[field] = _clip(compact[field])
+    payload = json.dumps(analysis, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    compact[ANALYSIS_ATTR] = zlib.compress(payload, SCHEMA_COMPRESS_LEVEL)
+    return compact
+
+
+def list_fields(item):
+    """Item sem a análise comprimida (o que o feed e as listas mantêm em memória)."""
+    return {k: v for k, v in item.items() if k not in (ANALYSIS_ATTR, LEGACY_ANALYSIS_ATTR)}
+
+
+def decode_analysis(item):
+    """Análise completa: {'risco', 'detalhe', 'auto_correcao', 'analise'}.
+    Aceita o atributo comprimido (bytes ou Binary do boto3), a análise já expandida (itens do arquivo)
+    e o formato antigo. None se o item não traz a análise."""
+    value = item.get(ANALYSIS_ATTR)
+    if isinstance(value, dict):
+        return value
+    if value is not None:
+        return json.loads(zlib.decompress(bytes(getattr(value, 'value', value))).decode('utf-8'))
+    if LEGACY_ANALYSIS_ATTR in item:
+        analysis = {field: item[field] for field in SUMMARY_FIELDS + ('detalhe',) if field in item}
+        analysis['analise'] = _parse_legacy(item[LEGACY_ANALYSIS_ATTR])
+        return analysis
+    return None
+
+
+def expand_item(item):
+    """Item compacto -> registro do arquivo: campos de lista + análise completa em JSON puro
+    (o arquivo inteiro já é comprimido)."""
+    record = list_fields(item)
+    record.pop(TTL_ATTR, None)
+    analysis = decode_analysis(item)
+    if analysis is not None:
+        record[ANALYSIS_ATTR] = analysis
+    return record
@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from botocore.exceptions import ClientError
+import sentinel_telemetry as telemetry
+from sentinel_sg_rules import PUBLIC_CIDRS, PORT_PROTOCOLS, normalize_permissions, public_rules, rules_from_cloudtrail, to_permissions
+
+# --- CONFIGURAÇÕES ---
+# Idade máxima do snapshot da conta antes de uma recarga completa (eventos mantêm o índice entre recargas)
+SG_INDEX_TTL = float(os.environ.get('SENTINEL_SG_INDEX_TTL', '300'))
+SG_INDEX_PAGE_SIZE = int(os.environ.get('SENTINEL_SG_INDEX_PAGE_SIZE', '1000'))
+
+
+class _IntervalIndex:
+    """Intervalos elementares ordenados: cada posição guarda os valores cujo intervalo a cobre.
+    Consulta por porta = um bisect (O(log n)) + tamanho da resposta."""
+
+    def __init__(self, intervals):
+        bounds = sorted({lo for lo, _, _ in intervals} | {hi + 1 for _, hi, _ in intervals})
+        cover = [set() for _ in bounds]
+        for lo, hi, value in intervals:
+            for k in range(bisect_left(bounds, lo), bisect_left(bounds, hi + 1)):
+                cover[k].add(value)
+        self.bounds = bounds
+        self.cover = [frozenset(c) for c in cover]
+
+    def stab(self, port):
+        i = bisect_right(self.bounds, port) - 1
+        return self.cover[i] if i >= 0 else frozenset()
+
+
+class ExposureIndex:
+    """Índice de exposição dos Security Groups da conta/região.
+
+    Carregado com describe_security_groups paginado, mantido pelos eventos do CloudTrail e pelas
+    próprias remediações, e recarregado por completo quando passa de SG_INDEX_TTL.
+    """
+
+    def __init__(self, ttl=SG_INDEX_TTL):
+        self.ttl = ttl
+        self.groups = {}   # group_id -> metadados do describe (sem IpPermissions)
+        self.rules = {}    # group_id -> set de Rule (sentinel_sg_rules)
+        self.loaded_at = None
+        self._by_cidr = None
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+
+    # --- CARGA ---
+
+    def _store(self, sg):
+        group_id = sg['GroupId']
+        self.groups[group_id] = {k: v for k, v in sg.items() if k != 'IpPermissions'}
+        self.rules[group_id] = normalize_permissions(sg.get('IpPermissions'))
+        self._by_cidr = None
+
+    def load(self, ec2):
+        """Snapshot completo da região (paginado)."""
+        groups, rules = {}, {}
+        pages = ec2.get_paginator('describe_security_groups').paginate(
+            PaginationConfig={'PageSize': SG_INDEX_PAGE_SIZE},
+        )
+        for page in pages:
+            for sg in page.get('SecurityGroups', []):
+                groups[sg['GroupId']] = {k: v for k, v in sg.items() if k != 'IpPermissions'}
+                rules[sg['GroupId']] = normalize_permissions(sg.get('IpPermissions'))
+        with self._lock:
+            self.groups, self.rules = groups, rules
+            self.loaded_at = time.time()
+            self._by_cidr = None
+        telemetry.incr('sg_index_cargas')
+        print(f"🗂️ Índice de exposição carregado: {len(groups)} Security Group(s).")
+
+    def _stale(self):
+        return self.loaded_at is None or time.time() - self.loaded_at > self.ttl
+
+    def ensure_fresh(self, ec2):
+        if self._stale():
+            # Uma única recarga mesmo com várias threads chegando juntas
+            with self._load_lock:
+                if self._stale():
+                    self.load(ec2)
+
+    def refresh_group(self, ec2, group_id):
+        """Describe de um único grupo, atualizando o índice. Retorna False se ele não existe."""
+        try:
+            response = ec2.describe_security_groups(GroupIds=[group_id])
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'InvalidGroup.NotFound':
+                self.remove(group_id)
+                return False
+            raise
+        with self._lock:
+            for sg in response['SecurityGroups']:
+                self._store(sg)
+        return True
+
+    # --- LEITURA ---
+
+    def lookup(self, ec2, group_id, fresh=True):
+        """Estado do grupo no formato do describe (IpPermissions normalizadas). None se não existe.
+
+        `fresh` (padrão) faz um describe do próprio grupo: o snapshot deste container não vê regras
+        adicionadas por outros containers ou por outras APIs (ex: ModifySecurityGroupRules), e um
+        veredito de auditoria não pode sair de estado defasado. Sem `fresh`, serve do snapshot
+        (enumeração da varredura, que acabou de carregar a região).
+        """
+        if fresh:
+            return self.get(group_id) if self.refresh_group(ec2, group_id) else None
+        self.ensure_fresh(ec2)
+        if group_id not in self.groups and not self.refresh_group(ec2, group_id):
+            return None
+        return self.get(group_id)
+
+    def get(self, group_id):
+        with self._lock:
+            if group_id not in self.groups:
+                return None
+            return {**self.groups[group_id], 'IpPermissions': to_permissions(self.rules[group_id])}
+
+    def rules_for(self, group_id):
+        """Cópia das regras inbound do grupo (vazia se o grupo não está no índice)."""
+        with self._lock:
+            return set(self.rules.get(group_id, ()))
+
+    def public_rules(self, group_id):
+        """Só as regras abertas para a internet (0.0.0.0/0 e ::/0)."""
+        with self._lock:
+            return public_rules(self.rules.get(group_id, ()))
+
+    def is_default(self, group_id):
+        with self._lock:
+            return self.groups.get(group_id, {}).get('GroupName') == 'default'
+
+    def ingress_count(self, group_id):
+        with self._lock:
+            return len(self.rules.get(group_id, ()))
+
+    def _cidr_index(self):
+        with self._lock:
+            if self._by_cidr is None:
+                intervals = {}
+                for group_id, rules in self.rules.items():
+                    for rule in rules:
+                        if rule.kind in ('ipv4', 'ipv6') and rule.protocol in PORT_PROTOCOLS:
+                            intervals.setdefault(rule.source, []).append((rule.from_port, rule.to_port, group_id))
+                self._by_cidr = {cidr: _IntervalIndex(items) for cidr, items in intervals.items()}
+            return self._by_cidr
+
+    def exposed(self, port, cidrs=PUBLIC_CIDRS):
+        """Grupos que liberam `port` (tcp/udp/todos) para alguma das `cidrs`, sem chamar a API."""
+        by_cidr = self._cidr_index()
+        groups = set()
+        for cidr in cidrs:
+            index = by_cidr.get(cidr)
+            if index:
+                groups |= index.stab(port)
+        return sorted(groups)
+
+    def exposure_report(self, ports):
+        """{porta: [grupos expostos para a internet]} (ex: portas 22, 3389, 5432). Usado pela varredura."""
+        return {port: self.exposed(port) for port in ports}
+
+    # --- ATUALIZAÇÃO ---
+
+    def authorize(self, group_id, rules):
+        with self._lock:
+            if group_id in self.rules:
+                self.rules[group_id] |= rules
+                self._by_cidr = None
+
+    def revoke(self, group_id, rules):
+        """Remove `rules` (conjunto de Rule) do grupo."""
+        with self._lock:
+            if group_id in self.rules:
+                self.rules[group_id] -= rules
+                self._by_cidr = None
+
+    def remove(self, group_id):
+        with self._lock:
+            self.groups.pop(group_id, None)
+            if self.rules.pop(group_id, None) is not None:
+                self._by_cidr = None
+
+    def apply_event(self, detail):
+        """Aplica um evento CloudTrail de Security Group ao índice (idempotente).
+        Grupos ainda desconhecidos são ignorados: entram no próximo lookup/carga."""
+        name = detail.get('eventName', '')
+        params = detail.get('requestParameters') or {}
+        response = detail.get('responseElements') or {}
+        group_id = params.get('groupId') or response.get('groupId')
+        if not group_id:
+            return
+        rules = rules_from_cloudtrail((params.get('ipPermissions') or {}).get('items', []))
+        if name == 'AuthorizeSecurityGroupIngress':
+            self.authorize(group_id, rules)
+        elif name == 'RevokeSecurityGroupIngress':
+            self.revoke(group_id, rules)
+        elif name == 'DeleteSecurityGroup':
+            self.remove(group_id)
+
+
+# Instância global (região padrão do cliente): sobrevive entre invocações quentes da Lambda
+sg_index = ExposureIndex()
+_regional = {None: sg_index}
+_regional_lock = threading.Lock()
+
+
+def index_for(region=None):
+    """Índice de uma região específica (varredura multi-região). None = região padrão."""
+    with _regional_lock:
+        if region not in _regional:
+            _regional[region] = ExposureIndex()
+        return _regional[region]
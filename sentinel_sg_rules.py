@@ -0,0 +1,184 @@
+import os
+from dataclasses import dataclass
+from botocore.exceptions import ClientError
+import sentinel_telemetry as telemetry
+
+# Modelo de regras de Security Group e motor de diff para a remediação.
+# Cada regra é um valor imutável e hashable (protocolo, portas, tipo de origem, origem): comparar o evento com
+# o estado do grupo vira operação de conjunto, e a revogação sai em lotes limitados com erro isolado por lote.
+
+# --- CONFIGURAÇÕES ---
+# Regras por chamada de revoke_security_group_ingress
+SG_REVOKE_CHUNK = int(os.environ.get('SENTINEL_SG_REVOKE_CHUNK', '50'))
+
+PUBLIC_CIDRS = frozenset({'0.0.0.0/0', '::/0'})
+# Protocolos com semântica de porta (ICMP usa FromPort/ToPort como tipo/código)
+PORT_PROTOCOLS = frozenset({'tcp', 'udp', '-1'})
+# A API aceita número ou nome do protocolo; o describe devolve o nome
+PROTOCOL_NAMES = {'6': 'tcp', '17': 'udp', '1': 'icmp', '58': 'icmpv6', 'all': '-1'}
+
+_SOURCE_FIELDS = {
+    'ipv4': ('IpRanges', 'CidrIp'),
+    'ipv6': ('Ipv6Ranges', 'CidrIpv6'),
+    'sg': ('UserIdGroupPairs', 'GroupId'),
+    'pl': ('PrefixListIds', 'PrefixListId'),
+}
+# Erros de revoke que significam "essa regra não existe mais" (já revogada em paralelo)
+NOT_FOUND_ERRORS = frozenset({'InvalidPermission.NotFound'})
+
+
+@dataclass(frozen=True, order=True)
+class Rule:
+    """Uma regra inbound: uma origem (CIDR IPv4/IPv6, grupo ou prefix list) para um protocolo/intervalo de portas.
+    tipo de origem: 'ipv4', 'ipv6', 'sg' (UserIdGroupPairs) ou 'pl' (prefix list)."""
+    __slots__ = ('protocol', 'from_port', 'to_port', 'kind', 'source')
+    protocol: str
+    from_port: int
+    to_port: int
+    kind: str
+    source: str
+
+    @property
+    def public(self):
+        return self.source in PUBLIC_CIDRS
+
+
+def make_rule(protocol, from_port, to_port, kind, source):
+    protocol = str(protocol if protocol is not None else '-1').lower()
+    protocol = PROTOCOL_NAMES.get(protocol, protocol)
+    if protocol == '-1':
+        from_port, to_port = 0, 65535
+    else:
+        from_port = int(from_port if from_port is not None else 0)
+        to_port = int(to_port if to_port is not None else 65535)
+    return Rule(protocol, from_port, to_port, kind, str(source))
+
+
+def normalize_permissions(ip_permissions):
+    """IpPermissions (Boto3) -> conjunto de regras. O conjunto já elimina duplicatas."""
+    rules = set()
+    for perm in ip_permissions or []:
+        if not isinstance(perm, dict):
+            continue
+        for kind, (field, key) in _SOURCE_FIELDS.items():
+            for entry in perm.get(field, []):
+                if isinstance(entry, dict) and entry.get(key):
+                    rules.add(make_rule(perm.get('IpProtocol'), perm.get('FromPort'), perm.get('ToPort'), kind, entry[key]))
+    return rules
+
+
+def parse_cloudtrail_ip_permissions(cloudtrail_items):
+    """Converte do formato camelCase do CloudTrail para o PascalCase exigido pelo Boto3."""
+    boto3_perms = []
+    for item in cloudtrail_items:
+        perm = {}
+        if 'ipProtocol' in item: perm['IpProtocol'] = item['ipProtocol']
+        if 'fromPort' in item: perm['FromPort'] = item['fromPort']
+        if 'toPort' in item: perm['ToPort'] = item['toPort']
+
+        # Ranges IPv4
+        if 'ipRanges' in item and 'items' in item['ipRanges']:
+            perm['IpRanges'] = [{'CidrIp': r['cidrIp']} for r in item['ipRanges']['items'] if 'cidrIp' in r]
+
+        # Ranges IPv6
+        if 'ipv6Ranges' in item and 'items' in item['ipv6Ranges']:
+            perm['Ipv6Ranges'] = [{'CidrIpv6': r['cidrIpv6']} for r in item['ipv6Ranges']['items'] if 'cidrIpv6' in r]
+
+        # Grupos de Segurança
+        if 'groups' in item and 'items' in item['groups']:
+            perm['UserIdGroupPairs'] = [{'GroupId': g['groupId']} for g in item['groups']['items'] if 'groupId' in g]
+
+        # Prefix lists
+        if 'prefixListIds' in item and 'items' in item['prefixListIds']:
+            perm['PrefixListIds'] = [{'PrefixListId': p['prefixListId']} for p in item['prefixListIds']['items'] if 'prefixListId' in p]
+
+        boto3_perms.append(perm)
+    return boto3_perms
+
+
+def rules_from_cloudtrail(cloudtrail_items):
+    """ipPermissions.items de um evento CloudTrail -> conjunto de regras."""
+    return normalize_permissions(parse_cloudtrail_ip_permissions(cloudtrail_items or []))
+
+
+def to_permissions(rules):
+    """Regras -> IpPermissions (Boto3), agrupadas por protocolo/portas e em ordem estável."""
+    perms = {}
+    for rule in sorted(rules):
+        perm = perms.get((rule.protocol, rule.from_port, rule.to_port))
+        if perm is None:
+            perm = perms[(rule.protocol, rule.from_port, rule.to_port)] = {'IpProtocol': rule.protocol}
+            if rule.protocol != '-1':
+                perm['FromPort'], perm['ToPort'] = rule.from_port, rule.to_port
+        field, key = _SOURCE_FIELDS[rule.kind]
+        perm.setdefault(field, []).append({key: rule.source})
+    return list(perms.values())
+
+
+def public_rules(rules):
+    return {rule for rule in rules if rule.public}
+
+
+class RevokePlan:
+    """Resultado do diff entre as regras de um evento e o estado atual do grupo."""
+
+    def __init__(self, revoke, already_gone):
+        self.revoke = revoke              # regras do evento que ainda existem no grupo
+        self.already_gone = already_gone  # regras do evento que já não estão no grupo (revogadas em paralelo)
+
+
+def plan_revocation(event_rules, live_rules):
+    """Conjunto mínimo a revogar: só o que o evento adicionou e que continua no grupo.
+    Regras vizinhas (mesma origem em outras portas, intervalos sobrepostos) não são tocadas."""
+    event_rules = set(event_rules)
+    revoke = event_rules & set(live_rules)
+    return RevokePlan(revoke, event_rules - revoke)
+
+
+class RevokeResult:
+    def __init__(self):
+        self.revoked = set()
+        self.missing = set()
+        self.failed = {}   # regra -> mensagem de erro
+
+    @property
+    def removed(self):
+        """O que não está mais no grupo (revogado agora ou já ausente)."""
+        return self.revoked | self.missing
+
+
+def _revoke_chunk(ec2, group_id, chunk, result):
+    try:
+        response = ec2.revoke_security_group_ingress(GroupId=group_id, IpPermissions=to_permissions(chunk))
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        if code == 'InvalidGroup.NotFound':
+            raise
+        if len(chunk) == 1:
+            if code in NOT_FOUND_ERRORS:
+                result.missing.update(chunk)
+            else:
+                result.failed[chunk[0]] = str(e)
+            return
+        # Um lote falha inteiro por uma regra só: divide ao meio até isolar quem falhou
+        telemetry.incr('sg_revoke_divisoes')
+        half = len(chunk) // 2
+        _revoke_chunk(ec2, group_id, chunk[:half], result)
+        _revoke_chunk(ec2, group_id, chunk[half:], result)
+        return
+    # APIs mais novas respondem sucesso e listam as regras inexistentes em UnknownIpPermissions
+    unknown = normalize_permissions(response.get('UnknownIpPermissions'))
+    result.missing.update(r for r in chunk if r in unknown)
+    result.revoked.update(r for r in chunk if r not in unknown)
+
+
+def revoke_rules(ec2, group_id, rules, chunk_size=SG_REVOKE_CHUNK):
+    """Revoga `rules` em lotes de até `chunk_size`. Um lote com erro é dividido até isolar a regra culpada;
+    regras inexistentes contam como já revogadas. InvalidGroup.NotFound (grupo apagado) sobe para quem chamou."""
+    result = RevokeResult()
+    ordered = sorted(rules)
+    chunk_size = max(1, chunk_size)
+    for start in range(0, len(ordered), chunk_size):
+        _revoke_chunk(ec2, group_id, ordered[start:start + chunk_size], result)
+    telemetry.incr('sg_regras_revogadas', len(result.revoked))
+    return result
@@ -0,0 +1,311 @@
+import sys
+import time
+import boto3
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+from sentinel_feed import publish
+from sentinel_schema import ANALYSIS_ATTR, INTERNAL_PREFIXES, LEGACY_ANALYSIS_ATTR, TTL_ATTR, compact_item, decode_analysis
+
+# --- CONFIGURAÇÕES ---
+AWS_REGION = "us-east-2"
+DYNAMODB_TABLE = "SentinelMonitor"
+
+# Índices secundários globais (GSI) usados pelas views do Dashboard
+INDEX_TIPO = 'tipo-data_evento-index'          # PK tipo, SK data_evento -> Pipeline CI/CD
+INDEX_PENDENTE = 'pendente-data_evento-index'  # PK pendente (esparso), SK data_evento -> Monitoramento Cloud
+INDEX_MES = 'mes-data_evento-index'            # PK mes (AAAA-MM), SK data_evento -> Histórico Geral
+
+PENDENTE_CLOUD = 'CLOUD'
+HISTORY_MONTHS_BACK = 12
+
+
+def index_fields(tipo, data_evento, estado=None):
+    """Atributos de índice que todo writer deve gravar junto com o item.
+
+    `pendente` é esparso: só existe enquanto o achado de cloud não foi confirmado, então o índice
+    contém apenas a fila pendente e não cresce com o histórico.
+    """
+    fields = {'mes': data_evento[:7]}
+    if tipo != 'IAC' and estado != 'CONFIRMADO':
+        fields['pendente'] = PENDENTE_CLOUD
+    return fields
+
+
+def _paginate(operation, limit=None, **kwargs):
+    """Segue LastEvaluatedKey até acabar (ou até `limit` itens). Sem isso o DynamoDB corta em 1 MB."""
+    items = []
+    while True:
+        if limit:
+            kwargs['Limit'] = limit - len(items)
+        response = operation(**kwargs)
+        items.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key or (limit and len(items) >= limit):
+            return items[:limit] if limit else items
+        kwargs['ExclusiveStartKey'] = last_key
+
+
+def _count(operation, **kwargs):
+    total = 0
+    kwargs['Select'] = 'COUNT'
+    while True:
+        response = operation(**kwargs)
+        total += response.get('Count', 0)
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return total
+        kwargs['ExclusiveStartKey'] = last_key
+
+
+def projection(fields):
+    """ProjectionExpression para ler só `fields` (ex: LIST_FIELDS nas listas do Dashboard)."""
+    if not fields:
+        return {}
+    return {
+        'ProjectionExpression': ', '.join(f"#{f}" for f in fields),
+        'ExpressionAttributeNames': {f"#{f}": f for f in fields},
+    }
+
+
+def _is_missing_index(error):
+    return error.response['Error']['Code'] == 'ValidationException' and 'index' in str(error).lower()
+
+
+def without_prefixes(prefixes, expression=None):
+    """Filtro de scan que descarta os itens cujo id_recurso começa com algum dos prefixos."""
+    for prefix in prefixes:
+        condition = ~Attr('id_recurso').begins_with(prefix)
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def findings_only(expression=None):
+    """Filtro de scan só com achados: pula resumos, checkpoints, leases e a cota do LLM (INTERNAL_PREFIXES)."""
+    condition = Attr('data_evento').exists()
+    return without_prefixes(INTERNAL_PREFIXES, condition if expression is None else condition & expression)
+
+
+def scan_all(table, **kwargs):
+    """Scan completo e paginado. Só para quando não há índice possível (migração, reconciliação)."""
+    return _paginate(table.scan, **kwargs)
+
+
+def query_newest(table, index_name, key_condition, limit=None, **kwargs):
+    """Query em um GSI, do mais recente para o mais antigo, limitada a `limit` itens."""
+    return _paginate(
+        table.query, limit=limit, IndexName=index_name,
+        KeyConditionExpression=key_condition, ScanIndexForward=False, **kwargs
+    )
+
+
+def _fallback_scan(table, filter_expression, limit, fields=None):
+    """Tabela ainda sem os GSIs: scan paginado com filtro, ordenado em memória."""
+    items = scan_all(table, FilterExpression=findings_only(filter_expression), **projection(fields))
+    items.sort(key=lambda x: x.get('data_evento', ''), reverse=True)
+    return items[:limit] if limit else items
+
+
+def get_pending_cloud(table, limit=None, fields=None):
+    try:
+        return query_newest(table, INDEX_PENDENTE, Key('pendente').eq(PENDENTE_CLOUD), limit, **projection(fields))
+    except ClientError as e:
+        if not _is_missing_index(e): raise
+        return _fallback_scan(table, Attr('tipo').ne('IAC') & Attr('estado_visualizacao').ne('CONFIRMADO'), limit, fields)
+
+
+def get_by_tipo(table, tipo, limit=None, fields=None):
+    try:
+        return query_newest(table, INDEX_TIPO, Key('tipo').eq(tipo), limit, **projection(fields))
+    except ClientError as e:
+        if not _is_missing_index(e): raise
+        return _fallback_scan(table, Attr('tipo').eq(tipo), limit, fields)
+
+
+def _previous_month(mes):
+    year, month = int(mes[:4]), int(mes[5:7])
+    return f"{year - 1}-12" if month == 1 else f"{year}-{month - 1:02d}"
+
+
+def get_history(table, limit, current_month, months_back=HISTORY_MONTHS_BACK, fields=None):
+    """Histórico geral mais recente primeiro: consulta mês a mês até completar `limit`.
+    Só a parte quente; achados antigos saem da tabela para o arquivo (sentinel_archive)."""
+    items, mes = [], current_month
+    try:
+        for _ in range(months_back):
+            items.extend(query_newest(table, INDEX_MES, Key('mes').eq(mes), limit - len(items), **projection(fields)))
+            if len(items) >= limit:
+                break
+            mes = _previous_month(mes)
+        return items
+    except ClientError as e:
+        if not _is_missing_index(e): raise
+        return _fallback_scan(table, Attr('id_recurso').exists(), limit, fields)
+
+
+def get_archivable(table, cutoff, months_back=HISTORY_MONTHS_BACK):
+    """Achados anteriores a `cutoff` (str de data_evento) ainda não arquivados, mês a mês pelo GSI
+    a partir do mês do corte. Pendentes de cloud ficam de fora: continuam na fila do Dashboard até
+    serem confirmados."""
+    eligible = Attr(TTL_ATTR).not_exists() & Attr('pendente').not_exists()
+    items, mes = [], cutoff[:7]
+    try:
+        for _ in range(months_back):
+            items.extend(query_newest(table, INDEX_MES, Key('mes').eq(mes) & Key('data_evento').lt(cutoff),
+                                      FilterExpression=eligible))
+            mes = _previous_month(mes)
+        return items
+    except ClientError as e:
+        if not _is_missing_index(e): raise
+        return _fallback_scan(table, Attr('data_evento').lt(cutoff) & eligible, None)
+
+
+def get_analysis(table, item_id):
+    """Análise completa de um achado (atributo comprimido ou formato antigo), lida só sob demanda."""
+    fields = (ANALYSIS_ATTR, LEGACY_ANALYSIS_ATTR, 'risco', 'detalhe', 'auto_correcao')
+    item = table.get_item(Key={'id_recurso': item_id}, **projection(fields)).get('Item')
+    return decode_analysis(item) if item else None
+
+
+def set_estado(table, item_id, novo_estado):
+    """Atualiza o estado de visualização; ao confirmar, remove o item do índice de pendentes.
+
+    Retorna o item como estava antes, ou None se ele não existe ou já estava nesse estado
+    (assim quem chama só ajusta os contadores uma vez).
+    """
+    if novo_estado == 'CONFIRMADO':
+        update = "set estado_visualizacao = :s remove pendente"
+    else:
+        update = "set estado_visualizacao = :s"
+    try:
+        response = table.update_item(
+            Key={'id_recurso': item_id},
+            UpdateExpression=update,
+            ConditionExpression=Attr('id_recurso').exists() & (
+                Attr('estado_visualizacao').not_exists() | Attr('estado_visualizacao').ne(novo_estado)
+            ),
+            ExpressionAttributeValues={':s': novo_estado},
+            ReturnValues='ALL_OLD',
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+    old = response.get('Attributes')
+    if old:
+        new = {**old, 'estado_visualizacao': novo_estado}
+        if novo_estado == 'CONFIRMADO':
+            new.pop('pendente', None)
+        publish('MODIFY', new)
+    return old
+
+
+# --- MIGRAÇÃO ---
+
+def ensure_indexes(table):
+    """Cria os GSIs que ainda não existem (o DynamoDB aceita um GSI novo por update_table)."""
+    existing = {i['IndexName'] for i in (table.global_secondary_indexes or [])}
+    for index_name, hash_key in ((INDEX_TIPO, 'tipo'), (INDEX_PENDENTE, 'pendente'), (INDEX_MES, 'mes')):
+        if index_name in existing:
+            continue
+        print(f"🧱 Criando índice {index_name}...")
+        params = {
+            'AttributeDefinitions': [
+                {'AttributeName': hash_key, 'AttributeType': 'S'},
+                {'AttributeName': 'data_evento', 'AttributeType': 'S'},
+            ],
+            'GlobalSecondaryIndexUpdates': [{'Create': {
+                'IndexName': index_name,
+                'KeySchema': [
+                    {'AttributeName': hash_key, 'KeyType': 'HASH'},
+                    {'AttributeName': 'data_evento', 'KeyType': 'RANGE'},
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+            }}],
+        }
+        if table.billing_mode_summary is None or table.billing_mode_summary.get('BillingMode') != 'PAY_PER_REQUEST':
+            params['GlobalSecondaryIndexUpdates'][0]['Create']['ProvisionedThroughput'] = {
+                'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5,
+            }
+        table.meta.client.update_table(TableName=table.name, **params)
+        table.meta.client.get_waiter('table_exists').wait(TableName=table.name)
+        # Aguarda o backfill do índice antes de criar o próximo
+        while True:
+            table.reload()
+            status = {i['IndexName']: i['IndexStatus'] for i in table.global_secondary_indexes or []}
+            if status.get(index_name) == 'ACTIVE':
+                break
+            time.sleep(10)
+
+
+def ensure_stream(table):
+    """Habilita o DynamoDB Streams (NEW_IMAGE) que alimenta o feed de mudanças do Dashboard."""
+    if (table.stream_specification or {}).get('StreamEnabled'):
+        return
+    print("🧱 Habilitando DynamoDB Streams (NEW_IMAGE)...")
+    table.meta.client.update_table(
+        TableName=table.name,
+        StreamSpecification={'StreamEnabled': True, 'StreamViewType': 'NEW_IMAGE'},
+    )
+    table.meta.client.get_waiter('table_exists').wait(TableName=table.name)
+
+
+def ensure_ttl(table):
+    """Habilita o TTL do DynamoDB no atributo gravado pelo arquivamento (sentinel_archive)."""
+    client = table.meta.client
+    status = client.describe_time_to_live(TableName=table.name).get('TimeToLiveDescription', {})
+    if status.get('TimeToLiveStatus') in ('ENABLED', 'ENABLING'):
+        return
+    print(f"🧱 Habilitando TTL no atributo {TTL_ATTR}...")
+    client.update_time_to_live(
+        TableName=table.name,
+        TimeToLiveSpecification={'Enabled': True, 'AttributeName': TTL_ATTR},
+    )
+
+
+def compact_legacy_items(table):
+    """Regrava no esquema compacto os achados antigos (risco/detalhe repetidos em `json_analise`)."""
+    updated = 0
+    for item in scan_all(table, FilterExpression=findings_only(Attr(LEGACY_ANALYSIS_ATTR).exists())):
+        compact = compact_item(item)
+        # Só sobrescreve se o estado não mudou desde a leitura (ex: confirmação no Dashboard em paralelo)
+        if 'estado_visualizacao' in item:
+            unchanged = Attr('estado_visualizacao').eq(item['estado_visualizacao'])
+        else:
+            unchanged = Attr('estado_visualizacao').not_exists()
+        try:
+            table.put_item(Item=compact, ConditionExpression=Attr(LEGACY_ANALYSIS_ATTR).exists() & unchanged)
+            updated += 1
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    print(f"✅ {updated} item(ns) convertidos para o esquema compacto.")
+
+
+def backfill_index_fields(table):
+    """Grava `mes`/`pendente` nos itens antigos, escritos antes dos índices existirem."""
+    updated = 0
+    for item in scan_all(table, ProjectionExpression='id_recurso, tipo, data_evento, estado_visualizacao, mes',
+                         FilterExpression=findings_only(Attr('mes').not_exists())):
+        fields = index_fields(item.get('tipo'), item['data_evento'], item.get('estado_visualizacao'))
+        names = {f"#{k}": k for k in fields}
+        values = {f":{k}": v for k, v in fields.items()}
+        table.update_item(
+            Key={'id_recurso': item['id_recurso']},
+            UpdateExpression="set " + ", ".join(f"#{k} = :{k}" for k in fields),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+        updated += 1
+    print(f"✅ {updated} item(ns) atualizados com os atributos de índice.")
+
+
+if __name__ == "__main__":
+    if '--migrate' not in sys.argv:
+        print("Uso: python sentinel_store.py --migrate")
+        sys.exit(1)
+    migration_table = boto3.resource('dynamodb', region_name=AWS_REGION).Table(DYNAMODB_TABLE)
+    ensure_indexes(migration_table)
+    ensure_stream(migration_table)
+    ensure_ttl(migration_table)
+    backfill_index_fields(migration_table)
+    compact_legacy_items(migration_table)
@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import sentinel_telemetry as telemetry
+import aws_sentinel_lambda as lam
+from sentinel_cache import verdict_cache
+from sentinel_rules import ADMIN_DB_PORTS, rule_engine
+from sentinel_findings import write_findings
+from sentinel_s3_purge import CheckpointStore
+from sentinel_schema import SWEEP_PREFIX
+from sentinel_sg_index import index_for
+
+# Varredura completa: audita todos os buckets e Security Groups, não só os que geraram evento no CloudTrail.
+# Entrada agendada (EventBridge Scheduler -> sweep_handler) ou CLI: python sentinel_sweep.py --regions us-east-1,sa-east-1
+
+# --- CONFIGURAÇÕES ---
+SWEEP_REGIONS = [r.strip() for r in os.environ.get('SENTINEL_SWEEP_REGIONS', os.environ.get('AWS_REGION', 'us-east-1')).split(',') if r.strip()]
+SWEEP_WORKERS_PER_REGION = int(os.environ.get('SENTINEL_SWEEP_WORKERS_PER_REGION', '4'))
+# Teto global de chamadas simultâneas somando todas as regiões (protege os limites de API da conta)
+SWEEP_MAX_CONCURRENCY = int(os.environ.get('SENTINEL_SWEEP_MAX_CONCURRENCY', '16'))
+# Recursos por rodada: coleta -> IA em lote -> remediação -> gravação em lote -> checkpoint
+SWEEP_CHUNK = int(os.environ.get('SENTINEL_SWEEP_CHUNK', '100'))
+# Remediação automática desligada por padrão: a primeira varredura de uma conta antiga pode achar muita coisa
+SWEEP_REMEDIATE = os.environ.get('SENTINEL_SWEEP_REMEDIATE', '0') == '1'
+SWEEP_TIME_BUDGET = float(os.environ.get('SENTINEL_SWEEP_TIME_BUDGET', '840'))
+SWEEP_CHECKPOINT = os.environ.get('SENTINEL_SWEEP_CHECKPOINT', 'dynamodb')
+# Portas do relatório de exposição (grupos que as liberam para a internet), tiradas do índice sem chamar a API
+SWEEP_EXPOSURE_PORTS = [int(p) for p in (os.environ.get('SENTINEL_SWEEP_EXPOSURE_PORTS') or ','.join(map(str, ADMIN_DB_PORTS))).split(',') if p.strip()]
+
+CHECKPOINT_PREFIX = SWEEP_PREFIX
+
+
+def bucket_region(s3, bucket):
+    """Região de um bucket (LocationConstraint vazio = us-east-1, 'EU' = eu-west-1)."""
+    location = s3.get_bucket_location(Bucket=bucket).get('LocationConstraint')
+    return {None: 'us-east-1', '': 'us-east-1', 'EU': 'eu-west-1'}.get(location, location)
+
+
+def buckets_by_region(regions, limiter, workers=SWEEP_WORKERS_PER_REGION):
+    """{região: [buckets]} só para as regiões pedidas. A listagem do S3 é global, a localização é por bucket."""
+    s3 = lam.s3_client()
+    names = [b['Name'] for b in s3.list_buckets().get('Buckets', [])]
+
+    def locate(name):
+        with limiter:
+            try:
+                return name, bucket_region(s3, name)
+            except Exception as e:
+                print(f"⚠️ Aviso: Não foi possível localizar o bucket {name}: {e}")
+                return name, None
+
+    result = {region: [] for region in regions}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for name, region in pool.map(telemetry.bind(locate), names):
+            if region in result:
+                result[region].append(name)
+    return result
+
+
+class RegionSweep:
+    """Varredura de uma região: pool próprio de workers, limitado também pelo semáforo global."""
+
+    def __init__(self, sweep_id, region, buckets, limiter, table, checkpoints,
+                 workers=SWEEP_WORKERS_PER_REGION, remediate=SWEEP_REMEDIATE, deadline=None, chunk=SWEEP_CHUNK,
+                 exposure_ports=SWEEP_EXPOSURE_PORTS):
+        self.sweep_id = sweep_id
+        self.region = region
+        self.buckets = buckets
+        self.limiter = limiter
+        self.table = table
+        self.checkpoints = checkpoints
+        self.workers = workers
+        self.remediate = remediate
+        self.deadline = deadline
+        self.chunk = chunk
+        self.exposure_ports = exposure_ports
+        self.checkpoint_name = f"{sweep_id}#{region}"
+
+    def _inspect(self, resource):
+        """Coleta + regras. Retorna (recurso, dados, veredito_ou_None) ou None se o recurso sumiu."""
+        kind, resource_id = resource
+        with self.limiter:
+            if kind == 'S3':
+                data = lam.get_s3_config(resource_id, self.region)
+            else:
+                # Grupo enumerado do snapshot recém-carregado; a remediação confere o estado real antes de agir
+                data = lam.get_sg_config(resource_id, self.region, fresh=False)
+        if data is None:
+            return None
+        return resource, data, rule_engine.evaluate(kind, data)
+
+    def _remediate(self, resource, analysis):
+        """Remedia (se ligado) e monta o item do Dashboard. None se o recurso já tinha sido removido."""
+        kind, resource_id = resource
+        if not self.remediate:
+            result = "Encontrado na varredura completa. Remediação automática desligada (SENTINEL_SWEEP_REMEDIATE)."
+        else:
+            with self.limiter:
+                if kind == 'S3':
+                    rem_resp = lam.auto_remediate_s3(resource_id, self.region, self.deadline)
+                else:
+                    # Sem evento: a remediação revoga as regras 0.0.0.0/0 e ::/0 do índice
+                    rem_resp = lam.auto_remediate_ec2(resource_id, {}, self.region)
+            if rem_resp.get('status') == 'IGNORAR':
+                return None
+            result = f"Remediado: {rem_resp['detalhe']}"
+        # Chave fixa por varredura: um chunk refeito após interrupção não duplica achados
+        return lam.build_finding_item(kind, resource_id, analysis, result, f"VARREDURA-{self.sweep_id}")
+
+    def _exposure(self, index):
+        """{porta: [grupos]} só com as portas que algum grupo libera para a internet (consulta no índice recém-carregado)."""
+        report = {str(port): groups for port, groups in index.exposure_report(self.exposure_ports).items() if groups}
+        for port, groups in report.items():
+            print(f"🌐 [{self.region}] Porta {port} aberta para a internet em {len(groups)} grupo(s): {', '.join(groups[:5])}"
+                  f"{' ...' if len(groups) > 5 else ''}")
+        telemetry.incr('sg_portas_expostas', len(report))
+        return report
+
+    def _write(self, items):
+        if not items:
+            return
+        with telemetry.stage('persistencia'):
+            write_findings(self.table, items)
+
+    def run(self):
+        with telemetry.invocation('sweep_region', Regiao=self.region):
+            state = self.checkpoints.load(self.checkpoint_name) or {'feitos': [], 'achados': 0}
+            if state.get('concluida'):
+                print(f"✅ [{self.region}] Varredura {self.sweep_id} já concluída anteriormente.")
+                return {'status': 'COMPLETA', 'total': state.get('total', 0), 'auditados': state.get('total', 0),
+                        'achados': state['achados']}
+
+            # Snapshot novo da região: a própria carga do índice é a enumeração dos Security Groups
+            with telemetry.stage('enumeracao'):
+                index = index_for(self.region)
+                index.load(lam.ec2_client(self.region))
+                exposure = self._exposure(index)
+            resources = [('S3', b) for b in sorted(self.buckets)] + [('SG', g) for g in sorted(index.groups)]
+            done = set(state['feitos'])
+            todo = [r for r in resources if ':'.join(r) not in done]
+            findings = state['achados']
+            print(f"🧭 [{self.region}] {len(resources)} recurso(s), {len(todo)} pendente(s) nesta execução.")
+
+            started = time.time()
+            processed = 0
+            run = telemetry.bind
+            with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+                for start in range(0, len(todo), self.chunk):
+                    if self.deadline and time.time() > self.deadline:
+                        break
+                    chunk = todo[start:start + self.chunk]
+
+                    with telemetry.stage('coleta'):
+                        inspected = [r for r in pool.map(run(self._inspect), chunk) if r is not None]
+
+                    # O que as regras não decidiram vai para a IA em lote (cache primeiro)
+                    pending = {':'.join(resource): data for resource, data, verdict in inspected if verdict is None}
+                    with telemetry.stage('analise'):
+                        verdicts = verdict_cache.get_or_compute_many('lambda', pending, lam.ask_gemini_batch) if pending else {}
+                    judged = [
+                        (resource, verdict if verdict is not None else verdicts[':'.join(resource)])
+                        for resource, data, verdict in inspected
+                    ]
+                    # Sem veredito = análise adiada por cota do LLM: fica fora do checkpoint e a retomada tenta de novo
+                    deferred = {':'.join(r) for r, a in judged if a is None}
+                    vulnerable = [(r, a) for r, a in judged if a is not None and a.get('status') == 'VULNERAVEL']
+
+                    with telemetry.stage('remediacao'):
+                        items = [i for i in pool.map(run(lambda v: self._remediate(*v)), vulnerable) if i is not None]
+                    self._write(items)
+
+                    # Checkpoint só depois da gravação: uma retomada nunca perde achados
+                    findings += len(items)
+                    processed += len(chunk)
+                    done.update(key for key in (':'.join(r) for r in chunk) if key not in deferred)
+                    self.checkpoints.save(self.checkpoint_name, {'feitos': sorted(done), 'achados': findings})
+                    telemetry.incr('recursos', len(chunk))
+                    telemetry.incr('achados', len(items))
+                    if deferred:
+                        telemetry.incr('adiados', len(deferred))
+                        print(f"⏸️ [{self.region}] {len(deferred)} recurso(s) adiado(s) por cota do LLM.")
+
+                    rate = processed / max(time.time() - started, 1e-6)
+                    print(f"📈 [{self.region}] {len(done)}/{len(resources)} ({len(done) * 100 // max(len(resources), 1)}%) "
+                          f"· {findings} achado(s) · {rate:.1f} recursos/s")
+
+            complete = len(done) >= len(resources)
+            if complete:
+                self.checkpoints.save(self.checkpoint_name, {'concluida': True, 'total': len(resources), 'achados': findings})
+            return {'status': 'COMPLETA' if complete else 'PARCIAL', 'total': len(resources),
+                    'auditados': len(done), 'achados': findings, 'exposicao': exposure}
+
+
+def sweep(regions=None, sweep_id=None, remediate=SWEEP_REMEDIATE, workers=SWEEP_WORKERS_PER_REGION,
+          max_concurrency=SWEEP_MAX_CONCURRENCY, time_budget=SWEEP_TIME_BUDGET, checkpoint=SWEEP_CHECKPOINT,
+          exposure_ports=SWEEP_EXPOSURE_PORTS):
+    """Varre todas as regiões em paralelo (um pool por região, teto global de concorrência).
+    Retomável: rodar de novo com o mesmo `sweep_id` continua de onde parou."""
+    regions = regions or SWEEP_REGIONS
+    sweep_id = sweep_id or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    deadline = time.time() + time_budget
+    limiter = threading.BoundedSemaphore(max(1, max_concurrency))
+    checkpoints = CheckpointStore(checkpoint, prefix=CHECKPOINT_PREFIX)
+    table = lam.get_table()
+
+    print(f"🛰️ SENTINEL AI: Varredura completa {sweep_id} em {', '.join(regions)} "
+          f"(remediação {'ligada' if remediate else 'desligada'})...")
+    buckets = buckets_by_region(regions, limiter, workers)
+
+    def run_region(region):
+        try:
+            return region, RegionSweep(sweep_id, region, buckets[region], limiter, table, checkpoints,
+                                       workers, remediate, deadline, exposure_ports=exposure_ports).run()
+        except Exception as e:
+            print(f"❌ [{region}] Falha na varredura: {e}")
+            return region, {'status': 'FALHO', 'erro': str(e)}
+
+    with ThreadPoolExecutor(max_workers=len(regions)) as pool:
+        results = dict(pool.map(run_region, regions))
+
+    status = 'COMPLETA' if all(r['status'] == 'COMPLETA' for r in results.values()) else 'PARCIAL'
+    print(f"🏁 Varredura {sweep_id}: {status}. {json.dumps(results)}")
+    return {'id_varredura': sweep_id, 'status': status, 'regioes': results}
+
+
+def sweep_handler(event, context):
+    """Entrada agendada. O evento pode trazer 'regioes', 'id_varredura' e 'remediar'.
+    Com status PARCIAL (orçamento de tempo esgotado), a próxima execução agendada retoma do checkpoint."""
+    event = event or {}
+    time_budget = SWEEP_TIME_BUDGET
+    deadline = lam.invocation_deadline(context)
+    if deadline is not None:
+        # O orçamento configurado é só um teto: nunca passa do timeout real da função
+        time_budget = max(0.0, min(time_budget, deadline - time.time()))
+    return sweep(
+        regions=event.get('regioes'),
+        sweep_id=event.get('id_varredura'),
+        remediate=event.get('remediar', SWEEP_REMEDIATE),
+        time_budget=time_budget,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sentinel AI - Varredura completa de buckets e Security Groups")
+    parser.add_argument('--regions', help="Regiões separadas por vírgula (padrão: SENTINEL_SWEEP_REGIONS)")
+    parser.add_argument('--sweep-id', help="Identificador da varredura para retomar (padrão: data de hoje, UTC)")
+    parser.add_argument('--remediate', action='store_true', default=SWEEP_REMEDIATE, help="Remedia o que for encontrado")
+    parser.add_argument('--workers', type=int, default=SWEEP_WORKERS_PER_REGION, help="Workers por região")
+    parser.add_argument('--max-concurrency', type=int, default=SWEEP_MAX_CONCURRENCY, help="Teto global de chamadas simultâneas")
+    parser.add_argument('--time-budget', type=float, default=SWEEP_TIME_BUDGET, help="Segundos antes de parar e deixar para a retomada")
+    parser.add_argument('--checkpoint', default=SWEEP_CHECKPOINT, help="'dynamodb' ou um diretório local")
+    parser.add_argument('--exposure-ports', help="Portas do relatório de exposição, separadas por vírgula (padrão: SENTINEL_SWEEP_EXPOSURE_PORTS)")
+    args = parser.parse_args()
+
+    regions = [r.strip() for r in args.regions.split(',')] if args.regions else None
+    ports = [int(p) for p in args.exposure_ports.split(',') if p.strip()] if args.exposure_ports else SWEEP_EXPOSURE_PORTS
+    result = sweep(regions, args.sweep_id, args.remediate, args.workers, args.max_concurrency,
+                   args.time_budget, args.checkpoint, ports)
+    exit(0 if result['status'] == 'COMPLETA' else 1)
@@ -0,0 +1,197 @@
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# --- CONFIGURAÇÕES ---
+# '1' emite as métricas, '0' desliga, 'auto' (padrão) emite só dentro da Lambda (CloudWatch lê o stdout)
+METRICS_MODE = os.environ.get('SENTINEL_METRICS', 'auto').lower()
+METRICS_NAMESPACE = os.environ.get('SENTINEL_METRICS_NAMESPACE', 'SentinelAI')
+# Profiler por amostragem: SENTINEL_PROFILE é lido a cada invocação ('1' = sempre, '0.05' = 5% das invocações)
+PROFILE_INTERVAL_MS = float(os.environ.get('SENTINEL_PROFILE_INTERVAL_MS', '5'))
+PROFILE_TOP = int(os.environ.get('SENTINEL_PROFILE_TOP', '15'))
+
+_current = contextvars.ContextVar('sentinel_invocation', default=None)
+_emit_lock = threading.Lock()
+
+
+def metrics_enabled():
+    if METRICS_MODE == 'auto':
+        return 'AWS_LAMBDA_FUNCTION_NAME' in os.environ
+    return METRICS_MODE in ('1', 'true', 'on')
+
+
+def _profile_requested():
+    value = os.environ.get('SENTINEL_PROFILE', '0').lower()
+    try:
+        rate = float(value)
+    except ValueError:
+        rate = 1.0 if value in ('true', 'on') else 0.0
+    return rate > 0 and random.random() < rate
+
+
+def _emit(record):
+    # Uma linha por registro, escrita de uma vez: threads do scanner não intercalam JSON
+    line = json.dumps(record, default=str) + '\n'
+    with _emit_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def _unit(metric):
+    if metric.endswith('_ms'):
+        return 'Milliseconds'
+    if metric.endswith('_bytes'):
+        return 'Bytes'
+    return 'Count'
+
+
+class Invocation:
+    """Métricas de uma unidade de trabalho (auditoria de um recurso, análise de um template)."""
+
+    def __init__(self, name, dimensions):
+        self.name = name
+        self.dimensions = {'Funcao': name, **{k: str(v) for k, v in dimensions.items()}}
+        self.metrics = defaultdict(float)
+        self.properties = {}
+        self._lock = threading.Lock()
+
+    def add(self, metric, value):
+        with self._lock:
+            self.metrics[metric] += value
+
+    def set_property(self, name, value):
+        self.properties[name] = value
+
+    def to_emf(self):
+        """Linha no CloudWatch Embedded Metric Format: o CloudWatch extrai as métricas direto do log."""
+        with self._lock:
+            metrics = {k: round(v, 3) for k, v in sorted(self.metrics.items())}
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [list(self.dimensions)],
+                    'Metrics': [{'Name': k, 'Unit': _unit(k)} for k in metrics],
+                }],
+            },
+            **self.dimensions,
+            **metrics,
+            **self.properties,
+        }
+
+
+class SamplingProfiler:
+    """Amostra a pilha de uma thread a cada `interval_ms` (sys._current_frames), sem instrumentar o código."""
+
+    def __init__(self, thread_id, interval_ms=PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.functions = Counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < 40:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.samples += 1
+                self.functions[stack[0]] += 1
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, top=PROFILE_TOP):
+        self._stop.set()
+        self._thread.join()
+        return {
+            'amostras': self.samples,
+            'intervalo_ms': self.interval * 1000,
+            'funcoes': self.functions.most_common(top),
+            'pilhas': self.stacks.most_common(top),
+        }
+
+
+@contextmanager
+def invocation(name, **dimensions):
+    """Abre o contexto de métricas de uma invocação. Na saída emite uma linha EMF (e o perfil, se pedido)."""
+    inv = Invocation(name, dimensions)
+    token = _current.set(inv)
+    profiler = SamplingProfiler(threading.get_ident()).start() if _profile_requested() else None
+    start = time.perf_counter()
+    try:
+        yield inv
+    finally:
+        inv.add('total_ms', (time.perf_counter() - start) * 1000)
+        _current.reset(token)
+        if profiler:
+            _emit({'sentinel_profile': profiler.stop(), **inv.dimensions})
+        if metrics_enabled():
+            _emit(inv.to_emf())
+
+
+@contextmanager
+def stage(name):
+    """Soma o tempo de parede do bloco em '<name>_ms' da invocação corrente (no-op fora de uma invocação)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        inv = _current.get()
+        if inv:
+            inv.add(f"{name}_ms", (time.perf_counter() - start) * 1000)
+
+
+def incr(metric, value=1):
+    inv = _current.get()
+    if inv:
+        inv.add(metric, value)
+
+
+def set_property(name, value):
+    inv = _current.get()
+    if inv:
+        inv.set_property(name, value)
+
+
+def bind(func):
+    """Leva a invocação corrente para `func` quando ela roda em outra thread (ThreadPoolExecutor)."""
+    inv = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(inv)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def _after_aws_call(http_response=None, parsed=None, model=None, **kwargs):
+    incr('aws_chamadas')
+    if model is not None:
+        incr(f"aws_{model.service_model.service_name}")
+    retries = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    if retries:
+        incr('aws_retries', retries)
+
+
+def watch_boto3(client):
+    """Conta chamadas e retries de um cliente boto3 na invocação corrente."""
+    client.meta.events.register('after-call', _after_aws_call)
+    return client
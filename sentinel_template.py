@@ -0,0 +1,137 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import sentinel_telemetry as telemetry
+
+# --- CONFIGURAÇÕES ---
+# Máximo de recursos por grupo enviado à IA (limita tamanho do prompt e latência)
+MAX_GROUP_SIZE = int(os.environ.get('SENTINEL_TEMPLATE_GROUP_SIZE', '10'))
+# Templates com até este número de recursos continuam indo inteiros em uma única chamada
+CHUNK_MIN_RESOURCES = int(os.environ.get('SENTINEL_TEMPLATE_CHUNK_MIN', '8'))
+GROUP_WORKERS = int(os.environ.get('SENTINEL_TEMPLATE_WORKERS', '4'))
+
+# Seções do template que dão contexto aos recursos e seguem junto em cada grupo
+CONTEXT_SECTIONS = ('AWSTemplateFormatVersion', 'Parameters', 'Conditions', 'Mappings')
+
+
+def _find_refs(node, names, refs):
+    """Coleta recursivamente os recursos referenciados via Ref, Fn::GetAtt, Fn::Sub (Fn::Join e afins caem na recursão)."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'Ref' and isinstance(value, str) and value in names:
+                refs.add(value)
+            elif key == 'Fn::GetAtt':
+                target = value[0] if isinstance(value, list) and value else str(value).split('.')[0]
+                if target in names:
+                    refs.add(target)
+            elif key == 'Fn::Sub':
+                template = value[0] if isinstance(value, list) and value else value
+                if isinstance(template, str):
+                    for name in names:
+                        if f"${{{name}}}" in template or f"${{{name}." in template:
+                            refs.add(name)
+            _find_refs(value, names, refs)
+    elif isinstance(node, list):
+        for item in node:
+            _find_refs(item, names, refs)
+    return refs
+
+
+def build_dependency_graph(resources):
+    """Grafo não-direcionado {recurso: {vizinhos}} a partir das referências e do DependsOn."""
+    names = set(resources)
+    graph = {name: set() for name in names}
+    for name, resource in resources.items():
+        if not isinstance(resource, dict):
+            continue
+        refs = _find_refs(resource.get('Properties', {}), names, set())
+        depends_on = resource.get('DependsOn', [])
+        refs.update(d for d in ([depends_on] if isinstance(depends_on, str) else depends_on) if d in names)
+        refs.discard(name)
+        for ref in refs:
+            graph[name].add(ref)
+            graph[ref].add(name)
+    return graph
+
+
+def group_resources(resources, max_size=MAX_GROUP_SIZE):
+    """Divide os recursos em componentes conexos; componentes grandes são fatiados em ordem BFS
+    (mantém vizinhos diretos no mesmo pedaço sempre que possível)."""
+    graph = build_dependency_graph(resources)
+    seen = set()
+    groups = []
+    # Ordem determinística: a mesma entrada sempre gera os mesmos grupos (e as mesmas chaves de cache)
+    for start in sorted(graph):
+        if start in seen:
+            continue
+        seen.add(start)
+        component, queue = [], [start]
+        while queue:
+            node = queue.pop(0)
+            component.append(node)
+            for neighbor in sorted(graph[node]):
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    queue.append(neighbor)
+        groups.extend(component[i:i + max_size] for i in range(0, len(component), max_size))
+    return groups
+
+
+def build_sub_template(template, group):
+    sub = {section: template[section] for section in CONTEXT_SECTIONS if section in template}
+    sub['Resources'] = {name: template['Resources'][name] for name in group}
+    return sub
+
+
+def should_chunk(template):
+    resources = template.get('Resources') if isinstance(template, dict) else None
+    return isinstance(resources, dict) and len(resources) > CHUNK_MIN_RESOURCES
+
+
+def merge_group_results(groups, results):
+    """Consolida os vereditos por grupo em um relatório por recurso + veredito geral do arquivo."""
+    por_recurso = {}
+    reprovados, erros = [], []
+    for group, res in zip(groups, results):
+        status = res.get('status', 'ERRO')
+        for name in group:
+            por_recurso[name] = {
+                'status': status,
+                'risco': res.get('risco'),
+                'detalhe': res.get('detalhe'),
+                'correcao': res.get('correcao'),
+                'grupo': group,
+            }
+        if status == 'REPROVADO':
+            reprovados.append((group, res))
+        elif status != 'APROVADO':
+            erros.append((group, status))
+
+    if reprovados:
+        status = 'REPROVADO'
+    elif erros:
+        # Sem veredito para parte do template: não dá para aprovar o arquivo inteiro
+        status = erros[0][1]
+    else:
+        status = 'APROVADO'
+
+    def _join(field):
+        return " | ".join(f"[{', '.join(g)}] {r.get(field)}" for g, r in reprovados if r.get(field)) or None
+
+    return {
+        'status': status,
+        'risco': _join('risco'),
+        'detalhe': _join('detalhe'),
+        'correcao': _join('correcao'),
+        'recursos': por_recurso,
+    }
+
+
+def analyze_template_chunked(template, analyze, workers=GROUP_WORKERS):
+    """Analisa cada grupo de recursos conectados em paralelo com `analyze(sub_template)` e mescla o resultado."""
+    groups = group_resources(template['Resources'])
+    print(f"🧩 Template dividido em {len(groups)} grupo(s) de recursos conectados.")
+    telemetry.incr('grupos', len(groups))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # bind: chamadas de LLM dos grupos contam na métrica do template
+        results = list(pool.map(telemetry.bind(lambda g: analyze(build_sub_template(template, g))), groups))
+    return merge_group_results(groups, results)
@@ -1,6 +1,5 @@
 import os
 import boto3
-import requests
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -27,16 +26,13 @@ def test_gemini():
         print("❌ GOOGLE_API_KEY não configurada no .env")
         return
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-    payload = {"contents": [{"parts": [{"text": "Reponda apenas 'OK'"}]}]}
+    # Mesmo cliente usado pela Lambda e pelo scanner (pool, timeouts, retry)
+    from sentinel_llm import get_client
     try:
-        res = requests.post(url, json=payload)
-        if res.status_code == 200:
-            print("✅ Gemini API funcional.")
-        else:
-            print(f"❌ Erro Gemini: {res.status_code} - {res.text}")
+        get_client().generate("Reponda apenas 'OK'")
+        print("✅ Gemini API funcional.")
     except Exception as e:
-        print(f"❌ Erro de conexão Gemini: {e}")
+        print(f"❌ Erro Gemini: {e}")
 
 if __name__ == "__main__":
     test_aws()